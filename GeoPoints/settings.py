@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mainapp.profiling.RoutingProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'GeoPoints.urls'
@@ -88,6 +89,20 @@ DATABASES = {
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Кэш результатов маршрутизации: MAXSIZE - размер LRU в памяти процесса,
+# BACKEND - псевдоним из CACHES для общего второго уровня (None - только память процесса)
+ROUTE_CACHE = {
+    'MAXSIZE': 1024,
+    'BACKEND': None,
+    'TIMEOUT': 60 * 60,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -128,4 +143,50 @@ USE_TZ = True
 STATIC_URL = '/static/'
 GDAL_LIBRARY_PATH = r'C:\OSGeo4W64\bin\gdal300.dll'
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-JSON_LOCAL_PATH = os.path.join(BASE_DIR, 'json_data', "json_data.json")
\ No newline at end of file
+JSON_LOCAL_PATH = os.path.join(BASE_DIR, 'json_data', "json_data.json")
+
+# Обратное геокодирование в loaddata: адрес сервиса, число одновременных запросов,
+# запросов в секунду и файл постоянного кэша адресов
+GEOCODER = {
+    'URL': 'https://geocode-maps.yandex.ru/1.x/',
+    'CONCURRENCY': 8,
+    'RATE': 20,
+    'CACHE_PATH': os.path.join(BASE_DIR, 'json_data', 'geocode_cache.sqlite3'),
+}
+# Маршрутизация: движок поиска по умолчанию (astar, ch или tiles) и каталог файлов иерархий сжатия (build_ch)
+ROUTING_ENGINE = 'astar'
+ROUTING_CH_DIR = os.path.join(BASE_DIR, 'ch_data')
+# Асинхронные представления маршрутов (api/async/...): число потоков вычисления и максимум
+# различных маршрутов в работе, сверх которого отвечаем 503
+ROUTING_ASYNC = {
+    'WORKERS': 4,
+    'MAX_PENDING': 64,
+}
+# Бинарный снимок графа (export_graph), открываемый воркерами через numpy.memmap
+GRAPH_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'graph_data', 'graph.bin')
+# Число процессов для матриц маршрутов (api/routes/matrix); None - по числу ядер, 1 - без пула процессов
+ROUTING_MATRIX_WORKERS = None
+# Максимальный размер матрицы маршрутов (число источников x число целей), сверх которого отвечаем 400
+ROUTING_MATRIX_MAX_CELLS = 10000
+# Профилирование запросов (заголовок Server-Timing и api/metrics); False - middleware отключается целиком
+ROUTING_PROFILING = True
+# Журнал изменений графа (mainapp.changes): как часто воркер проверяет новые записи (секунды,
+# 0 - при каждом обращении к графу), срок временного переопределения линии по умолчанию (секунды)
+# и срок хранения записей журнала для prune_graph_changes (секунды; воркер, не проверявший журнал
+# дольше, загружает граф заново)
+ROUTING_GRAPH_SYNC_INTERVAL = 1.0
+ROUTING_OVERRIDE_TTL = 3600
+ROUTING_GRAPH_CHANGES_RETENTION = 24 * 3600
+# Максимальный размер страницы списка точек (api/points/?limit=)
+POINTS_MAX_LIMIT = 10000
+# Максимальное число координат в одном запросе пакетной привязки (api/snap)
+SNAP_MAX_COORDINATES = 10000
+# Поиск по тайлам (ROUTING_ENGINE = 'tiles' или ?engine=tiles): размер клетки сетки в градусах, максимум
+# тайлов в памяти процесса, каталог графа граничных точек (build_tile_overlay) и минимальное расстояние
+# между тайлами старта и цели (в клетках), с которого используется этот граф
+ROUTING_TILES = {
+    'SIZE': 0.05,
+    'BUDGET': 64,
+    'OVERLAY_DIR': os.path.join(BASE_DIR, 'graph_data'),
+    'OVERLAY_DISTANCE': 2,
+}
@@ -0,0 +1,94 @@
+"""Размер и время кодирования ответа маршрута в разных форматах (mainapp.formats).
+
+Для длинных маршрутов на синтетической сети ответ кодируется как в представлениях маршрутов:
+GeoJSON (полная точность, precision=5, simplify), encoded polyline и MessagePack.
+Для каждого варианта - средний размер ответа в байтах, p50/p95 времени кодирования и число вершин линии.
+
+Использование:
+    python -m benchmarks.formats --kind road grid --nodes 10000 100000 --queries 20 --simplify 0.05"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.generate import GENERATORS, generate_graph
+from benchmarks.run import configure_django, percentiles
+from mainapp.algorithm import find_path
+
+
+def variants(simplify):
+    """Варианты ответа: название -> (renderer, precision, simplify)"""
+    from mainapp.formats import MessagePackRenderer, PolylineRenderer, RouteRenderer
+
+    return {'json': (RouteRenderer(), None, None), 'json_precision5': (RouteRenderer(), 5, None),
+            'json_simplify': (RouteRenderer(), 5, simplify), 'polyline': (PolylineRenderer(), None, None),
+            'polyline_simplify': (PolylineRenderer(), None, simplify),
+            'msgpack': (MessagePackRenderer(), None, None), 'msgpack_simplify': (MessagePackRenderer(), 5, simplify)}
+
+
+def long_routes(graph, queries, seed):
+    """Маршруты между точками у противоположных краев сети (самые длинные ответы)"""
+    rng = np.random.default_rng(seed)
+    west = np.flatnonzero(graph.lon <= np.nanpercentile(graph.lon, 5))
+    east = np.flatnonzero(graph.lon >= np.nanpercentile(graph.lon, 95))
+    routes = []
+    for start, end in zip(rng.choice(west, queries), rng.choice(east, queries)):
+        result = find_path(graph, int(graph.ids[start]), int(graph.ids[end]), 'by_distance')
+        if result['path'][-1] == graph.ids[end]:
+            routes.append(result)
+    return routes
+
+
+def bench_network(kind, nodes, queries, simplify, seed):
+    from mainapp.formats import shape_coordinates
+    from mainapp.geojson import feature_collection, route_feature
+
+    graph = generate_graph(kind, nodes, seed)
+    graph.landmarks = {}
+    answers = [{"answer": feature_collection(route_feature(graph, result, 'Shortest path'))}
+               for result in long_routes(graph, queries, seed)]
+    report = {'kind': kind, 'nodes': graph.node_count, 'routes': len(answers),
+              'path_nodes': round(float(np.mean([len(answer['answer']['features'][0]['properties']['path'])
+                                                 for answer in answers])), 1)}
+    for name, (renderer, precision, tolerance) in variants(simplify).items():
+        options = {'precision': precision, 'simplify': tolerance}
+        latencies, sizes = [], []
+        for answer in answers:
+            started = time.perf_counter()
+            content = renderer.render(answer, renderer.media_type, options)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(len(content))
+        vertices = [len(shape_coordinates(answer['answer']['features'][0]['geometry']['coordinates'],
+                                          precision, tolerance)) for answer in answers]
+        report[name] = dict(percentiles(latencies), bytes=round(float(np.mean(sizes))),
+                            vertices=round(float(np.mean(vertices)), 1))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Размер и время кодирования ответа маршрута по форматам')
+    parser.add_argument('--kind', nargs='+', choices=sorted(GENERATORS), default=['grid', 'road'])
+    parser.add_argument('--nodes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--simplify', type=float, default=0.05, help='Допуск упрощения линии в км')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    args = parser.parse_args()
+    configure_django()
+    runs = []
+    for kind in args.kind:
+        for nodes in args.nodes:
+            run = bench_network(kind, nodes, args.queries, args.simplify, args.seed)
+            runs.append(run)
+            print(f"{kind:>9} {run['nodes']:>8}: {run['routes']} routes, {run['path_nodes']} points per route")
+            for name in variants(args.simplify):
+                print(f"{name:>20}: {run[name]['bytes']:>9} bytes, p50 {run[name]['p50_ms']:.3f} ms, "
+                      f"{run[name]['vertices']} vertices")
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'runs': runs}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Генератор воспроизводимых синтетических сетей в формате loaddata:
+{"points": [{"obj_id", "lon", "lat", "score"}], "lines": [{"from_obj", "to_obj"}]}.
+
+Виды сетей:
+    grid        - регулярная решетка с соседями по горизонтали и вертикали
+    geometric   - случайный геометрический граф (точки, ближе радиуса, соединены)
+    road        - "дорожная" сеть: решетка со смещенными узлами, удаленными ребрами
+                  и редкими длинными магистралями
+
+Использование:
+    python -m benchmarks.generate --kind road --nodes 100000 --output road_100k.json"""
+import argparse
+import json
+
+import numpy as np
+
+from mainapp.graph import RoutingGraph
+
+# центр и размер области - как у тестовых данных json_data.json
+CENTER_LON, CENTER_LAT = 39.7, 47.23
+SPAN = 0.5
+
+
+def _side(nodes):
+    return max(2, int(round(np.sqrt(nodes))))
+
+
+def _grid_edges(side, rng=None, keep=1.0):
+    index = np.arange(side * side).reshape(side, side)
+    edges = np.concatenate([np.column_stack((index[:, :-1].ravel(), index[:, 1:].ravel())),
+                            np.column_stack((index[:-1, :].ravel(), index[1:, :].ravel()))])
+    if keep < 1.0:
+        edges = edges[rng.random(len(edges)) < keep]
+    return edges
+
+
+def _grid_coordinates(side, rng=None, jitter=0.0):
+    step = SPAN / side
+    rows, cols = np.divmod(np.arange(side * side), side)
+    lon = CENTER_LON - SPAN / 2 + cols * step
+    lat = CENTER_LAT - SPAN / 2 + rows * step
+    if jitter:
+        lon = lon + rng.uniform(-jitter, jitter, len(lon)) * step
+        lat = lat + rng.uniform(-jitter, jitter, len(lat)) * step
+    return lon, lat
+
+
+def grid(nodes, rng):
+    side = _side(nodes)
+    lon, lat = _grid_coordinates(side)
+    return lon, lat, _grid_edges(side)
+
+
+def geometric(nodes, rng, degree=6):
+    """Случайный геометрический граф со средней степенью около degree.
+    Пары ищутся по ячейкам размером с радиус соединения (без перебора всех пар)"""
+    lon = rng.uniform(CENTER_LON - SPAN / 2, CENTER_LON + SPAN / 2, nodes)
+    lat = rng.uniform(CENTER_LAT - SPAN / 2, CENTER_LAT + SPAN / 2, nodes)
+    radius = SPAN * np.sqrt(degree / (np.pi * nodes))
+    cells_per_side = max(1, int(SPAN / radius))
+    cx = np.minimum(((lon - lon.min()) / radius).astype(np.int64), cells_per_side)
+    cy = np.minimum(((lat - lat.min()) / radius).astype(np.int64), cells_per_side)
+    width = cells_per_side + 1
+    cell = cy * width + cx
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=width * width)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    capacity = counts.max()
+    # таблица "ячейка x слот" с номерами точек (-1 - пусто)
+    table = np.full((width * width, capacity), -1, dtype=np.int64)
+    slots = np.arange(nodes) - starts[cell[order]]
+    table[cell[order], slots] = order
+    pairs = []
+    all_cells = np.arange(width * width)
+    for dx, dy in ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)):
+        x, y = all_cells % width + dx, all_cells // width + dy
+        valid = (x >= 0) & (x < width) & (y < width)
+        here, there = all_cells[valid], (y * width + x)[valid]
+        for i in range(capacity):
+            a = table[here, i]
+            for j in range(capacity):
+                if (dx, dy) == (0, 0) and j <= i:
+                    continue
+                b = table[there, j]
+                mask = (a >= 0) & (b >= 0)
+                a_, b_ = a[mask], b[mask]
+                close = np.hypot(lon[a_] - lon[b_], lat[a_] - lat[b_]) <= radius
+                pairs.append(np.column_stack((a_[close], b_[close])))
+    return lon, lat, np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+
+def road(nodes, rng, keep=0.8, highway_every=16):
+    side = _side(nodes)
+    lon, lat = _grid_coordinates(side, rng, jitter=0.35)
+    edges = _grid_edges(side, rng, keep=keep)
+    # магистрали: каждая highway_every-я строка и столбец связаны длинными ребрами через highway_every узлов
+    index = np.arange(side * side).reshape(side, side)
+    lines = index[::highway_every, ::highway_every]
+    highways = [np.column_stack((lines[:, :-1].ravel(), lines[:, 1:].ravel())),
+                np.column_stack((lines[:-1, :].ravel(), lines[1:, :].ravel()))]
+    return lon, lat, np.concatenate([edges] + highways)
+
+
+GENERATORS = {'grid': grid, 'geometric': geometric, 'road': road}
+
+
+def generate_arrays(kind, nodes, seed=0):
+    """Массивы сети: id точек, lon, lat, score и пары (from_id, to_id)"""
+    rng = np.random.default_rng(seed)
+    lon, lat, edges = GENERATORS[kind](nodes, rng)
+    ids = np.arange(1, len(lon) + 1, dtype=np.int64)
+    score = rng.integers(1, 200, len(lon))
+    return ids, lon, lat, score, edges + 1
+
+
+def generate_graph(kind, nodes, seed=0):
+    """Граф маршрутизации для синтетической сети (без БД)"""
+    ids, lon, lat, score, edges = generate_arrays(kind, nodes, seed)
+    return RoutingGraph.from_edges(ids, lon, lat, score, edges[:, 0], edges[:, 1])
+
+
+def generate_document(kind, nodes, seed=0):
+    """Синтетическая сеть в формате документа loaddata"""
+    ids, lon, lat, score, edges = generate_arrays(kind, nodes, seed)
+    return {'points': [{'obj_id': int(i), 'lon': round(float(x), 6), 'lat': round(float(y), 6), 'score': int(s)}
+                       for i, x, y, s in zip(ids, lon, lat, score)],
+            'lines': [{'from_obj': int(a), 'to_obj': int(b)} for a, b in edges]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетическая сеть в формате loaddata')
+    parser.add_argument('--kind', choices=sorted(GENERATORS), default='road')
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    with open(args.output, 'w') as outfile:
+        json.dump(generate_document(args.kind, args.nodes, args.seed), outfile)
+
+
+if __name__ == '__main__':
+    main()
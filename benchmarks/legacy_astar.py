@@ -0,0 +1,88 @@
+"""Прежняя реализация поиска A* (узел - список из 8 элементов, словарь просмотренных узлов,
+копирование узла при уменьшении стоимости). Сохранена только для сравнения в benchmarks.search"""
+from heapq import heappush, heappop
+from sys import maxsize
+
+from mainapp.algorithm import lower_bounds
+
+F, H, NUM, G, POS, OPEN, VALID, PARENT = range(8)
+
+
+def a_star(start_pos, neighbors, goal_point, start_cost, heuristic, search_stats, limit=maxsize):
+    nums = iter(range(maxsize))
+    start_h = heuristic(start_pos)
+    start_node = [start_cost + start_h, start_h, next(nums), start_cost, start_pos, True,
+                  True, None]
+    watched_nodes = {start_pos: start_node}
+    nodes_heap = [start_node]
+    best = start_node
+    while nodes_heap:
+        current = heappop(nodes_heap)
+        current[OPEN] = False
+        search_stats['nodes_expanded'] += 1
+        if current[POS] == goal_point:
+            best = current
+            break
+        for i, step_cost in neighbors(current[POS]):
+            new_neighbor_g = current[G] + step_cost
+            neighbor = watched_nodes.get(i)
+            if neighbor is None:
+                if len(watched_nodes) >= limit:
+                    continue
+                neighbor_h = heuristic(i)
+                neighbor = [new_neighbor_g + neighbor_h, neighbor_h, next(nums),
+                            new_neighbor_g, i, True, True, current[POS]]
+                watched_nodes[i] = neighbor
+                heappush(nodes_heap, neighbor)
+                if neighbor_h < best[H]:
+                    best = neighbor
+            elif new_neighbor_g < neighbor[G]:
+                if neighbor[OPEN]:
+                    neighbor[VALID] = False
+                    watched_nodes[i] = neighbor = neighbor[:]
+                    neighbor[F] = new_neighbor_g + neighbor[H]
+                    neighbor[NUM] = next(nums)
+                    neighbor[G] = new_neighbor_g
+                    neighbor[VALID] = True
+                    neighbor[PARENT] = current[POS]
+                    heappush(nodes_heap, neighbor)
+                else:
+                    neighbor[F] = new_neighbor_g + neighbor[H]
+                    neighbor[G] = new_neighbor_g
+                    neighbor[PARENT] = current[POS]
+                    neighbor[OPEN] = True
+                    heappush(nodes_heap, neighbor)
+        while nodes_heap and not nodes_heap[0][VALID]:
+            heappop(nodes_heap)
+    path = []
+    current = best
+    while current[PARENT] is not None:
+        path.append(current[POS])
+        current = watched_nodes[current[PARENT]]
+    path.append(start_pos)
+    path.reverse()
+    return path
+
+
+def find_path(graph, start_point, end_point, eval_type='by_distance'):
+    """Поиск пути прежней реализацией (результат - как у mainapp.algorithm.find_path без иерархий)"""
+    goal_node = graph.index_of(end_point)
+    offsets = graph.offsets
+    targets = graph.targets
+    weights = graph.edge_weights(eval_type)
+    search_stats = {'nodes_expanded': 0}
+
+    def open_neighbors(node):
+        lo, hi = offsets[node], offsets[node + 1]
+        return zip(targets[lo:hi].tolist(), weights[lo:hi].tolist())
+
+    heuristic_values = lower_bounds(graph, eval_type, goal_node, (graph.landmarks or {}).get(eval_type)).tolist()
+    path = a_star(graph.index_of(start_point), open_neighbors, goal_node, 0, heuristic_values.__getitem__,
+                  search_stats)
+    result = {'start_point': start_point, 'end_point': end_point, 'path': graph.ids[path].tolist(),
+              'nodes_expanded': search_stats['nodes_expanded']}
+    if eval_type == 'by_distance':
+        result['path_in_km'] = round(graph.path_km(path), 2)
+    else:
+        result['path_in_score_points'] = round(graph.path_score(path), 2)
+    return result
@@ -0,0 +1,160 @@
+"""Бенчмарк движка маршрутизации на синтетических сетях (без БД).
+
+Замеряет загрузку графа, одиночные запросы A* (by_distance и by_score), пакетные запросы
+(матрица), сериализацию ответа в GeoJSON; считает p50/p95/p99, число раскрытых узлов и пиковую
+память. Результаты пишутся в JSON; с --compare сравниваются с предыдущим запуском.
+
+Использование:
+    python -m benchmarks.run --kind grid road --nodes 1000 10000 100000 --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json --threshold 1.2"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.generate import GENERATORS, generate_arrays
+from mainapp.algorithm import find_path
+from mainapp.graph import RoutingGraph
+from mainapp.matrix import route_matrix
+
+EVAL_TYPES = ('by_distance', 'by_score')
+
+
+def configure_django():
+    """Минимальные настройки Django для сериализации ответов вне проекта"""
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure(DEFAULT_CHARSET='utf-8')
+
+
+def percentiles(samples):
+    """Сводка по замерам в миллисекундах"""
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {'count': len(values), 'mean_ms': round(float(values.mean()), 4),
+            'p50_ms': round(float(np.percentile(values, 50)), 4),
+            'p95_ms': round(float(np.percentile(values, 95)), 4),
+            'p99_ms': round(float(np.percentile(values, 99)), 4)}
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def peak_memory(func, *args, **kwargs):
+    """Пиковый объем памяти (МБ), выделенной Python и numpy при вызове func"""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+    finally:
+        tracemalloc.stop()
+
+
+def query_pairs(graph, count, seed):
+    rng = np.random.default_rng(seed)
+    return rng.choice(graph.ids, size=(count, 2)).tolist()
+
+
+def bench_network(kind, nodes, queries, matrix_size, seed):
+    from mainapp.geojson import json_response, feature_collection, route_feature
+
+    ids, lon, lat, score, edges = generate_arrays(kind, nodes, seed)
+    load_time, graph = timed(RoutingGraph.from_edges, ids, lon, lat, score, edges[:, 0], edges[:, 1])
+    graph.landmarks = {}
+    pairs = query_pairs(graph, queries, seed)
+    report = {'kind': kind, 'nodes': graph.node_count, 'lines': graph.edge_count // 2,
+              'graph_load': {'seconds': round(load_time, 4),
+                             'peak_memory_mb': peak_memory(RoutingGraph.from_edges, ids, lon, lat, score,
+                                                           edges[:, 0], edges[:, 1])},
+              'single_pair': {}}
+    results = {}
+    for eval_type in EVAL_TYPES:
+        latencies, expanded = [], []
+        for start, end in pairs:
+            seconds, result = timed(find_path, graph, start, end, eval_type)
+            latencies.append(seconds)
+            expanded.append(result['nodes_expanded'])
+            results[eval_type] = result
+        report['single_pair'][eval_type] = dict(
+            percentiles(latencies), nodes_expanded_mean=round(float(np.mean(expanded)), 1),
+            nodes_expanded_max=int(np.max(expanded)),
+            peak_memory_mb=peak_memory(find_path, graph, pairs[0][0], pairs[0][1], eval_type))
+
+    sources = [start for start, _ in pairs[:matrix_size]]
+    targets = [end for _, end in pairs[:matrix_size]]
+    matrix_time, _ = timed(route_matrix, graph, sources, targets, 'by_distance', workers=1)
+    report['matrix'] = {'sources': len(sources), 'targets': len(targets), 'seconds': round(matrix_time, 4),
+                        'per_source_ms': round(matrix_time / max(1, len(sources)) * 1000, 4)}
+
+    serialise = []
+    for _ in range(max(1, queries // 4)):
+        seconds, response = timed(lambda: json_response({"answer": feature_collection(
+            route_feature(graph, results['by_distance'], 'Shortest path'))}))
+        serialise.append(seconds)
+    report['serialise'] = dict(percentiles(serialise), bytes=len(response.content),
+                               path_nodes=len(results['by_distance']['path']))
+    return report
+
+
+def compare(current, baseline, threshold):
+    """Сравнение с предыдущим запуском: список регрессий p95 (во сколько раз медленнее)"""
+    previous = {(run['kind'], run['nodes']): run for run in baseline['runs']}
+    regressions = []
+    for run in current['runs']:
+        old = previous.get((run['kind'], run['nodes']))
+        if old is None:
+            continue
+        for eval_type in EVAL_TYPES:
+            new_p95 = run['single_pair'][eval_type]['p95_ms']
+            old_p95 = old['single_pair'][eval_type]['p95_ms']
+            if old_p95 and new_p95 / old_p95 > threshold:
+                regressions.append(f"{run['kind']}/{run['nodes']}/{eval_type}: p95 {old_p95} -> {new_p95} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк движка маршрутизации')
+    parser.add_argument('--kind', nargs='+', choices=sorted(GENERATORS), default=['grid', 'geometric', 'road'])
+    parser.add_argument('--nodes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=50, help='Число случайных пар на сеть')
+    parser.add_argument('--matrix', type=int, default=10, help='Размер матрицы N x N')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='Файл JSON для результатов')
+    parser.add_argument('--compare', help='Файл результатов предыдущего запуска')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Допустимое замедление p95 относительно предыдущего запуска')
+    args = parser.parse_args()
+    configure_django()
+
+    report = {'meta': {'python': platform.python_version(), 'numpy': np.__version__,
+                       'machine': platform.machine(), 'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'seed': args.seed, 'queries': args.queries},
+              'runs': []}
+    for kind in args.kind:
+        for nodes in args.nodes:
+            run = bench_network(kind, nodes, args.queries, args.matrix, args.seed)
+            report['runs'].append(run)
+            print(f"{kind:>9} {run['nodes']:>8} nodes: load {run['graph_load']['seconds']:.3f}s, "
+                  f"distance p95 {run['single_pair']['by_distance']['p95_ms']:.2f}ms, "
+                  f"score p95 {run['single_pair']['by_score']['p95_ms']:.2f}ms")
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(report, json.load(infile), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
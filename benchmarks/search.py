@@ -0,0 +1,97 @@
+"""Сравнение ядра поиска mainapp.search с прежней реализацией A* (benchmarks.legacy_astar).
+
+Для каждой сети и способа вычисления замеряются p50/p95 времени запроса, пиковая память,
+выделенная за запрос (tracemalloc), и число сборок мусора поколения 0 на серию запросов
+(чем больше временных объектов создает поиск, тем чаще срабатывает сборщик).
+
+Использование:
+    python -m benchmarks.search --kind road grid --nodes 10000 100000 --output search.json"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import legacy_astar
+from benchmarks.generate import GENERATORS, generate_graph
+from benchmarks.run import EVAL_TYPES, percentiles, query_pairs
+from mainapp.algorithm import find_path
+
+IMPLEMENTATIONS = {'legacy': legacy_astar.find_path, 'array': find_path}
+
+
+def gen0_collections():
+    return gc.get_stats()[0]['collections']
+
+
+def peak_per_query(func, graph, pairs, eval_type):
+    """Средний пик памяти запроса (КБ); первый запрос прогревает кэши графа и состояния поиска"""
+    func(graph, pairs[0][0], pairs[0][1], eval_type)
+    peaks = []
+    for start, end in pairs:
+        tracemalloc.start()
+        try:
+            func(graph, start, end, eval_type)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        finally:
+            tracemalloc.stop()
+    return round(float(np.mean(peaks)), 1)
+
+
+def bench_implementation(func, graph, pairs, eval_type):
+    func(graph, pairs[0][0], pairs[0][1], eval_type)
+    latencies, results = [], []
+    collections = gen0_collections()
+    for start, end in pairs:
+        started = time.perf_counter()
+        results.append(func(graph, start, end, eval_type))
+        latencies.append(time.perf_counter() - started)
+    report = dict(percentiles(latencies), gc_gen0=gen0_collections() - collections,
+                  peak_kb=peak_per_query(func, graph, pairs[:max(1, len(pairs) // 5)], eval_type))
+    return report, results
+
+
+def bench_network(kind, nodes, queries, seed):
+    graph = generate_graph(kind, nodes, seed)
+    graph.landmarks = {}
+    pairs = query_pairs(graph, queries, seed)
+    report = {'kind': kind, 'nodes': graph.node_count}
+    for eval_type in EVAL_TYPES:
+        report[eval_type] = {}
+        answers = {}
+        for name, func in IMPLEMENTATIONS.items():
+            report[eval_type][name], answers[name] = bench_implementation(func, graph, pairs, eval_type)
+        cost = 'path_in_km' if eval_type == 'by_distance' else 'path_in_score_points'
+        report[eval_type]['mismatches'] = sum(old[cost] != new[cost]
+                                              for old, new in zip(answers['legacy'], answers['array']))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение ядра поиска с прежней реализацией A*')
+    parser.add_argument('--kind', nargs='+', choices=sorted(GENERATORS), default=['grid', 'road'])
+    parser.add_argument('--nodes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    args = parser.parse_args()
+
+    runs = []
+    for kind in args.kind:
+        for nodes in args.nodes:
+            run = bench_network(kind, nodes, args.queries, args.seed)
+            runs.append(run)
+            for eval_type in EVAL_TYPES:
+                old, new = run[eval_type]['legacy'], run[eval_type]['array']
+                print(f"{kind:>9} {run['nodes']:>8} {eval_type:>11}: p50 {old['p50_ms']:.2f} -> {new['p50_ms']:.2f} ms, "
+                      f"peak {old['peak_kb']:.0f} -> {new['peak_kb']:.0f} KB, "
+                      f"gc gen0 {old['gc_gen0']} -> {new['gc_gen0']}, mismatches {run[eval_type]['mismatches']}")
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'runs': runs}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Поиск по тайлам (mainapp.tiles) в сравнении с поиском по графу целиком.
+
+Тайлы нарезаются из сгенерированной сети (GraphTileSource), поэтому замеряется сам поиск и работа
+кэша тайлов без БД. Для каждой сети и способа вычисления: p50/p95 времени запроса по графу целиком,
+по тайлам без графа граничных точек и с ним, число загрузок тайлов на запрос и число запросов,
+стоимость маршрута в которых отличается от поиска по графу целиком (должно быть 0).
+
+Использование:
+    python -m benchmarks.tiles --kind road grid --nodes 10000 100000 --size 0.05 --budget 64"""
+import argparse
+import json
+import time
+
+from benchmarks.generate import GENERATORS, generate_graph
+from benchmarks.run import EVAL_TYPES, percentiles, query_pairs
+from mainapp.algorithm import find_path
+from mainapp.tiles import GraphTileSource, TileRouter, build_overlay
+
+
+def bench_router(route, pairs, eval_type):
+    latencies, results = [], []
+    for start, end in pairs:
+        started = time.perf_counter()
+        results.append(route(start, end, eval_type))
+        latencies.append(time.perf_counter() - started)
+    return percentiles(latencies), results
+
+
+def bench_network(kind, nodes, queries, size, budget, seed):
+    graph = generate_graph(kind, nodes, seed)
+    graph.landmarks = {}
+    pairs = query_pairs(graph, queries, seed)
+    source = GraphTileSource(graph, size)
+    started = time.perf_counter()
+    overlay = build_overlay(source)
+    report = {'kind': kind, 'nodes': graph.node_count, 'tiles': len(source.keys()),
+              'overlay_points': len(overlay.ids), 'overlay_build_s': round(time.perf_counter() - started, 3)}
+    for eval_type in EVAL_TYPES:
+        cost = 'path_in_km' if eval_type == 'by_distance' else 'path_in_score_points'
+        report[eval_type] = {}
+        report[eval_type]['full'], expected = bench_router(
+            lambda start, end, metric: find_path(graph, start, end, metric), pairs, eval_type)
+        for name, router_overlay in (('tiles', None), ('overlay', overlay)):
+            router = TileRouter(source, budget=budget, overlay=router_overlay)
+            timings, results = bench_router(router.route, pairs, eval_type)
+            report[eval_type][name] = dict(timings, tile_loads=round(router.loads / len(pairs), 2),
+                                           mismatches=sum(old[cost] != new[cost]
+                                                          for old, new in zip(expected, results)))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск по тайлам в сравнении с графом целиком')
+    parser.add_argument('--kind', nargs='+', choices=sorted(GENERATORS), default=['grid', 'road'])
+    parser.add_argument('--nodes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--size', type=float, default=0.05, help='Размер клетки сетки в градусах')
+    parser.add_argument('--budget', type=int, default=64, help='Максимум тайлов в памяти')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    args = parser.parse_args()
+    runs = []
+    for kind in args.kind:
+        for nodes in args.nodes:
+            run = bench_network(kind, nodes, args.queries, args.size, args.budget, args.seed)
+            runs.append(run)
+            for eval_type in EVAL_TYPES:
+                full, tiles, overlay = (run[eval_type][name] for name in ('full', 'tiles', 'overlay'))
+                print(f"{kind:>9} {run['nodes']:>8} {eval_type:>11}: p50 full {full['p50_ms']:.2f}, "
+                      f"tiles {tiles['p50_ms']:.2f} ({tiles['tile_loads']} loads), "
+                      f"overlay {overlay['p50_ms']:.2f} ({overlay['tile_loads']} loads) ms, "
+                      f"mismatches {tiles['mismatches']}/{overlay['mismatches']}")
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'runs': runs}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
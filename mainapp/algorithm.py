@@ -1,147 +1,122 @@
-from heapq import heappush, heappop
-from sys import maxsize
-import collections
+import numpy as np
 
-# инициализация именований индексов для значений узлов
-# Представление каждого узла как list, упорядочивая их в куче по по формуле
-# F = стартовая стоимость (G) + значение эвристики для текущего узла (H)
-# Чем меньше это значение - тем приоритетней точка (узел)
-# Узлы в heap упорядочены по значению F. В случае конфликта
-# одинаковых значений F упорядочивание будет определено по NUM
-# т.к. в куче кортежи сравниваются поэлементно слева направо.
-F, H, NUM, G, POS, OPEN, VALID, PARENT = range(8)
+from mainapp.graph import get_graph
+from mainapp.profiling import phase, count_search
+from mainapp.search import get_search_space, search
 
 
-def best_path_by(start_point, end_point, line_model, point_model, eval_type='by_distance'):
+def lower_bounds(graph, eval_type, goal, landmark_table=None):
+    """Допустимая (не завышающая) эвристика до узла goal для всех узлов графа.
+    by_distance - расстояние по прямой, by_score - score узла + score цели
+    (любой путь из v в goal содержит хотя бы одно ребро v-u стоимостью score[v] + score[u]).
+    Если есть таблица ориентиров, берется максимум с оценкой ALT"""
+    if eval_type == 'by_distance':
+        bounds = graph.distance_to(goal)
+    elif eval_type == 'by_score':
+        bounds = graph.score + graph.score[goal]
+        bounds[goal] = 0
+    else:
+        raise ValueError(f'Unknown eval_type {eval_type!r}')
+    if landmark_table is not None and len(landmark_table):
+        from mainapp.landmarks import alt_heuristic
+
+        bounds = np.maximum(bounds, alt_heuristic(landmark_table, goal))
+    return bounds
+
+
+def dijkstra(graph, source, weights):
+    """Кратчайшие расстояния от узла source (индекс) до всех узлов графа по массиву весов ребер.
+    Возвращает float64-массив, недостижимые узлы - inf"""
+    space = get_search_space(graph.node_count)
+    search(space, graph.offsets.tolist(), graph.targets.tolist(), weights.tolist(), source)
+    return space.costs(graph.node_count)
+
+
+def routing_engine(engine=None):
+    """Движок поиска: переданный явно или settings.ROUTING_ENGINE"""
+    from django.conf import settings
+
+    return engine or getattr(settings, 'ROUTING_ENGINE', 'astar')
+
+
+def best_path_by(start_point, end_point, line_model, point_model, eval_type='by_distance', engine=None, graph=None):
     """Функция поиска кратчайшего пути между точками a & b
     Возвращает список точек (узлов), по которым был составлен маршрут
-    (используя алгоритм A*), и его общую длину
+    (используя алгоритм A*), его общую длину и число раскрытых узлов (nodes_expanded).
+    Поиск идет по общему для процесса графу (mainapp.graph) без обращений к ORM,
+    эвристика - lower_bounds (с ориентирами ALT, если они построены командой build_landmarks)
     Аргументы:
             start_point     - id стартовой точки (int)
             end_point       - id конечной точки (int)
             point_model     - Django-модель точки
             line_model     - Django-модель линии (с FK к point model - from_point & to_point)
             eval            - Способ вычисления (by_distance - поиск пути по кратчайшему расстоянию;
-                                                by_score - по минимальному количеству баллов)"""
-    depend_nodes = collections.defaultdict(list)
-    for line in line_model.objects.all():
-        n_from = line.from_point.id
-        n_to = line.to_point.id
-        depend_nodes[n_from].append(n_to)
-        depend_nodes[n_to].append(n_from)
-
-    def open_neighbors(node):
-        """Функция, возвращающая всех соседей точки (pos): function > returns list"""
-        return depend_nodes[node]
-
-    def distance_eval(a, b):
-        """Расчет дистанции между a & b в километрах"""
-        return point_model.objects.get(id=a).geom.distance(point_model.objects.get(id=b).geom) * 100
-
-    def score_eval(a, b):
-        """Расчет стоимости между a & b в баллах"""
-        return point_model.objects.get(id=a).score + point_model.objects.get(id=b).score
-
-    def heuristic_eval(pos):
-        """Расчет эвристики. Конечная точка эвристики = конечная точка пути.
-        Функция сообщает, насколько мы в данный момент близки к цели"""
-        return point_model.objects.get(id=pos).geom.distance(point_model.objects.get(id=end_point).geom) * 100
-
-    def path_length(path_list):
-        """Функция, возвращающая общую длину пути по рассчитаным astar точкам"""
-        distance = 0
-        for i in range(len(path_list)):
-            if len(path_list[i:i + 2]) == 2:
-                section = path_list[i:i + 2]
-                distance += distance_eval(section[0], section[1])
-        return distance
-
-    def path_score(path_score_list):
-        """Функция, возвращающая общую score-стоимость пути по рассчитаным astar точкам"""
-        total_score = 0
-        for point in path_score_list:
-            total_score += point_model.objects.get(id=point).score
-        return total_score
-
-    def a_star(start_pos, neighbors, goal_point, start_cost, cost, heuristic, limit=maxsize):
-        """Поиск кратчайшего пути от точки до цели.
-        Функция возвращает наиболее короткий маршрут от точки start_pos до целевой точки, включая стартовую позицию.
-        Аргументы:
-          start_pos      - Стартовая точка: int
-          neighbors(pos) - Функция, возвращающая всех соседей точки (pos): function > returns list
-          goal(pos)      - Функция, возвращающая True при достижении цели и False в противном случае
-          start_cost        - Начальная стоимость: float
-          cost(a, b)     - Функция, возвращающая стоимость перехода из точки a в точку b: float
-          heuristic(pos) - Функция, возвращающая остаточную стоимость достижения цели с текущей позиции
-                           Завышенные оценки могут привести к неоптимальным путям.
-          limit          - Максимальное число позиций для поиска
-        """
-        nums = iter(range(maxsize))
-        start_h = heuristic(start_pos)
-        start_node = [start_cost + start_h, start_h, next(nums), start_cost, start_pos, True,
-                      True, None]
-        watched_nodes = {start_pos: start_node}
-        nodes_heap = [start_node]
-        best = start_node
-        while nodes_heap:
-            current = heappop(nodes_heap)  # получаем узел с минимальной стоимостью
-                                          # (вначале это будет start_node), одновременно убирая его из nodes_heap
-            current[OPEN] = False         # делаем узел закрытым
-            if current[POS] == goal_point:
-                best = current
-                break
-            for i in neighbors(current[POS]):
-                new_neighbor_g = current[G] + cost(current[POS], i)  # полная стоимость этого соседа
-                neighbor = watched_nodes.get(i)
-                if neighbor is None:  # если мы смотрим этого соседа впервые (проверка для экономии ресурсов)
-                    if len(watched_nodes) >= limit:
-                        continue  # на случай достижения лимита 9223372036854775807 в куче продолжаем цикл
-                    neighbor_h = heuristic(i)   # считаем эвристику для этого соседа
-                    neighbor = [new_neighbor_g + neighbor_h, neighbor_h, next(nums),
-                                new_neighbor_g, i, True, True, current[POS]]
-                    watched_nodes[i] = neighbor    # добавляем посчитанный узел в просмотренные
-                    heappush(nodes_heap, neighbor)  # как открытый (i = номер узла в БД)
-                    if neighbor_h < best[H]:
-                        best = neighbor  # Эвристика нового узла меньше. Обозначили его ближайшим к цели на текущий момент.
-                elif new_neighbor_g < neighbor[G]:  # если стоимость до ранее просмотренного узла была больше, чем сейчас
-                    if neighbor[OPEN]:  # соседний узел открыт - его соседи не раскрыты
-                        neighbor[VALID] = False  # бракуем ранее просмотренный узел - FALSE
-                        watched_nodes[i] = neighbor = neighbor[:]  # взяли копию узла из кучи как neighbor
-                        #  обновляем значения узла на текущие и кладем в очередь
-                        neighbor[F] = new_neighbor_g + neighbor[H]
-                        neighbor[NUM] = next(nums)
-                        neighbor[G] = new_neighbor_g
-                        neighbor[VALID] = True
-                        neighbor[PARENT] = current[POS]
-                        heappush(nodes_heap, neighbor)
-                    else:  # соседний узел закрыт - меняем его родителя, F и G и кладем в очередь
-                        neighbor[F] = new_neighbor_g + neighbor[H]
-                        neighbor[G] = new_neighbor_g
-                        neighbor[PARENT] = current[POS]
-                        neighbor[OPEN] = True
-                        heappush(nodes_heap, neighbor)
-            while nodes_heap and not nodes_heap[0][VALID]:  # удаляем невалидные лидирующие узлы
-                heappop(nodes_heap)
-        path = []
-        # восстанавливаем путь от конечного узла до начального (current - конечный узел)
-        current = best
-        while current[PARENT] is not None:
-            path.append(current[POS])
-            current = watched_nodes[current[PARENT]]
-        path.append(start_pos)
-        path.reverse()
-        return path
+                                                by_score - по минимальному количеству баллов)
+            engine          - Движок поиска: astar, ch (иерархия сжатия, см. build_ch) или tiles
+                              (граф загружается тайлами, см. mainapp.tiles); по умолчанию
+                              settings.ROUTING_ENGINE. Если иерархия не построена для текущего графа,
+                              используется A*
+            graph           - граф, уже полученный вызывающим через get_graph (чтобы не обращаться
+                              к журналу изменений повторно за один запрос); None - получить самим"""
+    from django.conf import settings
+    from mainapp.ch import load_hierarchy
+    from mainapp.landmarks import load_landmarks
+    from mainapp.tiles import get_tile_router, uses_tiles
+
+    if uses_tiles(engine):
+        return get_tile_router(line_model, point_model).route(start_point, end_point, eval_type)
+    if graph is None:
+        graph = get_graph(line_model, point_model)
+    load_landmarks(graph)
+    hierarchy = None
+    if routing_engine(engine) == 'ch':
+        hierarchy = load_hierarchy(graph, eval_type, settings.ROUTING_CH_DIR)
+    return find_path(graph, start_point, end_point, eval_type, hierarchy=hierarchy)
+
+
+def find_path(graph, start_point, end_point, eval_type='by_distance', hierarchy=None):
+    """Поиск пути по уже загруженному графу, без обращений к БД и настройкам
+    (результат - как у best_path_by).
+    Аргументы:
+            graph           - граф маршрутизации (mainapp.graph.RoutingGraph); используются
+                              загруженные в него ориентиры ALT (graph.landmarks)
+            start_point     - id стартовой точки (int)
+            end_point       - id конечной точки (int)
+            eval_type       - Способ вычисления (by_distance / by_score)
+            hierarchy       - иерархия сжатия для eval_type (mainapp.ch) или None - поиск A*"""
+    goal_node = graph.index_of(end_point)
+    start_node = graph.index_of(start_point)
+    search_stats = {'nodes_expanded': 0, 'nodes_pushed': 0, 'stale_skipped': 0, 'peak_open': 0}
+    final_path = None
+    if hierarchy is not None:
+        with phase('search'):
+            final_path = hierarchy.shortest_path(start_node, goal_node, search_stats)
+    if final_path is None:
+        offsets, targets, weights = graph.adjacency(eval_type)
+        space = get_search_space(graph.node_count)
+        with phase('heuristic'):
+            # эвристика для всех узлов считается одним векторным проходом прямо в массив состояния поиска
+            space.heuristic_view(graph.node_count)[:] = lower_bounds(
+                graph, eval_type, goal_node, (graph.landmarks or {}).get(eval_type))
+        with phase('search'):
+            # если цель недостижима - путь до ближайшего к ней (по эвристике) достигнутого узла
+            final_path = space.path(search(space, offsets, targets, weights, start_node, (goal_node,),
+                                           heuristic=True, search_stats=search_stats))
+    count_search(search_stats)
 
     if eval_type == 'by_distance':
-        final_path = a_star(start_point, open_neighbors, end_point, 0, distance_eval, heuristic_eval)
-        path_in_km = round(path_length(final_path), 2)
+        with phase('path_cost'):
+            path_in_km = round(graph.path_measure(final_path, eval_type), 2)
         result_by_distance = {'start_point': start_point, 'end_point': end_point,
-                              'path': final_path, 'path_in_km': path_in_km}
+                              'path': graph.ids[final_path].tolist(), 'path_in_km': path_in_km,
+                              'nodes_expanded': search_stats['nodes_expanded']}
         return result_by_distance
 
     elif eval_type == 'by_score':
-        final_score_path = a_star(start_point, open_neighbors, end_point, 0, score_eval, heuristic_eval)
-        path_in_score_points = round(path_score(final_score_path), 2)
+        with phase('path_cost'):
+            path_in_score_points = round(graph.path_measure(final_path, eval_type), 2)
         result_by_score = {'start_point': start_point, 'end_point': end_point,
-                           'path': final_score_path, 'path_in_score_points': path_in_score_points}
+                           'path': graph.ids[final_path].tolist(),
+                           'path_in_score_points': path_in_score_points,
+                           'nodes_expanded': search_stats['nodes_expanded']}
         return result_by_score
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MainappConfig(AppConfig):
     name = 'mainapp'
+
+    def ready(self):
+        import mainapp.signals  # noqa: F401
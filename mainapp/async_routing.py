@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """Очередь вычислений маршрутов заполнена"""
+
+
+def _run_with_connections(func, *args):
+    """func(*args) в потоке пула с обслуживанием соединений Django, как вокруг запроса:
+    устаревшие и разорванные соединения потока закрываются до и после вычисления (CONN_MAX_AGE)"""
+    from django.db import close_old_connections
+
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+class CoalescingExecutor:
+    """Ограниченный пул потоков для блокирующих вычислений маршрутов с объединением
+    одинаковых запросов (single-flight): пока вычисление по ключу не завершено, все
+    новые запросы с тем же ключом ждут его результат, а не запускают свое.
+    Аргументы:
+            max_workers     - число потоков вычисления
+            max_pending     - максимум различных вычислений в работе и в очереди;
+                              сверх него run() выбрасывает Overloaded"""
+
+    def __init__(self, max_workers=4, max_pending=64):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='routing')
+        self._inflight = {}
+        # RLock: колбэк завершения может выполниться сразу внутри run(), если задача уже готова
+        self._lock = threading.RLock()
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def pending(self):
+        return len(self._inflight)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def run(self, key, func, *args):
+        """Результат func(*args); одновременные вызовы с одинаковым key выполняются один раз.
+        Используются concurrent.futures.Future, поэтому объединение работает и между
+        разными циклами событий (async-представления под WSGI)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            elif len(self._inflight) >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(key)
+            else:
+                # контекст (в т.ч. профиль запроса) переносится в поток вычисления
+                future = self._executor.submit(contextvars.copy_context().run, _run_with_connections, func, *args)
+                self._inflight[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+        # shield: отмена одного ожидающего запроса не отменяет общее вычисление
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_route_executor():
+    """Пул вычислений маршрутов процесса, настроенный по settings.ROUTING_ASYNC"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from django.conf import settings
+
+                options = getattr(settings, 'ROUTING_ASYNC', {})
+                _executor = CoalescingExecutor(max_workers=options.get('WORKERS', 4),
+                                               max_pending=options.get('MAX_PENDING', 64))
+    return _executor
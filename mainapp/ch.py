@@ -0,0 +1,221 @@
+import os
+from heapq import heappush, heappop
+
+import numpy as np
+
+INF = float('inf')
+
+
+class ContractionHierarchy:
+    """Иерархия сжатия (Contraction Hierarchies) графа маршрутизации для одного способа вычисления.
+    Хранит ранги узлов и "восходящие" ребра (к узлам с большим рангом) в CSR-представлении.
+    Ребро-сокращение помечено узлом middle, через который оно проходит (-1 - исходное ребро графа).
+    Атрибуты:
+            metric          - способ вычисления (by_distance / by_score)
+            checksum        - контрольная сумма графа (RoutingGraph.checksum), для которого построена иерархия
+            rank            - порядок сжатия узлов (int64)
+            offsets         - смещения списков восходящих ребер, длина n + 1 (int64)
+            targets         - концы восходящих ребер (int64)
+            weights         - стоимости восходящих ребер (float64)
+            middles         - промежуточные узлы сокращений (int64)"""
+
+    def __init__(self, metric, checksum, rank, offsets, targets, weights, middles):
+        self.metric = metric
+        self.checksum = checksum
+        self.rank = rank
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.middles = middles
+        # списки Python для быстрого обхода в запросах
+        self._offsets = offsets.tolist()
+        self._targets = targets.tolist()
+        self._weights = weights.tolist()
+        self._middles = middles.tolist()
+        self._rank = rank.tolist()
+
+    def save(self, path):
+        """Сохранение иерархии в файл .npz"""
+        with open(path, 'wb') as outfile:
+            np.savez(outfile, metric=self.metric, checksum=self.checksum, rank=self.rank,
+                     offsets=self.offsets, targets=self.targets, weights=self.weights, middles=self.middles)
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка иерархии, сохраненной методом save"""
+        with np.load(path) as data:
+            return cls(str(data['metric']), str(data['checksum']), data['rank'], data['offsets'],
+                       data['targets'], data['weights'], data['middles'])
+
+    def _upward(self, node):
+        lo, hi = self._offsets[node], self._offsets[node + 1]
+        return zip(self._targets[lo:hi], self._weights[lo:hi])
+
+    def _middle(self, a, b):
+        """Промежуточный узел ребра a-b (ищется в восходящих ребрах узла с меньшим рангом)"""
+        if self._rank[a] > self._rank[b]:
+            a, b = b, a
+        for slot in range(self._offsets[a], self._offsets[a + 1]):
+            if self._targets[slot] == b:
+                return self._middles[slot]
+        raise KeyError((a, b))
+
+    def _unpack(self, up_path):
+        """Разворачивание сокращений в последовательность исходных узлов графа"""
+        path = [up_path[0]]
+        stack = [(a, b) for a, b in zip(up_path[-2::-1], up_path[:0:-1])]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle(a, b)
+            if middle < 0:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+        return path
+
+    def shortest_path(self, source, target, search_stats=None):
+        """Кратчайший путь между индексами узлов двунаправленным поиском по восходящим ребрам.
+        Возвращает список индексов узлов исходного графа или None, если путь не найден"""
+        if source == target:
+            return [source]
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meet, settled = INF, None, 0
+        while True:
+            # направление с меньшим ключом; поиск прекращается, когда оба ключа не меньше лучшего пути
+            keys = [heap[0][0] if heap else INF for heap in heaps]
+            side = 0 if keys[0] <= keys[1] else 1
+            if keys[side] >= best:
+                break
+            cost, node = heappop(heaps[side])
+            if cost > dist[side][node]:
+                continue  # устаревшая запись кучи
+            settled += 1
+            other = dist[1 - side].get(node)
+            if other is not None and cost + other < best:
+                best, meet = cost + other, node
+            for neighbor, weight in self._upward(node):
+                new_cost = cost + weight
+                if new_cost < dist[side].get(neighbor, INF):
+                    dist[side][neighbor] = new_cost
+                    parent[side][neighbor] = node
+                    heappush(heaps[side], (new_cost, neighbor))
+        if search_stats is not None:
+            search_stats['nodes_expanded'] = search_stats.get('nodes_expanded', 0) + settled
+        if meet is None:
+            return None
+        up_path = []
+        node = meet
+        while node is not None:
+            up_path.append(node)
+            node = parent[0][node]
+        up_path.reverse()
+        node = parent[1][meet]
+        while node is not None:
+            up_path.append(node)
+            node = parent[1][node]
+        return self._unpack(up_path)
+
+
+def build_hierarchy(graph, metric, witness_limit=64):
+    """Построение иерархии сжатия для графа по способу вычисления metric.
+    Узлы сжимаются в порядке разности ребер (число сокращений - степень + число сжатых соседей)
+    с ленивым пересчетом приоритетов. witness_limit - максимум узлов, просматриваемых при поиске
+    обходного пути (ограничение может лишь добавить лишние сокращения, но не нарушает корректность)"""
+    n = graph.node_count
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    weights = graph.edge_weights(metric).tolist()
+    adjacency = [{} for _ in range(n)]  # сосед -> (стоимость, промежуточный узел)
+    for node in range(n):
+        for slot in range(offsets[node], offsets[node + 1]):
+            neighbor, weight = targets[slot], weights[slot]
+            if neighbor != node and weight < adjacency[node].get(neighbor, (INF,))[0]:
+                adjacency[node][neighbor] = (weight, -1)
+
+    def witness_costs(source, excluded, max_cost):
+        """Ограниченный поиск Дейкстры от source по несжатым узлам в обход excluded"""
+        dist = {source: 0.0}
+        nodes_heap = [(0.0, source)]
+        settled = 0
+        while nodes_heap and settled < witness_limit:
+            cost, node = heappop(nodes_heap)
+            if cost > dist[node]:
+                continue
+            if cost > max_cost:
+                break
+            settled += 1
+            for neighbor, (weight, _) in adjacency[node].items():
+                new_cost = cost + weight
+                if neighbor != excluded and new_cost < dist.get(neighbor, INF):
+                    dist[neighbor] = new_cost
+                    heappush(nodes_heap, (new_cost, neighbor))
+        return dist
+
+    def shortcuts(node):
+        """Сокращения, необходимые при сжатии узла node: список (u, w, стоимость)"""
+        neighbors = list(adjacency[node].items())
+        needed = []
+        for i, (u, (weight_u, _)) in enumerate(neighbors[:-1]):
+            rest = neighbors[i + 1:]
+            dist = witness_costs(u, node, weight_u + max(weight for _, (weight, _) in rest))
+            for w, (weight_w, _) in rest:
+                via = weight_u + weight_w
+                if dist.get(w, INF) > via:
+                    needed.append((u, w, via))
+        return needed
+
+    contracted_neighbors = [0] * n
+
+    def priority(node):
+        return len(shortcuts(node)) - len(adjacency[node]) + contracted_neighbors[node]
+
+    queue = [(priority(node), node) for node in range(n)]
+    queue.sort()
+    rank = np.zeros(n, dtype=np.int64)
+    upward = [None] * n
+    order = 0
+    while queue:
+        _, node = heappop(queue)
+        current = priority(node)
+        if queue and current > queue[0][0]:
+            heappush(queue, (current, node))  # приоритет устарел - откладываем узел
+            continue
+        for u, w, via in shortcuts(node):
+            if via < adjacency[u].get(w, (INF,))[0]:
+                adjacency[u][w] = adjacency[w][u] = (via, node)
+        upward[node] = adjacency[node]
+        for neighbor in adjacency[node]:
+            del adjacency[neighbor][node]
+            contracted_neighbors[neighbor] += 1
+        adjacency[node] = {}
+        rank[node] = order
+        order += 1
+
+    up_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(edges) for edges in upward], out=up_offsets[1:])
+    up_targets = np.array([v for edges in upward for v in edges], dtype=np.int64)
+    up_weights = np.array([weight for edges in upward for weight, _ in edges.values()], dtype=np.float64)
+    up_middles = np.array([middle for edges in upward for _, middle in edges.values()], dtype=np.int64)
+    return ContractionHierarchy(metric, graph.checksum, rank, up_offsets, up_targets, up_weights, up_middles)
+
+
+def hierarchy_path(directory, metric):
+    """Путь к файлу иерархии для способа вычисления"""
+    return os.path.join(directory, f'ch_{metric}.npz')
+
+
+def load_hierarchy(graph, metric, directory):
+    """Иерархия для графа (загружается с диска один раз на граф).
+    None, если файла нет или он построен для другой версии графа; тогда файл проверяется заново
+    не чаще раза в PRECOMPUTE_RECHECK_INTERVAL секунд"""
+    hierarchies = graph.hierarchies
+    if metric not in hierarchies or hierarchies[metric] is None and graph.recheck_due(f'ch_{metric}'):
+        path = hierarchy_path(directory, metric)
+        hierarchy = ContractionHierarchy.load(path) if os.path.exists(path) else None
+        if hierarchy is not None and (hierarchy.checksum != graph.checksum or hierarchy.metric != metric):
+            hierarchy = None
+        hierarchies[metric] = hierarchy
+    return hierarchies[metric]
@@ -0,0 +1,178 @@
+import time
+from datetime import datetime, timezone
+
+from mainapp.graph import Override, line_key
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else float('inf')
+
+
+def record_point(point):
+    """Запись журнала о добавлении или изменении точки"""
+    from mainapp.models import GraphChange
+
+    geom = point.geom
+    GraphChange.objects.create(kind=GraphChange.POINT, point_id=point.pk, score=point.score,
+                               lon=geom.x if geom is not None else None, lat=geom.y if geom is not None else None)
+
+
+def record_point_deleted(point_id):
+    from mainapp.models import GraphChange
+
+    GraphChange.objects.create(kind=GraphChange.POINT_DELETED, point_id=point_id)
+
+
+def record_line(line_id, from_id, to_id):
+    """Запись журнала о добавлении линии или переносе ее на другие концы"""
+    from mainapp.models import GraphChange
+
+    GraphChange.objects.create(kind=GraphChange.LINE, line_id=line_id, from_point_id=from_id, to_point_id=to_id)
+
+
+def record_line_deleted(line_id):
+    from mainapp.models import GraphChange
+
+    GraphChange.objects.create(kind=GraphChange.LINE_DELETED, line_id=line_id)
+
+
+def record_reload():
+    """Запись журнала о полной перезагрузке графа (после массовой загрузки данных без сигналов)"""
+    from mainapp.models import GraphChange
+
+    GraphChange.objects.create(kind=GraphChange.RELOAD)
+
+
+def record_override(from_id, to_id, ttl, km=None, score=None, closed=False):
+    """Временное переопределение стоимости линии (или ее закрытие) на ttl секунд.
+    Ранее заданное переопределение той же линии заменяется; ttl=0 - снять переопределение"""
+    from mainapp.models import GraphChange
+
+    now = datetime.now(timezone.utc)
+    expires_at = datetime.fromtimestamp(now.timestamp() + ttl, timezone.utc)
+    from_id, to_id = line_key(from_id, to_id)
+    # прежние записи этой линии больше не действуют (важно для воркеров, загружающих граф с нуля)
+    GraphChange.objects.filter(kind=GraphChange.OVERRIDE, from_point_id=from_id, to_point_id=to_id,
+                               expires_at__gt=now).update(expires_at=now)
+    return GraphChange.objects.create(kind=GraphChange.OVERRIDE, from_point_id=from_id, to_point_id=to_id,
+                                      km=km, score=score, closed=closed, expires_at=expires_at)
+
+
+def record_addresses():
+    """Запись журнала об изменении адресов и других полей точек, не входящих в граф
+    (на граф не влияет, меняет версию данных точек)"""
+    from mainapp.models import GraphChange
+
+    GraphChange.objects.create(kind=GraphChange.ADDRESSES)
+
+
+def latest_change_id(exclude_kinds=()):
+    """id последней записи журнала, кроме записей видов exclude_kinds (0 - таких записей нет)"""
+    from django.db.models import Max
+    from mainapp.models import GraphChange
+
+    changes = GraphChange.objects.all()
+    if exclude_kinds:
+        changes = changes.exclude(kind__in=exclude_kinds)
+    return changes.aggregate(last=Max('id'))['last'] or 0
+
+
+def points_version():
+    """Версия данных точек (для ETag списка точек): последняя запись журнала, кроме переопределений линий"""
+    from mainapp.models import GraphChange
+
+    return latest_change_id(exclude_kinds=(GraphChange.OVERRIDE,))
+
+
+def apply_change(graph, change, line_model, point_model):
+    """Применяет запись журнала к редактируемой копии графа (RoutingGraph.edited).
+    Возвращает граф - тот же или, для полной перезагрузки, новый"""
+    from mainapp.models import GraphChange
+
+    if change.kind == GraphChange.POINT:
+        graph.set_point(change.point_id, change.lon, change.lat, change.score)
+    elif change.kind == GraphChange.POINT_DELETED:
+        graph.remove_point(change.point_id)
+    elif change.kind == GraphChange.LINE:
+        graph.set_line(change.line_id, change.from_point_id, change.to_point_id)
+    elif change.kind == GraphChange.LINE_DELETED:
+        graph.remove_line(change.line_id)
+    elif change.kind == GraphChange.OVERRIDE:
+        expires_at = _timestamp(change.expires_at)
+        override = Override(change.km, change.score, change.closed, expires_at) \
+            if expires_at > time.time() else None
+        graph.set_override(change.from_point_id, change.to_point_id, override)
+    elif change.kind == GraphChange.RELOAD:
+        graph = load_graph(line_model, point_model).edited()
+    return graph
+
+
+def load_graph(line_model, point_model):
+    """Загрузка графа целиком (снимок или БД) с действующими переопределениями линий.
+    Номер последней записи журнала запоминается до загрузки: изменения, сделанные во время
+    загрузки, применяются повторно (все изменения идемпотентны, линии - по id)"""
+    from mainapp.graph import RoutingGraph
+    from mainapp.models import GraphChange
+    from mainapp.snapshot import load_snapshot_graph
+
+    synced_at = time.time()
+    change_id = latest_change_id()
+    graph = load_snapshot_graph(line_model, point_model) or RoutingGraph.from_models(line_model, point_model)
+    overrides = GraphChange.objects.filter(kind=GraphChange.OVERRIDE, id__lte=change_id,
+                                           expires_at__gt=datetime.now(timezone.utc)).order_by('id')
+    overrides = list(overrides)
+    if overrides:
+        graph = graph.edited()
+        for change in overrides:
+            apply_change(graph, change, line_model, point_model)
+    graph.change_id = change_id
+    graph.synced_at = synced_at
+    return graph
+
+
+def prune_changes(retention):
+    """Удаляет записи журнала старше retention секунд, кроме действующих переопределений линий и
+    последних записей, по которым считаются версии данных (points_version, source_stamp).
+    Воркер, не сверявшийся с журналом дольше retention, загружает граф заново (см. get_graph),
+    поэтому удаленные записи ему не нужны. Возвращает число удаленных записей"""
+    from mainapp.models import GraphChange
+
+    now = datetime.now(timezone.utc)
+    cutoff = datetime.fromtimestamp(now.timestamp() - retention, timezone.utc)
+    keep = {latest_change_id(), points_version(),
+            latest_change_id(exclude_kinds=(GraphChange.OVERRIDE, GraphChange.ADDRESSES))}
+    active = GraphChange.objects.filter(kind=GraphChange.OVERRIDE, expires_at__gt=now)
+    deleted, _ = GraphChange.objects.filter(created__lt=cutoff).exclude(id__in=keep) \
+        .exclude(id__in=active.values('id')).delete()
+    return deleted
+
+
+def pending_changes(graph, interval=1.0):
+    """Новые записи журнала для графа (None - применять нечего).
+    Журнал опрашивается не чаще раза в interval секунд; истекшие переопределения
+    снимаются без ожидания"""
+    from mainapp.models import GraphChange
+
+    now = time.time()
+    expired = graph.next_expiry <= now
+    if not expired and now - graph.synced_at < interval:
+        return None
+    changes = list(GraphChange.objects.filter(id__gt=graph.change_id).order_by('id'))
+    graph.synced_at = now
+    if not changes and not expired:
+        return None
+    return changes
+
+
+def apply_changes(graph, changes, line_model, point_model):
+    """Новый граф процесса: копия graph с примененными записями журнала и снятыми истекшими
+    переопределениями. Пересчитываются только затронутые ребра, без обращения к Point и Line"""
+    updated = graph.edited()
+    for change in changes:
+        if change.id <= updated.change_id:
+            continue  # уже учтено при полной перезагрузке
+        updated = apply_change(updated, change, line_model, point_model)
+        updated.change_id = max(updated.change_id, change.id)
+    updated.expire_overrides(time.time())
+    updated.synced_at = graph.synced_at
+    return updated
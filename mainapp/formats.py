@@ -0,0 +1,203 @@
+import json
+import math
+
+import msgpack
+import numpy as np
+from rest_framework.renderers import BaseRenderer
+
+from mainapp.geojson import plain
+from mainapp.profiling import phase
+
+# максимум знаков после запятой в precision= (точнее float64 градусов все равно не бывает)
+MAX_PRECISION = 10
+POLYLINE_PRECISION = 5
+# участки ломаной длиннее этого упрощаются векторно (numpy), короче - циклом по спискам
+VECTOR_SEGMENT = 64
+
+
+def _segment_distances(xs, ys, x0, y0, x1, y1):
+    """Расстояния от точек (xs, ys) до отрезка (x0, y0)-(x1, y1) - до отрезка, а не до прямой:
+    концы могут совпадать (маршрут-петля)"""
+    dx, dy = x1 - x0, y1 - y0
+    length = dx * dx + dy * dy
+    if isinstance(xs, np.ndarray):
+        px, py = xs - x0, ys - y0
+        if length > 0:
+            t = np.clip((px * dx + py * dy) / length, 0.0, 1.0)
+            px, py = px - t * dx, py - t * dy
+        return np.hypot(px, py)
+    distances = []
+    for x, y in zip(xs, ys):
+        px, py = x - x0, y - y0
+        if length > 0:
+            t = min(1.0, max(0.0, (px * dx + py * dy) / length))
+            px, py = px - t * dx, py - t * dy
+        distances.append(math.hypot(px, py))
+    return distances
+
+
+def douglas_peucker(lon, lat, tolerance):
+    """Упрощение ломаной (алгоритм Дугласа-Пекера): индексы оставляемых вершин по возрастанию.
+    Вершина отбрасывается, если она ближе tolerance (в км, как path_in_km) к отрезку между
+    оставленными соседями; первая и последняя вершины остаются всегда"""
+    count = len(lon)
+    if count < 3 or tolerance <= 0:
+        return np.arange(count)
+    x, y = lon * 100, lat * 100
+    # короткие участки дешевле считать списками: на них накладные расходы numpy больше самих вычислений
+    x_list, y_list = x.tolist(), y.tolist()
+    keep = [0, count - 1]
+    stack = [(0, count - 1)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        if hi - lo > VECTOR_SEGMENT:
+            distances = _segment_distances(x[lo + 1:hi], y[lo + 1:hi], x[lo], y[lo], x[hi], y[hi])
+            k = int(distances.argmax())
+        else:
+            distances = _segment_distances(x_list[lo + 1:hi], y_list[lo + 1:hi],
+                                           x_list[lo], y_list[lo], x_list[hi], y_list[hi])
+            k = max(range(len(distances)), key=distances.__getitem__)
+        if distances[k] > tolerance:
+            middle = lo + 1 + k
+            keep.append(middle)
+            stack.append((lo, middle))
+            stack.append((middle, hi))
+    return np.array(sorted(keep), dtype=np.int64)
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    """Ломаная в формате encoded polyline (как в Google Maps / OSRM): пары (lat, lon), округленные
+    до precision знаков, записываются разностями с предыдущей парой по 5 бит на символ"""
+    values = np.round(np.asarray(coordinates, dtype=np.float64)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chars = []
+    for value in ((deltas << 1) ^ (deltas >> 63)).tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def decode_polyline(text, precision=POLYLINE_PRECISION):
+    """Обратное к encode_polyline: массив пар [lon, lat]"""
+    values, value, shift = [], 0, 0
+    for char in text:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    pairs = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return pairs[:, ::-1]
+
+
+def route_options(params):
+    """Параметры формы маршрута из запроса: precision (знаков после запятой, None - без округления)
+    и simplify (допуск упрощения в км, None - без упрощения). ValueError при неверных значениях"""
+    precision = params.get('precision')
+    simplify = params.get('simplify')
+    precision = int(precision) if precision is not None else None
+    simplify = float(simplify) if simplify is not None else None
+    if precision is not None and not 0 <= precision <= MAX_PRECISION:
+        raise ValueError(precision)
+    if simplify is not None and not simplify >= 0:
+        raise ValueError(simplify)
+    return {'precision': precision, 'simplify': simplify}
+
+
+def shape_coordinates(coordinates, precision=None, simplify=None):
+    """Координаты LineString (массив n x 2) после упрощения и округления"""
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if simplify:
+        coordinates = coordinates[douglas_peucker(coordinates[:, 0], coordinates[:, 1], simplify)]
+    if precision is not None:
+        coordinates = np.round(coordinates, precision)
+    return coordinates
+
+
+def _shaped(data, geometry):
+    """Копия документа, в которой геометрии LineString заменены на geometry(coordinates)"""
+    if isinstance(data, dict):
+        if data.get('type') == 'LineString' and 'coordinates' in data:
+            return geometry(data['coordinates'])
+        return {key: _shaped(value, geometry) for key, value in data.items()}
+    if isinstance(data, list) and data and isinstance(data[0], (dict, list)):
+        return [_shaped(value, geometry) for value in data]
+    return data
+
+
+class RouteRenderer(BaseRenderer):
+    """Ответ маршрута: GeoJSON с компактным JSON. В renderer_context можно передать precision и simplify
+    (см. route_options) - они применяются к координатам LineString перед кодированием"""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def geometry(self, coordinates, precision, simplify):
+        return {'type': 'LineString', 'coordinates': shape_coordinates(coordinates, precision, simplify)}
+
+    def encode(self, data):
+        return json.dumps(data, separators=(',', ':'), default=plain).encode()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        context = renderer_context or {}
+        precision, simplify = context.get('precision'), context.get('simplify')
+        return self.encode(_shaped(data, lambda coordinates: self.geometry(coordinates, precision, simplify)))
+
+
+class PolylineRenderer(RouteRenderer):
+    """JSON, в котором координаты LineString записаны строкой encoded polyline:
+    {"type": "LineString", "polyline": "...", "precision": 5} (precision= меняет точность, по умолчанию 5)"""
+    media_type = 'application/vnd.geopoints.polyline+json'
+    format = 'polyline'
+
+    def geometry(self, coordinates, precision, simplify):
+        precision = POLYLINE_PRECISION if precision is None else precision
+        return {'type': 'LineString', 'precision': precision,
+                'polyline': encode_polyline(shape_coordinates(coordinates, None, simplify), precision)}
+
+
+class MessagePackRenderer(RouteRenderer):
+    """Тот же GeoJSON-документ в MessagePack (координаты - двоичные float64, без текстовой записи чисел)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def encode(self, data):
+        return msgpack.packb(data, default=plain)
+
+
+def route_renderers():
+    """Форматы ответов маршрутов в порядке предпочтения"""
+    return [RouteRenderer, PolylineRenderer, MessagePackRenderer]
+
+
+def negotiate(request):
+    """Формат ответа для обычного (не DRF) представления: по ?format= или заголовку Accept,
+    как в DRF. None - запрошенный формат не поддерживается"""
+    from django.http import Http404
+    from rest_framework.exceptions import NotAcceptable
+    from rest_framework.negotiation import DefaultContentNegotiation
+    from rest_framework.request import Request
+
+    try:
+        return DefaultContentNegotiation().select_renderer(Request(request),
+                                                           [renderer() for renderer in route_renderers()])[0]
+    except (Http404, NotAcceptable):
+        return None
+
+
+def route_response(renderer, data, options, status=200):
+    """Ответ маршрута в выбранном формате; options - результат route_options.
+    Формат зависит от заголовка Accept, поэтому он указывается в Vary - для кэшей перед приложением"""
+    from django.http import HttpResponse
+    from django.utils.cache import patch_vary_headers
+
+    with phase('geojson'):
+        content = renderer.render(data, renderer.media_type, options)
+    response = HttpResponse(content, status=status, content_type=renderer.media_type)
+    patch_vary_headers(response, ['Accept'])
+    return response
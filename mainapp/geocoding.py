@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_GEOCODER_URL = 'https://geocode-maps.yandex.ru/1.x/'
+
+
+def geocoder_api_key():
+    """Ключ Yandex Geocoder: mainapp/API.py (YA_GEOCODER_API_KEY) или переменная окружения"""
+    try:
+        from mainapp.API import YA_GEOCODER_API_KEY
+    except ImportError:
+        return os.environ.get('YA_GEOCODER_API_KEY')
+    return YA_GEOCODER_API_KEY
+
+
+def parse_address(response_json):
+    """Адрес из ответа Yandex Geocoder (None, если ничего не найдено)"""
+    members = response_json['response']['GeoObjectCollection']['featureMember']
+    if not members:
+        return None
+    return members[0]['GeoObject']['metaDataProperty']['GeocoderMetaData']['text']
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует вызывающий поток до появления токена"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocodeCache:
+    """Постоянный кэш адресов (SQLite) по координатам, округленным до precision знаков"""
+
+    def __init__(self, path, precision=6):
+        self.precision = precision
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS address '
+                                 '(lon REAL, lat REAL, address TEXT, PRIMARY KEY (lon, lat))')
+        self._lock = threading.Lock()
+
+    def _key(self, lon, lat):
+        return round(lon, self.precision), round(lat, self.precision)
+
+    def get(self, lon, lat):
+        with self._lock:
+            row = self._connection.execute('SELECT address FROM address WHERE lon = ? AND lat = ?',
+                                           self._key(lon, lat)).fetchone()
+        return row[0] if row else None
+
+    def set(self, lon, lat, address):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO address VALUES (?, ?, ?)',
+                                     (*self._key(lon, lat), address))
+
+    def close(self):
+        self._connection.close()
+
+
+class Geocoder:
+    """Обратное геокодирование пачками: пул потоков с общей HTTP-сессией (переиспользование
+    соединений), ограничение параллельности и частоты запросов, постоянный кэш.
+    Аргументы:
+            api_key         - ключ Yandex Geocoder
+            url             - адрес сервиса (для тестов - локальная заглушка)
+            concurrency     - число одновременных запросов
+            rate            - запросов в секунду (None - без ограничения)
+            cache           - GeocodeCache или None
+            timeout         - таймаут одного запроса, секунд"""
+
+    def __init__(self, api_key, url=DEFAULT_GEOCODER_URL, concurrency=8, rate=None, cache=None, timeout=10):
+        self.api_key = api_key
+        self.url = url
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate) if rate else None
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requested = 0
+        self.cached = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def reverse(self, lon, lat):
+        """Адрес по долготе и широте (&geocode = <долгота, широта>); None при ошибке"""
+        if self.cache is not None:
+            address = self.cache.get(lon, lat)
+            if address is not None:
+                self._count('cached')
+                return address
+        if self.limiter is not None:
+            self.limiter.acquire()
+        self._count('requested')
+        try:
+            response = self.session.get(self.url, timeout=self.timeout,
+                                        params={'format': 'json', 'apikey': self.api_key, 'geocode': f'{lon},{lat}'})
+            response.raise_for_status()
+            address = parse_address(response.json())
+        except (requests.RequestException, ValueError, KeyError, IndexError):
+            self._count('failed')
+            return None
+        if address is not None and self.cache is not None:
+            self.cache.set(lon, lat, address)
+        return address
+
+    def reverse_many(self, coordinates):
+        """Адреса для списка пар (lon, lat) в том же порядке"""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(lambda coords: self.reverse(*coords), coordinates))
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
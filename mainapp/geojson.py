@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+from django.http import HttpResponse
+
+from mainapp.profiling import phase
+
+
+def route_feature(graph, result, name):
+    """GeoJSON Feature маршрута, построенный по массивам графа без запросов к БД.
+    Аргументы:
+            graph           - граф маршрутизации (mainapp.graph.RoutingGraph)
+            result          - результат best_path_by
+            name            - название маршрута для properties"""
+    with phase('geojson'):
+        return _route_feature(graph, result, name)
+
+
+def _route_feature(graph, result, name):
+    nodes = graph.indices_of(result['path'])
+    properties = {'name': name, 'start_point': result['start_point'], 'end_point': result['end_point'],
+                  'path': result['path']}
+    if 'path_in_km' in result:
+        properties['path_in_km'] = result['path_in_km']
+    if 'path_in_score_points' in result:
+        properties['path_in_score_points'] = result['path_in_score_points']
+        properties['score_points'] = graph.score[nodes].astype(np.int64).tolist()
+    return {"type": "Feature",
+            "geometry": {"type": "LineString",
+                         # массив n x 2: в список превращается при кодировании (см. plain и mainapp.formats)
+                         "coordinates": np.column_stack((graph.lon[nodes], graph.lat[nodes]))},
+            "properties": properties}
+
+
+def point_features(graph, nodes, costs, cost_name):
+    """GeoJSON Features точек графа (индексы nodes) со стоимостью cost_name в properties"""
+    ids = graph.ids[nodes].tolist()
+    lon, lat = graph.lon[nodes].tolist(), graph.lat[nodes].tolist()
+    return [{"type": "Feature", "id": point_id,
+             "geometry": {"type": "Point", "coordinates": [x, y]} if x == x else None,  # NaN - точка без координат
+             "properties": {"pk": point_id, cost_name: round(cost, 2)}}
+            for point_id, x, y, cost in zip(ids, lon, lat, costs.tolist())]
+
+
+def polygon_feature(ring, properties):
+    return {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [ring]} if ring else None,
+            "properties": properties}
+
+
+def feature_collection(*features):
+    return {"type": "FeatureCollection", "features": list(features)}
+
+
+def plain(value):
+    """Массивы numpy в списки (default для json.dumps и msgpack.packb)"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def json_response(data, status=200):
+    """Ответ с JSON, сериализованным напрямую в байты (без повторного кодирования в DRF)"""
+    with phase('geojson'):
+        content = json.dumps(data, separators=(',', ':'), default=plain).encode()
+    return HttpResponse(content, status=status, content_type='application/json')
+
+
+def stream_points(rows, fields, limit=None, batch_size=1000):
+    """Части JSON-документа {"points": FeatureCollection, "next_cursor": id} для StreamingHttpResponse:
+    документ целиком в памяти не строится. FeatureCollection - как у serialize('geojson'), с crs EPSG:4326. next_cursor - id последней точки, если страница заполнена
+    (limit), иначе null.
+    Аргументы:
+            rows            - строки (id, lon, lat, *значения свойств fields, кроме pk)
+            fields          - свойства точек в порядке вывода (pk - id строкой, как в serialize('geojson'))"""
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    yield '{"points":{"type":"FeatureCollection","crs":{"type":"name","properties":{"name":"EPSG:4326"}},' \
+          '"features":['
+    chunk, count, point_id, separator = [], 0, None, ''
+    for point_id, lon, lat, *values in rows:
+        values = iter(values)
+        properties = {name: str(point_id) if name == 'pk' else next(values) for name in fields}
+        geometry = {"type": "Point", "coordinates": [lon, lat]} if lon is not None else None
+        chunk.append(encode({"type": "Feature", "id": point_id, "properties": properties, "geometry": geometry}))
+        count += 1
+        if len(chunk) >= batch_size:
+            yield separator + ','.join(chunk)
+            chunk, separator = [], ','
+    if chunk:
+        yield separator + ','.join(chunk)
+    next_cursor = point_id if limit and count == limit else None
+    yield ']},"next_cursor":' + encode(next_cursor) + '}'
@@ -0,0 +1,464 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from mainapp.profiling import phase
+
+# как часто искать заново предрасчеты (ориентиры, иерархии), которых для графа не нашлось: команды
+# build_landmarks и build_ch, запущенные после загрузки графа, подхватываются без перезапуска воркеров
+PRECOMPUTE_RECHECK_INTERVAL = 30.0
+
+
+class RoutingGraph:
+    """Граф маршрутизации в компактном CSR-представлении.
+    Узлы пронумерованы плотными индексами 0..n-1 в порядке возрастания id точки.
+    Соседи узла i - targets[offsets[i]:offsets[i + 1]] (линии неориентированные,
+    поэтому каждая линия хранится в обоих направлениях).
+    Атрибуты:
+            ids             - id точек в БД, отсортированы по возрастанию (int64)
+            lon, lat        - координаты узлов (float64)
+            score           - стоимость узлов в баллах (float64)
+            offsets         - смещения списков соседей, длина n + 1 (int64)
+            targets         - индексы соседей (int64)
+            edge_km         - длина ребра в километрах, параллельно targets (float64)
+            edge_score      - стоимость ребра в баллах (сумма score концов), параллельно targets (float64)
+            line_ids        - id линий графа по возрастанию (int64): по ним изменения линий из журнала
+                              применяются идемпотентно
+            line_from, line_to - id точек-концов линий, параллельно line_ids (int64)
+            version         - версия хранилища, из которой построен граф
+            landmarks       - таблицы расстояний от ориентиров ALT по способам вычисления
+                              (None - еще не загружены, см. mainapp.landmarks)
+            hierarchies     - загруженные иерархии сжатия по способам вычисления (см. mainapp.ch)
+            snap_index      - пространственный индекс узлов (None - еще не построен, см. mainapp.snapping)
+            change_id       - id последней примененной записи журнала изменений (mainapp.changes)
+            overrides       - действующие временные переопределения линий:
+                              (меньший id точки, больший id точки) -> Override"""
+
+    def __init__(self, ids, lon, lat, score, offsets, targets, edge_km, edge_score,
+                 line_ids=None, line_from=None, line_to=None, version=0):
+        self.ids = ids
+        self.lon = lon
+        self.lat = lat
+        self.score = score
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_km = edge_km
+        self.edge_score = edge_score
+        no_lines = np.empty(0, dtype=np.int64)
+        self.line_ids = no_lines if line_ids is None else line_ids
+        self.line_from = no_lines if line_from is None else line_from
+        self.line_to = no_lines if line_to is None else line_to
+        self.version = version
+        self.landmarks = None
+        self.hierarchies = {}
+        self.snap_index = None
+        self._checksum = None
+        self.change_id = 0
+        self.overrides = {}
+        self.synced_at = 0.0
+        self._owned = None
+        self._missing_checked = {}
+
+    @property
+    def node_count(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        """Количество направленных ребер (каждая линия учитывается дважды)"""
+        return len(self.targets)
+
+    @property
+    def checksum(self):
+        """Контрольная сумма топологии и весов графа. Предрасчеты (ориентиры и т.п.)
+        привязываются к ней и игнорируются, если граф с тех пор изменился.
+        Не зависит от порядка ребер внутри списков соседей: граф после изменений из журнала
+        (set_line дописывает ребро в конец списка) совпадает по ней с заново загруженным из БД"""
+        if self._checksum is None:
+            heads = np.repeat(np.arange(self.node_count, dtype=np.int64), np.diff(self.offsets))
+            order = np.lexsort((self.edge_score, self.edge_km, self.targets, heads))
+            digest = hashlib.blake2b(digest_size=16)
+            for array in (self.ids, self.offsets, self.targets[order], self.edge_km[order], self.edge_score[order]):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._checksum = digest.hexdigest()
+        return self._checksum
+
+    @classmethod
+    def from_edges(cls, ids, lon, lat, score, edges_from, edges_to, version=0, line_ids=None):
+        """Сборка графа из массивов узлов и пар (from_id, to_id) линий.
+        ids должны быть отсортированы по возрастанию; линии на отсутствующие точки отбрасываются.
+        line_ids - id линий, параллельно edges_from (по умолчанию 1..m)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        edges_from = np.asarray(edges_from, dtype=np.int64)
+        edges_to = np.asarray(edges_to, dtype=np.int64)
+        line_ids = np.arange(1, len(edges_from) + 1, dtype=np.int64) if line_ids is None \
+            else np.asarray(line_ids, dtype=np.int64)
+        n = len(ids)
+        src = np.searchsorted(ids, edges_from)
+        dst = np.searchsorted(ids, edges_to)
+        known = np.zeros(len(src), dtype=bool)
+        if n:
+            known = ((src < n) & (dst < n))
+            known[known] &= (ids[src[known]] == edges_from[known]) & (ids[dst[known]] == edges_to[known])
+        src, dst = src[known], dst[known]
+        line_order = np.argsort(line_ids[known], kind='stable')
+        lines = line_ids[known][line_order], edges_from[known][line_order], edges_to[known][line_order]
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        score = np.asarray(score, dtype=np.float64)
+        heads = np.concatenate([src, dst])
+        tails = np.concatenate([dst, src])
+        order = np.argsort(heads, kind='stable')
+        heads, tails = heads[order], tails[order]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n), out=offsets[1:])
+        edge_km = np.hypot(lon[heads] - lon[tails], lat[heads] - lat[tails]) * 100
+        edge_score = score[heads] + score[tails]
+        return cls(ids, lon, lat, score, offsets, tails, edge_km, edge_score, *lines, version=version)
+
+    @classmethod
+    def from_models(cls, line_model, point_model, version=0):
+        """Загрузка графа из БД двумя плоскими запросами (без подгрузки FK на каждую линию)"""
+        ids, lon, lat, score = [], [], [], []
+        for point_id, geom, point_score in point_model.objects.order_by('id').values_list('id', 'geom', 'score'):
+            ids.append(point_id)
+            lon.append(geom.x if geom is not None else np.nan)
+            lat.append(geom.y if geom is not None else np.nan)
+            score.append(point_score or 0)
+        edges = line_model.objects.filter(from_point__isnull=False, to_point__isnull=False)
+        edges = np.array(list(edges.values_list('id', 'from_point_id', 'to_point_id')),
+                         dtype=np.int64).reshape(-1, 3)
+        return cls.from_edges(ids, lon, lat, score, edges[:, 1], edges[:, 2], version=version, line_ids=edges[:, 0])
+
+    def index_of(self, point_id):
+        """Индекс узла по id точки. KeyError, если точки нет в графе"""
+        idx = int(np.searchsorted(self.ids, point_id))
+        if idx >= len(self.ids) or self.ids[idx] != point_id:
+            raise KeyError(point_id)
+        return idx
+
+    def indices_of(self, point_ids):
+        """Индексы узлов для списка id точек (все id должны быть в графе)"""
+        point_ids = np.asarray(point_ids, dtype=np.int64)
+        nodes = np.searchsorted(self.ids, point_ids)
+        if len(nodes) and (nodes.max() >= len(self.ids) or (self.ids[nodes] != point_ids).any()):
+            raise KeyError('Unknown point id in path')
+        return nodes
+
+    def neighbors(self, idx):
+        """Индексы соседей узла idx"""
+        return self.targets[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def edge_weights(self, eval_type):
+        """Массив стоимостей ребер для способа вычисления (by_distance / by_score)"""
+        if eval_type == 'by_distance':
+            return self.edge_km
+        elif eval_type == 'by_score':
+            return self.edge_score
+        raise ValueError(f'Unknown eval_type {eval_type!r}')
+
+    def adjacency(self, eval_type):
+        """CSR-представление графа (offsets, targets, weights) для поиска (mainapp.search) в виде
+        memoryview поверх массивов графа: элемент читается как число Python так же быстро, как из списка,
+        но без копии массивов - снимок, открытый через numpy.memmap, остается общим для процессов"""
+        return memoryview(self.offsets), memoryview(self.targets), memoryview(self.edge_weights(eval_type))
+
+    def distance_to(self, idx):
+        """Расстояния в километрах от всех узлов до узла idx (один векторный проход)"""
+        return np.hypot(self.lon - self.lon[idx], self.lat - self.lat[idx]) * 100
+
+    def path_km(self, path):
+        """Длина пути (список индексов узлов) в километрах - по координатам, без переопределений линий"""
+        path = np.asarray(path, dtype=np.int64)
+        return float((np.hypot(np.diff(self.lon[path]), np.diff(self.lat[path])) * 100).sum())
+
+    def path_score(self, path):
+        """Суммарный score узлов пути (список индексов узлов)"""
+        return float(self.score[np.asarray(path, dtype=np.int64)].sum())
+
+    def path_measure(self, path, eval_type):
+        """Стоимость пути в ответах (path_in_km / path_in_score_points): path_km для by_distance,
+        path_score для by_score. Веса поиска с ней не совпадают: ребро by_score стоит score обоих концов,
+        а переопределения линий меняют только веса поиска"""
+        if eval_type == 'by_distance':
+            return self.path_km(path)
+        elif eval_type == 'by_score':
+            return self.path_score(path)
+        raise ValueError(f'Unknown eval_type {eval_type!r}')
+
+    def recheck_due(self, name):
+        """Пора ли снова искать не найденный предрасчет name: не чаще раза в PRECOMPUTE_RECHECK_INTERVAL
+        секунд (первый вызов только начинает отсчет). True получает один из одновременных запросов"""
+        now = time.monotonic()
+        with _recheck_lock:
+            if now - self._missing_checked.setdefault(name, now) < PRECOMPUTE_RECHECK_INTERVAL:
+                return False
+            self._missing_checked[name] = now
+            return True
+
+    @property
+    def next_expiry(self):
+        """Время (unix) истечения ближайшего переопределения, inf - переопределений нет"""
+        return min((override.expires_at for override in self.overrides.values()), default=float('inf'))
+
+    # Изменения графа. Граф, с которым работают запросы, не меняется: изменения применяются
+    # к копии (edited), массивы которой копируются при первом изменении, после чего копия
+    # заменяет общий граф процесса (см. get_graph)
+
+    def edited(self):
+        """Копия графа для применения изменений; массивы общие до первого изменения"""
+        graph = RoutingGraph(self.ids, self.lon, self.lat, self.score, self.offsets, self.targets,
+                             self.edge_km, self.edge_score, self.line_ids, self.line_from, self.line_to,
+                             version=self.version)
+        graph.change_id = self.change_id
+        graph.overrides = dict(self.overrides)
+        graph.synced_at = self.synced_at
+        graph._owned = set()
+        return graph
+
+    def _own(self, *names):
+        """Копирует общие с исходным графом массивы перед изменением на месте"""
+        for name in names:
+            if name not in self._owned:
+                setattr(self, name, np.array(getattr(self, name)))
+                self._owned.add(name)
+
+    def _changed(self):
+        """Сбрасывает предрасчеты, привязанные к прежним весам и топологии
+        (ориентиры и иерархии перестают подходить по контрольной сумме)"""
+        self._checksum = None
+        self.landmarks = None
+        self.hierarchies = {}
+
+    def _slots(self, a, b):
+        """Номера ребер a -> b"""
+        lo, hi = self.offsets[a], self.offsets[a + 1]
+        return lo + np.flatnonzero(self.targets[lo:hi] == b)
+
+    def line_cost(self, from_id, to_id):
+        """Обычная стоимость линии между точками (км, баллы) - без переопределения.
+        KeyError, если точки нет в графе"""
+        return self._base_weights(self.index_of(from_id), self.index_of(to_id))
+
+    def _base_weights(self, a, b):
+        """Стоимости ребра a - b (индексы узлов) без переопределения: длина по прямой и сумма score концов"""
+        return float(np.hypot(self.lon[a] - self.lon[b], self.lat[a] - self.lat[b]) * 100), \
+            float(self.score[a] + self.score[b])
+
+    def _edge_weights(self, a, b):
+        """Стоимости ребра a - b (индексы узлов) с учетом переопределения"""
+        km, score = self._base_weights(a, b)
+        override = self.overrides.get(line_key(self.ids[a], self.ids[b]))
+        return (km, score) if override is None else override.weights(km, score)
+
+    def _refresh_edges(self, node, neighbor=None):
+        """Пересчет стоимостей ребер узла node (или только ребер node - neighbor) в обе стороны"""
+        self._own('edge_km', 'edge_score')
+        lo, hi = self.offsets[node], self.offsets[node + 1]
+        for slot in range(lo, hi):
+            other = int(self.targets[slot])
+            if neighbor is not None and other != neighbor:
+                continue
+            km, score = self._edge_weights(node, other)
+            for edge in (slot, *self._slots(other, node).tolist()):
+                self.edge_km[edge] = km
+                self.edge_score[edge] = score
+        self._changed()
+
+    def set_point(self, point_id, lon, lat, score):
+        """Добавляет точку или меняет ее координаты и score (стоимости ее ребер пересчитываются)"""
+        lon = np.nan if lon is None else lon
+        lat = np.nan if lat is None else lat
+        score = score or 0
+        idx = int(np.searchsorted(self.ids, point_id))
+        if idx < len(self.ids) and self.ids[idx] == point_id:
+            if np.array_equal((self.lon[idx], self.lat[idx], self.score[idx]), (lon, lat, score), equal_nan=True):
+                return
+            self._own('lon', 'lat', 'score')
+            self.lon[idx], self.lat[idx], self.score[idx] = lon, lat, score
+            self._refresh_edges(idx)
+            return
+        self.ids = np.insert(self.ids, idx, point_id)
+        self.lon = np.insert(self.lon, idx, lon)
+        self.lat = np.insert(self.lat, idx, lat)
+        self.score = np.insert(self.score, idx, score)
+        self.offsets = np.insert(self.offsets, idx, self.offsets[idx])
+        self.targets = self.targets + (self.targets >= idx)
+        self._owned.update(('ids', 'lon', 'lat', 'score', 'offsets', 'targets'))
+        self._changed()
+
+    def remove_point(self, point_id):
+        """Удаляет точку вместе с ее линиями"""
+        try:
+            idx = self.index_of(point_id)
+        except KeyError:
+            return
+        for line_id in self.line_ids[(self.line_from == point_id) | (self.line_to == point_id)].tolist():
+            self.remove_line(line_id)
+        self.ids = np.delete(self.ids, idx)
+        self.lon = np.delete(self.lon, idx)
+        self.lat = np.delete(self.lat, idx)
+        self.score = np.delete(self.score, idx)
+        self.offsets = np.delete(self.offsets, idx)
+        self.targets = self.targets - (self.targets > idx)
+        self._owned.update(('ids', 'lon', 'lat', 'score', 'offsets', 'targets'))
+        self._changed()
+
+    def _line_position(self, line_id):
+        """Позиция линии в line_ids или None, если линии нет в графе"""
+        position = int(np.searchsorted(self.line_ids, line_id))
+        if position < len(self.line_ids) and self.line_ids[position] == line_id:
+            return position
+        return None
+
+    def set_line(self, line_id, from_id, to_id):
+        """Добавляет линию (ребра в обе стороны) или переносит ее на новые концы. Повторное применение
+        того же изменения ничего не меняет (линия, уже загруженная с графом, не дублируется);
+        линии на отсутствующие точки в граф не входят"""
+        position = self._line_position(line_id)
+        if position is not None:
+            if (self.line_from[position], self.line_to[position]) == (from_id, to_id):
+                return
+            self.remove_line(line_id)
+        try:
+            a, b = self.index_of(from_id), self.index_of(to_id)
+        except KeyError:
+            return
+        km, score = self._edge_weights(a, b)
+        self._own('offsets')
+        for head, tail in ((a, b), (b, a)):
+            slot = self.offsets[head + 1]
+            self.targets = np.insert(self.targets, slot, tail)
+            self.edge_km = np.insert(self.edge_km, slot, km)
+            self.edge_score = np.insert(self.edge_score, slot, score)
+            self.offsets[head + 1:] += 1
+        position = int(np.searchsorted(self.line_ids, line_id))
+        self.line_ids = np.insert(self.line_ids, position, line_id)
+        self.line_from = np.insert(self.line_from, position, from_id)
+        self.line_to = np.insert(self.line_to, position, to_id)
+        self._owned.update(('targets', 'edge_km', 'edge_score', 'line_ids', 'line_from', 'line_to'))
+        self._changed()
+
+    def remove_line(self, line_id):
+        """Удаляет линию (ребра в обе стороны), если она есть в графе"""
+        position = self._line_position(line_id)
+        if position is None:
+            return
+        a, b = self.index_of(self.line_from[position]), self.index_of(self.line_to[position])
+        self.line_ids = np.delete(self.line_ids, position)
+        self.line_from = np.delete(self.line_from, position)
+        self.line_to = np.delete(self.line_to, position)
+        self._own('offsets')
+        for head, tail in ((a, b), (b, a)):
+            slot = self._slots(head, tail)[-1]
+            self.targets = np.delete(self.targets, slot)
+            self.edge_km = np.delete(self.edge_km, slot)
+            self.edge_score = np.delete(self.edge_score, slot)
+            self.offsets[head + 1:] -= 1
+        self._owned.update(('targets', 'edge_km', 'edge_score', 'line_ids', 'line_from', 'line_to'))
+        self._changed()
+
+    def set_override(self, from_id, to_id, override):
+        """Устанавливает (override=None - снимает) временное переопределение линии"""
+        key = line_key(from_id, to_id)
+        if override is None:
+            if self.overrides.pop(key, None) is None:
+                return
+        else:
+            self.overrides[key] = override
+        try:
+            a, b = self.index_of(from_id), self.index_of(to_id)
+        except KeyError:
+            return
+        self._refresh_edges(a, neighbor=b)
+
+    def expire_overrides(self, now):
+        """Снимает переопределения, срок действия которых истек"""
+        for key, override in list(self.overrides.items()):
+            if override.expires_at <= now:
+                self.set_override(*key, None)
+
+
+class Override(namedtuple('Override', 'km score closed expires_at')):
+    """Временное переопределение линии: стоимость в км и/или баллах (None - обычная)
+    или закрытие (closed), действует до expires_at (unix-время)"""
+    __slots__ = ()
+
+    def weights(self, km, score):
+        """Стоимости линии (км, баллы) с переопределением вместо обычных km, score.
+        Переопределение может только удорожить линию: эвристики поиска (расстояние по прямой,
+        score концов), ориентиры ALT и граф граничных точек тайлов опираются на обычные стоимости
+        и с заниженными весами перестали бы быть нижними оценками"""
+        if self.closed:
+            return float('inf'), float('inf')
+        return (km if self.km is None else max(km, self.km),
+                score if self.score is None else max(score, self.score))
+
+
+def line_key(from_id, to_id):
+    """Ключ неориентированной линии: (меньший id точки, больший id точки)"""
+    from_id, to_id = int(from_id), int(to_id)
+    return (from_id, to_id) if from_id <= to_id else (to_id, from_id)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_recheck_lock = threading.Lock()
+_version = 0
+_version_lock = threading.Lock()
+
+
+def graph_version():
+    """Текущая версия данных графа в этом процессе"""
+    return _version
+
+
+def invalidate_graph(**kwargs):
+    """Помечает закэшированный граф устаревшим: следующий запрос загрузит его целиком"""
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def _outdated(graph, retention):
+    """Граф нужно загрузить заново: после invalidate_graph или если журнал изменений не проверялся
+    дольше срока хранения его записей (нужные графу записи могли быть удалены prune_changes)"""
+    return graph is None or graph.version != _version or \
+        (retention is not None and time.time() - graph.synced_at > retention)
+
+
+def get_graph(line_model, point_model):
+    """Возвращает общий для всех запросов процесса граф.
+    Первая загрузка в процессе берет граф из бинарного снимка (export_graph), если он актуален.
+    Далее изменения точек и линий (в том числе сделанные другими процессами) и временные
+    переопределения линий применяются из журнала изменений (mainapp.changes) к копии графа,
+    которая заменяет текущий; граф загружается заново только после invalidate_graph
+    (или после долгого простоя, см. settings.ROUTING_GRAPH_CHANGES_RETENTION).
+    Журнал проверяется не чаще раза в settings.ROUTING_GRAPH_SYNC_INTERVAL секунд, поэтому
+    в пределах запроса граф стоит получать один раз и передавать дальше"""
+    from django.conf import settings
+    from mainapp.changes import apply_changes, load_graph, pending_changes
+
+    global _graph
+    retention = getattr(settings, 'ROUTING_GRAPH_CHANGES_RETENTION', None)
+    graph = _graph
+    if _outdated(graph, retention):
+        with _graph_lock:
+            if _outdated(_graph, retention):
+                version = _version
+                with phase('graph_load'):
+                    graph = load_graph(line_model, point_model)
+                graph.version = version
+                _graph = graph
+            graph = _graph
+    changes = pending_changes(graph, getattr(settings, 'ROUTING_GRAPH_SYNC_INTERVAL', 1.0))
+    if changes is None:
+        return graph
+    with _graph_lock:
+        if _graph is graph:
+            with phase('graph_update'):
+                _graph = apply_changes(graph, changes, line_model, point_model)
+        return _graph
@@ -0,0 +1,119 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def read_chunks(source, copy_to=None, chunk_size=CHUNK_SIZE):
+    """Текстовые куски JSON из локального файла или URL (без загрузки документа целиком).
+    copy_to - путь, куда по ходу чтения сохраняется копия загруженного по URL документа"""
+    if is_url(source):
+        import requests
+
+        with requests.get(source, stream=True) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            copy = open(copy_to, 'w') if copy_to else None
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+                    if copy:
+                        copy.write(chunk)
+                    yield chunk
+            finally:
+                if copy:
+                    copy.close()
+    else:
+        with open(source) as infile:
+            while True:
+                chunk = infile.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class _Buffer:
+    """Буфер текста поверх итератора кусков с догрузкой по требованию"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Дочитывает следующий кусок; False, если данные закончились"""
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self, skip=WHITESPACE):
+        """Первый символ, не входящий в skip (или '' в конце данных)"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Invalid JSON: expected {char!r} at position {self.pos}')
+        self.pos += 1
+
+    def value(self):
+        """Очередное JSON-значение; при обрыве значения на границе куска дочитывает данные"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            if end == len(self.text) and self.fill():
+                continue  # значение (например, число) могло продолжиться в следующем куске
+            self.pos = end
+            return value
+
+
+def iter_records(chunks):
+    """Потоковый разбор документа вида {"points": [...], "lines": [...]}.
+    Выдает пары (ключ верхнего уровня, элемент массива) в порядке следования в документе,
+    держа в памяти только текущий кусок текста. Значения верхнего уровня, не являющиеся
+    массивами, пропускаются"""
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    while True:
+        char = buffer.peek(WHITESPACE + ',')
+        if char == '}':
+            return
+        if not char:
+            raise ValueError('Invalid JSON: unexpected end of document')
+        key = buffer.value()
+        buffer.expect(':')
+        if buffer.peek() != '[':
+            buffer.value()
+            continue
+        buffer.pos += 1
+        while True:
+            char = buffer.peek(WHITESPACE + ',')
+            if char == ']':
+                buffer.pos += 1
+                break
+            if not char:
+                raise ValueError('Invalid JSON: unexpected end of document')
+            yield key, buffer.value()
+
@@ -0,0 +1,70 @@
+import numpy as np
+
+from mainapp.algorithm import dijkstra
+
+METRICS = ('by_distance', 'by_score')
+
+
+def select_landmarks(graph, count, seed_node=0):
+    """Выбор ориентиров методом наиболее удаленной точки: каждый следующий ориентир -
+    узел с наибольшим расстоянием (в км) до уже выбранных. Узлы других компонент связности
+    (бесконечное расстояние) выбираются в первую очередь"""
+    if not graph.node_count or count <= 0:
+        return []
+    weights = graph.edge_weights('by_distance')
+    nearest = dijkstra(graph, seed_node, weights)
+    landmarks = []
+    while len(landmarks) < min(count, graph.node_count):
+        nearest[landmarks] = -1
+        candidate = int(np.argmax(nearest))
+        if nearest[candidate] < 0:
+            break
+        landmarks.append(candidate)
+        nearest = np.minimum(nearest, dijkstra(graph, candidate, weights))
+    return landmarks
+
+
+def compute_landmark_tables(graph, landmarks):
+    """Расстояния от ориентиров до всех узлов: {способ вычисления: массив (K, n)}"""
+    return {metric: np.array([dijkstra(graph, node, graph.edge_weights(metric)) for node in landmarks],
+                             dtype=np.float64).reshape(len(landmarks), graph.node_count)
+            for metric in METRICS}
+
+
+def save_landmarks(graph, landmarks, tables):
+    """Заменяет сохраненные ориентиры рассчитанными для текущего графа"""
+    from mainapp.models import Landmark
+
+    Landmark.objects.all().delete()
+    Landmark.objects.bulk_create([
+        Landmark(point_id=int(graph.ids[node]), metric=metric, graph_checksum=graph.checksum,
+                 distances=tables[metric][k].tobytes())
+        for metric in METRICS for k, node in enumerate(landmarks)
+    ])
+
+
+def load_landmarks(graph):
+    """Загружает (один раз на граф) таблицы ориентиров, построенные для этой же версии графа.
+    Пока их нет, таблица проверяется заново не чаще раза в PRECOMPUTE_RECHECK_INTERVAL секунд"""
+    if graph.landmarks is None or not graph.landmarks and graph.recheck_due('landmarks'):
+        from mainapp.models import Landmark
+
+        rows = Landmark.objects.filter(graph_checksum=graph.checksum).order_by('metric', 'point_id')
+        tables = {}
+        for metric in METRICS:
+            distances = [np.frombuffer(bytes(row.distances), dtype=np.float64)
+                         for row in rows if row.metric == metric]
+            if distances:
+                tables[metric] = np.vstack(distances)
+        graph.landmarks = tables
+    return graph.landmarks
+
+
+def alt_heuristic(table, goal):
+    """Нижние оценки ALT до узла goal для всех узлов по неравенству треугольника:
+    d(v, goal) >= |d(L, v) - d(L, goal)| для каждого ориентира L (линии неориентированные)"""
+    with np.errstate(invalid='ignore'):
+        bounds = np.abs(table - table[:, goal:goal + 1])
+    # оба узла недостижимы из ориентира - оценка ничего не дает
+    bounds[np.isnan(bounds)] = 0
+    return bounds.max(axis=0)
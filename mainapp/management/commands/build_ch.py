@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mainapp.ch import build_hierarchy, hierarchy_path
+from mainapp.graph import RoutingGraph
+from mainapp.models import Point, Line
+
+
+class Command(BaseCommand):
+    help = 'Строит иерархии сжатия графа для поиска по расстоянию и по баллам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.ROUTING_CH_DIR, help='Каталог для файлов иерархий')
+        parser.add_argument('--witness-limit', type=int, default=64,
+                            help='Максимум узлов при поиске обходных путей во время сжатия')
+
+    def handle(self, *args, **options):
+        """Предрасчет иерархий сжатия. Использование:
+        python manage.py build_ch"""
+        os.makedirs(options['output'], exist_ok=True)
+        graph = RoutingGraph.from_models(Line, Point)
+        for metric in ('by_distance', 'by_score'):
+            hierarchy = build_hierarchy(graph, metric, witness_limit=options['witness_limit'])
+            path = hierarchy_path(options['output'], metric)
+            hierarchy.save(path)
+            print(f'{metric}: {len(hierarchy.targets)} upward edges saved to {path}')
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from mainapp.graph import RoutingGraph
+from mainapp.landmarks import select_landmarks, compute_landmark_tables, save_landmarks
+from mainapp.models import Point, Line
+
+
+class Command(BaseCommand):
+    help = 'Выбирает ориентиры ALT и сохраняет расстояния от них до всех точек (км и баллы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=16, help='Количество ориентиров (K)')
+
+    def handle(self, *args, **options):
+        """Предрасчет эвристики ALT. Использование:
+        python manage.py build_landmarks --count 16"""
+        graph = RoutingGraph.from_models(Line, Point)
+        landmarks = select_landmarks(graph, options['count'])
+        tables = compute_landmark_tables(graph, landmarks)
+        save_landmarks(graph, landmarks, tables)
+        print(f'{len(landmarks)} landmarks saved for {graph.node_count} points (graph {graph.checksum})')
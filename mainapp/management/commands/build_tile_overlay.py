@@ -0,0 +1,26 @@
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mainapp.models import Point, Line
+from mainapp.tiles import DatabaseTileSource, build_overlay, overlay_path
+
+
+class Command(BaseCommand):
+    help = 'Строит граф граничных точек тайлов для поиска длинных маршрутов по тайлам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.ROUTING_TILES['OVERLAY_DIR'],
+                            help='Каталог для файла графа граничных точек')
+
+    def handle(self, *args, **options):
+        """Предрасчет графа граничных точек (тайлы читаются из БД по одному). Использование:
+        python manage.py build_tile_overlay"""
+        os.makedirs(options['output'], exist_ok=True)
+        source = DatabaseTileSource(Line, Point, settings.ROUTING_TILES['SIZE'], overrides=False)
+        overlay = build_overlay(source)
+        path = overlay_path(options['output'])
+        overlay.save(path)
+        edges = len(overlay.adjacency['by_distance'][1])
+        print(f'{len(overlay.ids)} boundary points, {edges} edges saved to {path}')
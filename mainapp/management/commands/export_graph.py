@@ -0,0 +1,26 @@
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mainapp.graph import RoutingGraph
+from mainapp.models import Point, Line
+from mainapp.snapshot import write_snapshot, source_stamp
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет граф маршрутизации в бинарный снимок для быстрого старта воркеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.GRAPH_SNAPSHOT_PATH, help='Путь к файлу снимка')
+
+    def handle(self, *args, **options):
+        """Экспорт снимка графа. Использование:
+        python manage.py export_graph"""
+        path = options['output']
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        stamp = source_stamp(Line, Point)
+        graph = RoutingGraph.from_models(Line, Point)
+        write_snapshot(graph, path, stamp)
+        print(f'Graph snapshot saved to {path}: {graph.node_count} points, '
+              f'{graph.edge_count // 2} lines (graph {graph.checksum})')
@@ -1,64 +1,115 @@
-import requests
+import time
+
+from django.conf import settings
 from django.core.management import BaseCommand
 from django.db import transaction
 from django.contrib.gis.geos import Point as GeoPoint
 from GeoPoints.settings import JSON_LOCAL_PATH
-from mainapp.API import YA_GEOCODER_API_KEY
+from mainapp.changes import record_reload
+from mainapp.geocoding import Geocoder, GeocodeCache, geocoder_api_key
+from mainapp.ingest import is_url, iter_records, read_chunks
 from mainapp.models import Point, Line
-import json
 
 json_path = 'https://datum-test-task.firebaseio.com/api/lines-points.json'
 
 
-def get_json(path):
-    """Получение JSON-данных для БД и сохранение их на диск"""
-    local_path = JSON_LOCAL_PATH
-    if requests.get(path).status_code == 200:
-        json_data = requests.get(path).json()
-        with open(local_path, 'w') as outfile:  # сохранение на всякий случай
-            json.dump(json_data, outfile, indent=4)  # сохранение на всякий случай
-        return json_data
-    else:
-        print(f'JSON request error {requests.get(path).status_code}')
-        return None
+class Command(BaseCommand):
+    help = 'Потоковая загрузка (или обновление) точек и линий из JSON-файла или URL пакетами bulk_create'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=json_path,
+                            help='Путь к локальному JSON-файлу или URL (по умолчанию - datum)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Количество объектов в одном INSERT')
+        parser.add_argument('--no-geocode', action='store_true',
+                            help='Не определять адреса точек')
+        parser.add_argument('--geocoder-url', default=settings.GEOCODER['URL'],
+                            help='Адрес сервиса геокодирования')
+        parser.add_argument('--geocode-concurrency', type=int, default=settings.GEOCODER['CONCURRENCY'],
+                            help='Число одновременных запросов к геокодеру')
+        parser.add_argument('--geocode-rate', type=float, default=settings.GEOCODER['RATE'],
+                            help='Максимум запросов к геокодеру в секунду')
 
-def get_address(long, lat):
-    """Получение адреса по долготе и широте через Yandex GeoCoder API
-    &geocode = <долгота, широта>"""
-    request = (requests.get(f'https://geocode-maps.yandex.ru/1.x/?format=json&apikey={YA_GEOCODER_API_KEY}'
-                            f'&geocode={long},{lat}')).json()
-    address = \
-        request['response']['GeoObjectCollection']['featureMember'][0]['GeoObject']['metaDataProperty'][
-            'GeocoderMetaData'][
-            'text']
-    return address
+    def handle(self, *args, **options):
+        """Наполняет базу. Использование:
+        python manage.py loaddata [--source json_data/json_data.json] [--batch-size 5000] [--no-geocode]
+        Документ читается и разбирается по частям; точки и линии пишутся пакетами
+        с прямой установкой FK (from_point_id / to_point_id) без запросов на каждую линию.
+        Порядок массивов в документе не важен: FK-ограничения PostgreSQL проверяются в конце транзакции.
+        Повторный запуск не падает на уже загруженных id: существующие точки и линии обновляются (upsert).
+        Адреса определяются отдельным этапом после вставки, вне основной транзакции"""
+        with transaction.atomic():
+            counts = self.load(options['source'], options['batch_size'])
+            record_reload()  # bulk_create не вызывает сигналы - воркеры перезагрузят граф целиком
+        if not (counts['points'] or counts['lines']):
+            print('Database fill error. JSON data is empty!')
+            return
+        print('Database objects created!')
+        if not options['no_geocode']:
+            self.geocode(options)
 
+    def load(self, source, batch_size):
+        copy_to = JSON_LOCAL_PATH if is_url(source) else None  # сохранение на всякий случай
+        points, lines = [], []
+        counts = {'points': 0, 'lines': 0}
+        started = time.monotonic()
 
-json_data = get_json(json_path)
+        def flush(model, batch, key, fields):
+            # INSERT ... ON CONFLICT (id) DO UPDATE: повторная загрузка того же документа обновляет записи
+            model.objects.bulk_create(batch, batch_size=batch_size, update_conflicts=True,
+                                      unique_fields=['id'], update_fields=fields)
+            counts[key] += len(batch)
+            batch.clear()
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{counts['points']} points, {counts['lines']} lines "
+                              f"({(counts['points'] + counts['lines']) / elapsed:.0f} objects/s)")
 
+        for key, record in iter_records(read_chunks(source, copy_to=copy_to)):
+            if key == 'points':
+                points.append(Point(
+                    pk=record['obj_id'],
+                    geom=GeoPoint(record['lon'], record['lat']),
+                    score=record['score']
+                ))
+                if len(points) >= batch_size:
+                    flush(Point, points, 'points', ['geom', 'score'])
+            elif key == 'lines':
+                lines.append(Line(
+                    pk=(counts['lines'] + len(lines) + 1),
+                    from_point_id=record['from_obj'],
+                    to_point_id=record['to_obj']
+                ))
+                if len(lines) >= batch_size:
+                    flush(Line, lines, 'lines', ['from_point', 'to_point'])
+        if points:
+            flush(Point, points, 'points', ['geom', 'score'])
+        if lines:
+            flush(Line, lines, 'lines', ['from_point', 'to_point'])
+        return counts
 
-class Command(BaseCommand):
-    @transaction.atomic
-    def handle(self, *args, **options):
-        """Наполняет базу с нуля. Использование:
-        python manage.py loaddata"""
-        if json_data:
-            for point in json_data['points']:
-                new_point = Point(
-                    pk=point['obj_id'],
-                    geom=GeoPoint(point['lon'], point['lat']),
-                    score=point['score'],
-                    address=get_address(point['lon'], point['lat'])
-                )
-                new_point.save()
-            for num, line in enumerate(json_data['lines']):
-                new_line = Line(
-                    pk=(num + 1),
-                    from_point=Point.objects.get(pk=line['from_obj']),
-                    to_point=Point.objects.get(pk=line['to_obj'])
-                )
-                new_line.save()
-            print('Database objects created!')
-        else:
-            print('Database fill error. JSON data is empty!')
+    def geocode(self, options):
+        """Заполнение адресов точек без адреса (повторный запуск продолжает с места остановки).
+        Уже определенные координаты берутся из постоянного кэша settings.GEOCODER['CACHE_PATH']"""
+        batch_size = options['batch_size']
+        geocoder = Geocoder(geocoder_api_key(), url=options['geocoder_url'],
+                            concurrency=options['geocode_concurrency'], rate=options['geocode_rate'],
+                            cache=GeocodeCache(settings.GEOCODER['CACHE_PATH']))
+        started = time.monotonic()
+        done = 0
+        last_id = 0
+        try:
+            while True:
+                batch = list(Point.objects.filter(address__isnull=True, geom__isnull=False, id__gt=last_id)
+                             .order_by('id').values_list('id', 'geom')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                addresses = geocoder.reverse_many([(geom.x, geom.y) for _, geom in batch])
+                Point.objects.bulk_update([Point(id=point_id, address=address)
+                                           for (point_id, _), address in zip(batch, addresses)
+                                           if address is not None], ['address'], batch_size=batch_size)
+                done += len(batch)
+                self.stdout.write(f'{done} points geocoded ({done / (time.monotonic() - started):.0f} points/s, '
+                                  f'{geocoder.cached} cached, {geocoder.failed} failed)')
+        finally:
+            geocoder.close()
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mainapp.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые записи журнала изменений графа (GraphChange)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention', type=float, default=settings.ROUTING_GRAPH_CHANGES_RETENTION,
+                            help='Срок хранения записей в секундах')
+
+    def handle(self, *args, **options):
+        """Прореживание журнала. Использование:
+        python manage.py prune_graph_changes [--retention 86400]"""
+        deleted = prune_changes(options['retention'])
+        print(f'{deleted} graph changes deleted')
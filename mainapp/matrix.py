@@ -0,0 +1,110 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from mainapp.search import get_search_space, search
+
+# граф, с которым работает процесс пула (задается инициализатором; при fork массивы не копируются)
+_worker_graph = None
+
+_pool = None
+_pool_key = None
+_pool_users = {}  # пул -> число идущих в нем route_matrix
+_pool_lock = threading.Lock()
+
+
+def _init_worker(offsets, targets, edge_km, edge_score):
+    global _worker_graph
+    # memoryview без копии: при fork страницы массивов (или снимка numpy.memmap) остаются общими;
+    # веса обоих способов вычисления, чтобы смена метрики не пересоздавала пул
+    _worker_graph = memoryview(offsets), memoryview(targets), \
+        {'by_distance': memoryview(edge_km), 'by_score': memoryview(edge_score)}
+
+
+def _matrix_row(source, goals, with_paths, eval_type='by_distance', graph_lists=None):
+    """Строка матрицы: стоимости (и пути) от source до каждого из goals, None - недостижим"""
+    if graph_lists is None:
+        offsets, targets, weights = _worker_graph
+        graph_lists = offsets, targets, weights[eval_type]
+    offsets, targets, weights = graph_lists
+    space = get_search_space(len(offsets) - 1)
+    search(space, offsets, targets, weights, source, goals)
+    costs = [space.cost(goal) for goal in goals]
+    paths = [space.path(goal) if cost is not None else None for goal, cost in zip(goals, costs)] \
+        if with_paths else None
+    return costs, paths
+
+
+def _cell(graph, eval_type, source, goal, cost, path):
+    """Стоимость ячейки матрицы в единицах маршрутов (path_in_km / path_in_score_points), None - недостижимо"""
+    if cost is None:
+        return None
+    if graph.overrides:
+        # веса поиска включают надбавки переопределений: стоимость считается по самому пути
+        return round(graph.path_measure(path, eval_type), 2)
+    if eval_type == 'by_score':
+        # ребро стоит score обоих концов: внутренние точки пути учтены в cost дважды, концы - по разу
+        cost = (cost + graph.score[source] + graph.score[goal]) / 2
+    return round(float(cost), 2)
+
+
+@contextmanager
+def _leased_pool(graph, workers):
+    """Пул процессов для графа (с весами обоих способов вычисления); пересоздается после изменения графа.
+    Замененный пул закрывается, когда в нем закончатся все начатые до замены матрицы"""
+    global _pool, _pool_key
+    key = (graph.checksum, workers)
+    with _pool_lock:
+        if _pool_key != key:
+            if _pool is not None and not _pool_users.get(_pool):
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(graph.offsets, graph.targets, graph.edge_km, graph.edge_score))
+            _pool_key = key
+        pool = _pool
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users[pool] -= 1
+            if not _pool_users[pool]:
+                del _pool_users[pool]
+                if pool is not _pool:
+                    pool.shutdown(wait=False)
+
+
+def route_matrix(graph, sources, targets, eval_type='by_distance', with_paths=False, workers=None):
+    """Матрица стоимостей маршрутов sources x targets: один поиск Дейкстры на источник,
+    остановка после раскрытия всех целей. Источники распределяются по пулу процессов.
+    Аргументы:
+            graph           - граф маршрутизации (mainapp.graph.RoutingGraph)
+            sources         - id стартовых точек (list)
+            targets         - id конечных точек (list)
+            eval_type       - Способ вычисления (by_distance / by_score)
+            with_paths      - вернуть также пути (списки id точек)
+            workers         - число процессов (None - по числу ядер; 1 - без пула)
+    Возвращает словарь с ключами matrix (стоимости, None - недостижимо) и paths (если with_paths).
+    Стоимости - как path_in_km / path_in_score_points у маршрутов (см. RoutingGraph.path_measure)"""
+    graph.edge_weights(eval_type)  # ValueError при неизвестном способе вычисления
+    source_nodes = graph.indices_of(sources).tolist()
+    goals = graph.indices_of(targets).tolist()
+    workers = workers or os.cpu_count() or 1
+    # при переопределениях стоимости считаются по путям
+    need_paths = with_paths or bool(graph.overrides)
+    if workers > 1 and len(source_nodes) > 1:
+        with _leased_pool(graph, workers) as pool:
+            rows = list(pool.map(_matrix_row, source_nodes, [goals] * len(source_nodes),
+                                 [need_paths] * len(source_nodes), [eval_type] * len(source_nodes)))
+    else:
+        graph_lists = graph.adjacency(eval_type)
+        rows = [_matrix_row(source, goals, need_paths, eval_type, graph_lists) for source in source_nodes]
+
+    result = {'matrix': [[_cell(graph, eval_type, source, goal, cost, paths[column] if paths else None)
+                          for column, (goal, cost) in enumerate(zip(goals, costs))]
+                         for source, (costs, paths) in zip(source_nodes, rows)]}
+    if with_paths:
+        result['paths'] = [[graph.ids[path].tolist() if path is not None else None for path in paths]
+                           for _, paths in rows]
+    return result
@@ -0,0 +1,61 @@
+# Generated by Django 3.1.1
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('point', 'Point added or changed'), ('point_deleted', 'Point deleted'), ('line', 'Line added or changed'), ('line_deleted', 'Line deleted'), ('override', 'Temporary line override'), ('reload', 'Full reload'), ('addresses', 'Point addresses updated')], max_length=16)),
+                ('point_id', models.IntegerField(null=True)),
+                ('lon', models.FloatField(null=True)),
+                ('lat', models.FloatField(null=True)),
+                ('score', models.FloatField(null=True)),
+                ('line_id', models.IntegerField(null=True)),
+                ('from_point_id', models.IntegerField(null=True)),
+                ('to_point_id', models.IntegerField(null=True)),
+                ('km', models.FloatField(null=True)),
+                ('closed', models.BooleanField(default=False)),
+                ('expires_at', models.DateTimeField(db_index=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Point',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.PointField(null=True, srid=4326)),
+                ('score', models.IntegerField(null=True)),
+                ('address', models.TextField(blank=True, max_length=1024, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Line',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_point', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='from_point', to='mainapp.point')),
+                ('to_point', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='to_point', to='mainapp.point')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Landmark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('by_distance', 'Distance (km)'), ('by_score', 'Score points')], max_length=16)),
+                ('graph_checksum', models.CharField(db_index=True, max_length=32)),
+                ('distances', models.BinaryField()),
+                ('point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmarks', to='mainapp.point')),
+            ],
+        ),
+    ]
@@ -1,11 +1,40 @@
 from django.contrib.gis.db import models
 
 
+class PointQuerySet(models.QuerySet):
+    """Массовые изменения точек (update, bulk_update) не вызывают сигналов save, поэтому сами
+    записываются в журнал изменений графа: координаты и score - полной перезагрузкой графа,
+    остальные поля - сменой версии данных точек (ETag списка точек)"""
+
+    @staticmethod
+    def _record(fields):
+        from mainapp.changes import record_addresses, record_reload
+
+        if {'geom', 'score'} & set(fields):
+            record_reload()
+        else:
+            record_addresses()
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            self._record(kwargs)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        if rows:
+            self._record(fields)
+        return rows
+
+
 class Point(models.Model):
     geom = models.PointField(null=True)  # X is longitude and Y is latitude
     score = models.IntegerField(null=True)
     address = models.TextField(max_length=1024, null=True, blank=True)
 
+    objects = PointQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.geom[0]} {self.geom[1]}, score {self.score}'
 
@@ -17,3 +46,55 @@ class Line(models.Model):
     def __str__(self):
         return f'From {self.from_point.geom} (score={self.from_point.score}) ' \
                f'to {self.to_point.geom} (score={self.to_point.score})'
+
+
+class Landmark(models.Model):
+    """Ориентир ALT: расстояния от точки до всех узлов графа маршрутизации.
+    distances - float64-массив в порядке узлов графа (RoutingGraph.ids) с контрольной суммой graph_checksum"""
+    METRIC_CHOICES = (
+        ('by_distance', 'Distance (km)'),
+        ('by_score', 'Score points'),
+    )
+    point = models.ForeignKey(Point, on_delete=models.CASCADE, related_name='landmarks')
+    metric = models.CharField(max_length=16, choices=METRIC_CHOICES)
+    graph_checksum = models.CharField(max_length=32, db_index=True)
+    distances = models.BinaryField()
+
+    def __str__(self):
+        return f'Landmark {self.point_id} ({self.metric})'
+
+
+class GraphChange(models.Model):
+    """Журнал изменений графа маршрутизации. Воркеры применяют записи с id больше последней
+    примененной к своему графу в памяти вместо полной перезагрузки (см. mainapp.changes)"""
+    POINT = 'point'
+    POINT_DELETED = 'point_deleted'
+    LINE = 'line'
+    LINE_DELETED = 'line_deleted'
+    OVERRIDE = 'override'
+    RELOAD = 'reload'
+    ADDRESSES = 'addresses'
+    KIND_CHOICES = (
+        (POINT, 'Point added or changed'),
+        (POINT_DELETED, 'Point deleted'),
+        (LINE, 'Line added or changed'),
+        (LINE_DELETED, 'Line deleted'),
+        (OVERRIDE, 'Temporary line override'),
+        (RELOAD, 'Full reload'),
+        (ADDRESSES, 'Point addresses updated'),
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    point_id = models.IntegerField(null=True)
+    lon = models.FloatField(null=True)
+    lat = models.FloatField(null=True)
+    score = models.FloatField(null=True)
+    line_id = models.IntegerField(null=True)
+    from_point_id = models.IntegerField(null=True)
+    to_point_id = models.IntegerField(null=True)
+    km = models.FloatField(null=True)
+    closed = models.BooleanField(default=False)
+    expires_at = models.DateTimeField(null=True, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk}'
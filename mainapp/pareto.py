@@ -0,0 +1,40 @@
+import numpy as np
+
+from mainapp.algorithm import lower_bounds
+from mainapp.search import get_search_space, search
+
+
+def compromise_paths(graph, start, goal, count=3, exclude=()):
+    """Компромиссные маршруты между кратчайшим и самым дешевым: поиск A* по смешанным весам
+    t * km / средний_km + (1 - t) * score / средний_score для count значений t, равномерно в (0, 1)
+    (смесь допустимых эвристик обоих способов - тоже допустимая эвристика).
+    Возвращает недоминируемые по (км, баллы) пути без повторов, кроме путей из exclude:
+    список словарей {path (индексы узлов), path_in_km, path_in_score_points, weight (t)}"""
+    offsets, targets, _ = graph.adjacency('by_distance')
+    # масштабы по средним конечным весам ребер, чтобы t не зависел от единиц измерения
+    finite = np.isfinite(graph.edge_km)
+    km_scale = float(graph.edge_km[finite].mean()) if finite.any() else 1.0
+    score_scale = float(graph.edge_score[finite].mean()) if finite.any() else 1.0
+    km_scale, score_scale = km_scale or 1.0, score_scale or 1.0
+    distance_bounds = lower_bounds(graph, 'by_distance', goal)
+    score_bounds = lower_bounds(graph, 'by_score', goal)
+    space = get_search_space(graph.node_count)
+    seen = {tuple(path) for path in exclude}
+    candidates = []
+    for t in np.linspace(0, 1, count + 2)[1:-1].tolist():
+        a, b = t / km_scale, (1 - t) / score_scale
+        weights = (a * graph.edge_km + b * graph.edge_score).tolist()
+        space.heuristic_view(graph.node_count)[:] = a * distance_bounds + b * score_bounds
+        path = space.path(search(space, offsets, targets, weights, start, (goal,), heuristic=True))
+        if path[-1] != goal or tuple(path) in seen:
+            continue
+        seen.add(tuple(path))
+        candidates.append({'path': path, 'path_in_km': round(graph.path_km(path), 2),
+                           'path_in_score_points': round(graph.path_score(path), 2),
+                           'weight': round(t, 3)})
+    return [route for route in candidates
+            if not any(other is not route and other['path_in_km'] <= route['path_in_km'] and
+                       other['path_in_score_points'] <= route['path_in_score_points'] and
+                       (other['path_in_km'], other['path_in_score_points']) !=
+                       (route['path_in_km'], route['path_in_score_points'])
+                       for other in candidates)]
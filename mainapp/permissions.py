@@ -0,0 +1,9 @@
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+
+class IsOperatorOrReadOnly(BasePermission):
+    """Чтение - всем, изменение - только операторам (пользователям с is_staff): переопределения линий
+    меняют маршруты всех пользователей"""
+
+    def has_permission(self, request, view):
+        return request.method in SAFE_METHODS or bool(request.user and request.user.is_staff)
@@ -0,0 +1,218 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Профиль текущего запроса (None - профилирование выключено или вызов вне запроса)
+_profile = contextvars.ContextVar('routing_profile', default=None)
+
+# Границы корзин гистограмм, секунды (как в клиентах Prometheus по умолчанию)
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 10000, 100000, 1000000)
+
+
+class RequestProfile:
+    """Замеры одного запроса: длительность фаз (секунды) и счетчики"""
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing: фаза;dur=миллисекунды"""
+        return ', '.join(f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.phases.items())
+
+
+class _Phase:
+    __slots__ = ('profile', 'name', 'started')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profile.add_phase(self.name, perf_counter() - self.started)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """Контекстный менеджер замера фазы; без активного профиля ничего не делает"""
+    profile = _profile.get()
+    return _NO_PHASE if profile is None else _Phase(profile, name)
+
+
+def count(name, value=1):
+    """Добавляет значение к счетчику текущего запроса (если профилирование включено)"""
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(name, value)
+
+
+def count_search(search_stats):
+    """Переносит счетчики поиска (nodes_expanded, nodes_pushed, ...) в профиль запроса"""
+    profile = _profile.get()
+    if profile is not None:
+        for name, value in search_stats.items():
+            profile.add(name, value)
+
+
+def start_profile():
+    """Начинает профиль запроса; возвращает (профиль, токен для finish_profile)"""
+    profile = RequestProfile()
+    return profile, _profile.set(profile)
+
+
+def finish_profile(token):
+    _profile.reset(token)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus (накопительные корзины, сумма и количество)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Агрегированные метрики процесса по всем профилированным запросам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.queries = Histogram(COUNT_BUCKETS)
+        self.requests = 0
+
+    def record(self, profile, queries):
+        with self._lock:
+            self.requests += 1
+            self.queries.observe(queries)
+            for name, seconds in profile.phases.items():
+                self.phases.setdefault(name, Histogram(SECONDS_BUCKETS)).observe(seconds)
+            for name, value in profile.counters.items():
+                self.counters.setdefault(name, Histogram(COUNT_BUCKETS)).observe(value)
+
+    @staticmethod
+    def _histogram_lines(metric, histogram, labels=''):
+        prefix = f'{labels},' if labels else ''
+        lines = [f'{metric}_bucket{{{prefix}le="{bound}"}} {value}'
+                 for bound, value in zip(histogram.buckets, histogram.counts)]
+        lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.total}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{metric}_sum{suffix} {histogram.sum}')
+        lines.append(f'{metric}_count{suffix} {histogram.total}')
+        return lines
+
+    def render(self, extra_gauges=None):
+        """Текстовый формат экспозиции Prometheus"""
+        with self._lock:
+            lines = ['# HELP geopoints_requests_profiled_total Profiled requests.',
+                     '# TYPE geopoints_requests_profiled_total counter',
+                     f'geopoints_requests_profiled_total {self.requests}',
+                     '# HELP geopoints_phase_seconds Time spent in each routing phase per request.',
+                     '# TYPE geopoints_phase_seconds histogram']
+            for name, histogram in sorted(self.phases.items()):
+                lines += self._histogram_lines('geopoints_phase_seconds', histogram, f'phase="{name}"')
+            lines += ['# HELP geopoints_db_queries Database queries per profiled request.',
+                      '# TYPE geopoints_db_queries histogram']
+            lines += self._histogram_lines('geopoints_db_queries', self.queries)
+            for name, histogram in sorted(self.counters.items()):
+                lines += [f'# HELP geopoints_{name} {name} per profiled request.',
+                          f'# TYPE geopoints_{name} histogram']
+                lines += self._histogram_lines(f'geopoints_{name}', histogram)
+        for name, value in sorted((extra_gauges or {}).items()):
+            lines += [f'# TYPE geopoints_{name} gauge', f'geopoints_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RoutingProfilingMiddleware:
+    """Профилирование запросов: фазы маршрутизации в заголовке Server-Timing, число SQL-запросов
+    и агрегированные метрики для api/metrics. Выключается настройкой ROUTING_PROFILING = False.
+    Работает и в синхронной, и в асинхронной цепочке (ASGI): под ASGI Django не оборачивает
+    ее в sync_to_async, и async-представления не теряют своих преимуществ"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from django.conf import settings
+        from django.core.exceptions import MiddlewareNotUsed
+
+        if not getattr(settings, 'ROUTING_PROFILING', True):
+            raise MiddlewareNotUsed  # Django исключает middleware из цепочки: без профиля phase() - пустышка
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def profiling(self):
+        """Профиль и счетчик SQL-запросов на время обработки запроса"""
+        from django.db import connection
+
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        profile, token = start_profile()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield profile, queries
+        finally:
+            finish_profile(token)
+
+    @staticmethod
+    def finish(response, profile, queries):
+        if profile.phases:
+            response['Server-Timing'] = profile.server_timing()
+            registry.record(profile, queries[0])
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.profiling() as (profile, queries):
+            response = self.get_response(request)
+        return self.finish(response, profile, queries)
+
+    async def __acall__(self, request):
+        with self.profiling() as (profile, queries):
+            response = await self.get_response(request)
+        return self.finish(response, profile, queries)
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+
+from mainapp.search import get_search_space, search
+
+
+def reachable(graph, source, eval_type, budget, search_stats=None):
+    """Узлы, достижимые из узла source (индекс) в пределах бюджета, одним ограниченным поиском Дейкстры:
+    узлы дороже бюджета в очередь не попадают, поэтому поиск заканчивается на границе бюджета.
+    Стоимость by_distance - длина пути в км, by_score - сумма score точек пути (как path_in_km /
+    path_in_score_points у маршрутов). При действующих переопределениях линий бюджет сравнивается
+    со стоимостью с их надбавками, а в результат идет стоимость самого найденного пути (как у маршрутов).
+    Возвращает массивы индексов узлов (по возрастанию стоимости) и их стоимостей"""
+    offsets, targets, weights = graph.adjacency(eval_type)
+    score = graph.score
+    if eval_type == 'by_distance':
+        max_cost = budget
+    else:
+        # ребро стоит score[a] + score[b], поэтому стоимость пути по ребрам g до узла t связана с суммой
+        # score точек пути как (g + score[source] + score[t]) / 2; граница поиска - при наименьшем score[t]
+        max_cost = 2 * budget - score[source] - min(0.0, float(score.min()))
+    space = get_search_space(graph.node_count)
+    search(space, offsets, targets, weights, source, search_stats=search_stats, max_cost=max_cost)
+    costs = space.costs(graph.node_count)
+    if eval_type == 'by_score':
+        costs = (costs + score[source] + score) / 2
+    nodes = np.flatnonzero(costs <= budget)
+    nodes = nodes[np.argsort(costs[nodes], kind='stable')]
+    if graph.overrides:
+        measures = _path_measures(graph, space, source, nodes, eval_type)
+        order = np.argsort(measures, kind='stable')
+        return nodes[order], measures[order]
+    return nodes, costs[nodes]
+
+
+def _path_measures(graph, space, source, nodes, eval_type):
+    """Стоимости путей дерева последнего поиска до узлов nodes без надбавок переопределений
+    (RoutingGraph.path_measure каждого пути, но за один проход по дереву)"""
+    parent = space.parent
+    lon, lat, score = graph.lon.tolist(), graph.lat.tolist(), graph.score.tolist()
+    measures = {source: score[source] if eval_type == 'by_score' else 0.0}
+    for node in nodes.tolist():
+        chain = []
+        while node not in measures:
+            chain.append(node)
+            node = parent[node]
+        value = measures[node]
+        for child in reversed(chain):
+            if eval_type == 'by_score':
+                value += score[child]
+            else:
+                value += math.hypot(lon[child] - lon[node], lat[child] - lat[node]) * 100
+            measures[child] = value
+            node = child
+    return np.array([measures[node] for node in nodes.tolist()], dtype=np.float64)
+
+
+def convex_hull(lon, lat):
+    """Выпуклая оболочка точек (алгоритм монотонной цепочки): замкнутый список [lon, lat]
+    против часовой стрелки или None, если точки лежат на одной прямой"""
+    points = sorted(set(zip(lon.tolist(), lat.tolist())))
+    if len(points) < 3:
+        return None
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    def chain(sequence):
+        hull = []
+        for point in sequence:
+            while len(hull) >= 2 and cross(hull[-2], hull[-1], point) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+
+    hull = chain(points) + chain(reversed(points))
+    if len(hull) < 3:
+        return None
+    return [list(point) for point in hull + hull[:1]]
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+from mainapp.algorithm import best_path_by, routing_engine
+from mainapp.graph import get_graph
+from mainapp.tiles import get_tile_router, uses_tiles
+
+# Линии неориентированные, а стоимости ребер симметричны для обоих способов вычисления
+# (расстояние и score[a] + score[b]), поэтому пары (a, b) и (b, a) обслуживаются одной записью
+SYMMETRIC_EVAL_TYPES = ('by_distance', 'by_score')
+
+
+class RouteCache:
+    """Кэш результатов best_path_by: ограниченный LRU в памяти процесса и (опционально)
+    общий Django-кэш вторым уровнем. Ключ включает контрольную сумму графа,
+    поэтому после изменения точек или линий старые записи перестают находиться,
+    и движок поиска (результаты и nodes_expanded у движков разные).
+    Аргументы:
+            maxsize         - максимальное число записей в памяти процесса
+            backend         - Django-кэш второго уровня (django.core.cache.caches[alias]) или None
+            timeout         - время жизни записей во втором уровне, секунд"""
+
+    def __init__(self, maxsize=1024, backend=None, timeout=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(start_point, end_point, eval_type, version, engine='astar'):
+        """Ключ записи и признак того, что запрошенный маршрут обратен сохраненному"""
+        reverse = eval_type in SYMMETRIC_EVAL_TYPES and start_point > end_point
+        if reverse:
+            start_point, end_point = end_point, start_point
+        return f'route:{engine}:{eval_type}:{start_point}:{end_point}:{version}', reverse
+
+    @staticmethod
+    def _reversed(result):
+        result = dict(result, start_point=result['end_point'], end_point=result['start_point'])
+        result['path'] = result['path'][::-1]
+        return result
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, start_point, end_point, eval_type, version, compute, engine='astar'):
+        """Результат из кэша или compute(start_point, end_point) с сохранением в кэш"""
+        key, reverse = self.make_key(start_point, end_point, eval_type, version, engine)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if result is None and self.backend is not None:
+            result = self.backend.get(key)
+            if result is not None:
+                with self._lock:
+                    self.backend_hits += 1
+                self._remember(key, result)
+        if result is None:
+            with self._lock:
+                self.misses += 1
+            if reverse:
+                result = self._reversed(compute(end_point, start_point))
+            else:
+                result = compute(start_point, end_point)
+            path = result['path']
+            if path[0] != result['start_point'] or path[-1] != result['end_point']:
+                return result  # цель недостижима: частичный путь не симметричен и не кэшируется
+            # в кэше маршрут хранится в каноническом направлении (от меньшего id к большему)
+            stored = self._reversed(result) if reverse else result
+            self._remember(key, stored)
+            if self.backend is not None:
+                self.backend.set(key, stored, self.timeout)
+            return result
+        return self._reversed(result) if reverse else result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            size = len(self._entries)
+        requests = self.hits + self.backend_hits + self.misses
+        return {'size': size, 'maxsize': self.maxsize, 'hits': self.hits, 'backend_hits': self.backend_hits,
+                'misses': self.misses, 'hit_ratio': round((self.hits + self.backend_hits) / requests, 4)
+                if requests else 0.0}
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Кэш маршрутов процесса, настроенный по settings.ROUTE_CACHE"""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                from django.conf import settings
+                from django.core.cache import caches
+
+                options = getattr(settings, 'ROUTE_CACHE', {})
+                alias = options.get('BACKEND')
+                _route_cache = RouteCache(maxsize=options.get('MAXSIZE', 1024),
+                                          backend=caches[alias] if alias else None,
+                                          timeout=options.get('TIMEOUT'))
+    return _route_cache
+
+
+def cached_best_path_by(start_point, end_point, line_model, point_model, eval_type='by_distance', engine=None,
+                        graph=None):
+    """best_path_by с кэшированием результата (аргументы те же)"""
+    if uses_tiles(engine):
+        router = get_tile_router(line_model, point_model)
+        router.sync()
+        version = router.version
+    else:
+        if graph is None:
+            graph = get_graph(line_model, point_model)
+        version = graph.checksum
+    return get_route_cache().get_or_compute(
+        start_point, end_point, eval_type, version,
+        lambda a, b: best_path_by(a, b, line_model, point_model, eval_type=eval_type, engine=engine, graph=graph),
+        engine=routing_engine(engine))
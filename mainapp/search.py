@@ -0,0 +1,160 @@
+import threading
+from array import array
+from heapq import heappush, heappop
+
+import numpy as np
+
+INF = float('inf')
+
+
+class SearchSpace:
+    """Переиспользуемое состояние поиска по плотным индексам узлов 0..n-1.
+    Массивы выделяются один раз и не очищаются между поисками: значение узла действительно,
+    только если его отметка reached (closed) равна номеру текущего поиска generation.
+    Атрибуты:
+            g               - стоимость лучшего найденного пути от старта (float64)
+            h               - эвристика до цели (float64, заполняется через heuristic_view)
+            parent          - предыдущий узел пути (-1 у стартового)
+            reached         - номер поиска, в котором узел достигнут
+            closed          - номер поиска, в котором узел раскрыт"""
+
+    def __init__(self, node_count):
+        self.node_count = 0
+        self.generation = 0
+        self.g = array('d')
+        self.h = array('d')
+        self.parent = array('q')
+        self.reached = array('Q')
+        self.closed = array('Q')
+        self.resize(node_count)
+
+    def resize(self, node_count):
+        """Дополняет массивы до node_count узлов (уменьшение не требуется)"""
+        extra = node_count - self.node_count
+        if extra > 0:
+            self.g.extend(array('d', bytes(8 * extra)))
+            self.h.extend(array('d', bytes(8 * extra)))
+            self.parent.extend(array('q', bytes(8 * extra)))
+            self.reached.extend(array('Q', bytes(8 * extra)))
+            self.closed.extend(array('Q', bytes(8 * extra)))
+            self.node_count = node_count
+
+    def next_generation(self):
+        """Начинает новый поиск: все узлы становятся недостигнутыми без очистки массивов"""
+        self.generation += 1
+        return self.generation
+
+    def heuristic_view(self, node_count):
+        """numpy-представление первых node_count элементов h без копирования
+        (для векторного заполнения эвристики)"""
+        return np.frombuffer(self.h, dtype=np.float64, count=node_count)
+
+    def cost(self, node):
+        """Стоимость пути до раскрытого в последнем поиске узла или None"""
+        if self.closed[node] != self.generation:
+            return None
+        return self.g[node]
+
+    def path(self, node):
+        """Путь от старта последнего поиска до достигнутого узла (список индексов) или None"""
+        if self.reached[node] != self.generation:
+            return None
+        parent = self.parent
+        path = []
+        while node != -1:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+    def costs(self, node_count):
+        """Стоимости до узлов 0..node_count-1 после полного поиска (float64-массив, недостижимые - inf)"""
+        result = np.frombuffer(self.g, dtype=np.float64, count=node_count).copy()
+        closed = np.frombuffer(self.closed, dtype=np.uint64, count=node_count)
+        result[closed != self.generation] = np.inf
+        return result
+
+
+_spaces = threading.local()
+
+
+def get_search_space(node_count):
+    """Состояние поиска текущего потока, расширенное до node_count узлов"""
+    space = getattr(_spaces, 'space', None)
+    if space is None:
+        space = _spaces.space = SearchSpace(node_count)
+    else:
+        space.resize(node_count)
+    return space
+
+
+def search(space, offsets, targets, weights, source, goals=None, heuristic=False, search_stats=None,
+           max_cost=INF):
+    """Поиск A* (без эвристики - Дейкстра) от узла source по CSR-представлению графа.
+    Узлы кучи - кортежи (f, seq, idx): seq разрешает равенство f в порядке добавления,
+    устаревшие записи (узел уже раскрыт с меньшей стоимостью) пропускаются при извлечении.
+    Аргументы:
+            space           - SearchSpace не меньше числа узлов графа; результат читается из него
+                              (space.path, space.cost) до следующего поиска
+            offsets, targets, weights - CSR-представление графа: списки Python или memoryview
+                              (RoutingGraph.adjacency); numpy-массивы тоже подходят, но медленнее
+            source          - индекс стартового узла
+            goals           - индексы целей: поиск останавливается, когда все они раскрыты
+                              (один ко многим); None - полный обход графа
+            heuristic       - использовать эвристику space.h (допустимая оценка до единственной цели)
+            search_stats    - словарь счетчиков (nodes_expanded, nodes_pushed, stale_skipped, peak_open)
+            max_cost        - узлы дороже не достигаются (поиск в пределах бюджета)
+    Возвращает раскрытую цель или (если цели недостижимы) достигнутый узел с минимальной эвристикой"""
+    generation = space.next_generation()
+    g, h, parent, reached, closed = space.g, space.h, space.parent, space.reached, space.closed
+    wanted = set(goals) if goals is not None else ()
+    remaining = len(wanted)
+    g[source] = 0.0
+    parent[source] = -1
+    reached[source] = generation
+    start_h = h[source] if heuristic else 0.0
+    best, best_h = source, start_h
+    nodes_heap = [(start_h, 0, source)]
+    seq = expanded = stale = 0
+    pushed = peak_open = 1
+    while nodes_heap:
+        node = heappop(nodes_heap)[2]
+        if closed[node] == generation:
+            stale += 1  # узел уже раскрыт по более дешевой записи
+            continue
+        closed[node] = generation
+        expanded += 1
+        if node in wanted:
+            best = node
+            remaining -= 1
+            if not remaining:
+                break
+        base = g[node]
+        for slot in range(offsets[node], offsets[node + 1]):
+            i = targets[slot]
+            new_g = base + weights[slot]
+            if reached[i] != generation:
+                if new_g > max_cost or new_g == INF:
+                    continue  # за пределами бюджета или закрытая линия (см. mainapp.changes)
+                reached[i] = generation
+                neighbor_h = h[i] if heuristic else 0.0
+                if neighbor_h < best_h:
+                    best, best_h = i, neighbor_h
+            elif new_g < g[i]:
+                closed[i] = 0  # более дешевый путь к раскрытому узлу - раскрываем повторно
+                neighbor_h = h[i] if heuristic else 0.0
+            else:
+                continue
+            g[i] = new_g
+            parent[i] = node
+            seq += 1
+            heappush(nodes_heap, (new_g + neighbor_h, seq, i))
+            pushed += 1
+        if len(nodes_heap) > peak_open:
+            peak_open = len(nodes_heap)
+    if search_stats is not None:
+        search_stats['nodes_expanded'] += expanded
+        search_stats['nodes_pushed'] += pushed
+        search_stats['stale_skipped'] += stale
+        search_stats['peak_open'] = max(search_stats['peak_open'], peak_open)
+    return best
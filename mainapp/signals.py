@@ -0,0 +1,47 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from mainapp.changes import record_addresses, record_line, record_line_deleted, record_point, record_point_deleted
+from mainapp.models import Point, Line
+
+
+@receiver(post_save, sender=Point)
+def point_saved(sender, instance, update_fields=None, **kwargs):
+    """Изменение координат или score точки попадает в журнал изменений графа маршрутизации;
+    изменение только других полей (адреса) меняет версию данных точек без изменения графа"""
+    if update_fields is not None and not {'geom', 'score'} & set(update_fields):
+        record_addresses()
+        return
+    record_point(instance)
+
+
+@receiver(post_delete, sender=Point)
+def point_deleted(sender, instance, **kwargs):
+    record_point_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=Line)
+def line_saving(sender, instance, **kwargs):
+    """Запоминает прежние концы линии, чтобы в журнал попало перемещение, а не только новая линия"""
+    instance._graph_old_ends = None
+    if instance.pk is not None:
+        instance._graph_old_ends = Line.objects.filter(pk=instance.pk) \
+            .values_list('from_point_id', 'to_point_id').first()
+
+
+@receiver(post_save, sender=Line)
+def line_saved(sender, instance, **kwargs):
+    old_ends = getattr(instance, '_graph_old_ends', None)
+    new_ends = (instance.from_point_id, instance.to_point_id)
+    if old_ends == new_ends:
+        return
+    if None not in new_ends:
+        record_line(instance.pk, *new_ends)
+    elif old_ends is not None and None not in old_ends:
+        record_line_deleted(instance.pk)  # линия без одного из концов в граф не входит
+
+
+@receiver(post_delete, sender=Line)
+def line_deleted(sender, instance, **kwargs):
+    if instance.from_point_id is not None and instance.to_point_id is not None:
+        record_line_deleted(instance.pk)
@@ -0,0 +1,136 @@
+import numpy as np
+
+
+class GridIndex:
+    """Пространственный индекс узлов графа: равномерная сетка по координатам, узлы отсортированы
+    по номеру ячейки (ячейки одной строки сетки - непрерывный диапазон узлов).
+    Ближайший узел ищется по кольцам ячеек вокруг точки запроса, пока расстояние до
+    непросмотренных колец не превысит найденное. Узлы без координат не индексируются.
+    Аргументы:
+            lon, lat        - координаты узлов (RoutingGraph.lon, RoutingGraph.lat)
+            nodes_per_cell  - среднее число узлов в ячейке"""
+
+    def __init__(self, lon, lat, nodes_per_cell=4):
+        self.lon = lon
+        self.lat = lat
+        valid = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+        self.size = len(valid)
+        if not self.size:
+            return
+        self.valid = valid
+        self.min_lon, self.min_lat = float(lon[valid].min()), float(lat[valid].min())
+        span = max(float(lon[valid].max()) - self.min_lon, float(lat[valid].max()) - self.min_lat, 1e-9)
+        self.side = max(1, int(np.sqrt(self.size / nodes_per_cell)))
+        self.cell = span / self.side
+        self.max_lon, self.max_lat = self.min_lon + span, self.min_lat + span
+        keys = self._row(lat[valid]) * self.side + self._column(lon[valid])
+        order = np.argsort(keys, kind='stable')
+        self.nodes = valid[order]
+        self.starts = np.searchsorted(keys[order], np.arange(self.side * self.side + 1))
+
+    def _column(self, lon):
+        return np.clip(((lon - self.min_lon) // self.cell).astype(np.int64), 0, self.side - 1)
+
+    def _row(self, lat):
+        return np.clip(((lat - self.min_lat) // self.cell).astype(np.int64), 0, self.side - 1)
+
+    def _gap(self, lon, lat, column, row, ring):
+        """Нижняя оценка расстояния (в градусах) от точки до узлов ячеек за пределами
+        квадрата ring вокруг (column, row); inf - квадрат покрывает всю сетку"""
+        bounds = []
+        if column - ring > 0:
+            bounds.append(lon - (self.min_lon + (column - ring) * self.cell))
+        if column + ring < self.side - 1:
+            bounds.append(self.min_lon + (column + ring + 1) * self.cell - lon)
+        if row - ring > 0:
+            bounds.append(lat - (self.min_lat + (row - ring) * self.cell))
+        if row + ring < self.side - 1:
+            bounds.append(self.min_lat + (row + ring + 1) * self.cell - lat)
+        return max(0.0, min(bounds)) if bounds else float('inf')
+
+    def nearest(self, lon, lat):
+        """Индекс ближайшего узла и расстояние до него в градусах; (None, inf), если индекс пуст"""
+        if not self.size:
+            return None, float('inf')
+        if not (self.min_lon <= lon <= self.max_lon and self.min_lat <= lat <= self.max_lat):
+            # вне сетки кольца пришлось бы перебирать почти все - дешевле один векторный проход
+            distances = np.hypot(self.lon[self.valid] - lon, self.lat[self.valid] - lat)
+            k = int(distances.argmin())
+            return int(self.valid[k]), float(distances[k])
+        column = int(self._column(np.float64(lon)))
+        row = int(self._row(np.float64(lat)))
+        best, best_distance = None, float('inf')
+        ring = 0
+        while True:
+            ranges = []
+            for y in range(max(0, row - ring), min(self.side, row + ring + 1)):
+                if abs(y - row) == ring:
+                    ranges.append((y, max(0, column - ring), min(self.side - 1, column + ring)))
+                else:
+                    for x in (column - ring, column + ring):
+                        if 0 <= x < self.side:
+                            ranges.append((y, x, x))
+            for y, x0, x1 in ranges:
+                nodes = self.nodes[self.starts[y * self.side + x0]:self.starts[y * self.side + x1 + 1]]
+                if len(nodes):
+                    distances = np.hypot(self.lon[nodes] - lon, self.lat[nodes] - lat)
+                    k = int(distances.argmin())
+                    if distances[k] < best_distance:
+                        best, best_distance = int(nodes[k]), float(distances[k])
+            if best is not None and best_distance <= self._gap(lon, lat, column, row, ring):
+                return best, best_distance
+            ring += 1
+
+
+def get_snap_index(graph):
+    """Пространственный индекс узлов графа (строится один раз на граф)"""
+    if graph.snap_index is None:
+        graph.snap_index = GridIndex(graph.lon, graph.lat)
+    return graph.snap_index
+
+
+def _nearest_in_db(point_model, lon, lat):
+    """Ближайшая к координатам точка по индексу PostGIS (оператор KNN <->): (id, lon, lat) или None"""
+    from django.contrib.gis.db.models.functions import GeometryDistance
+    from django.contrib.gis.geos import Point as GeoPoint
+
+    nearest = point_model.objects.filter(geom__isnull=False) \
+        .order_by(GeometryDistance('geom', GeoPoint(lon, lat, srid=4326))).values_list('id', 'geom').first()
+    return None if nearest is None else (nearest[0], nearest[1].x, nearest[1].y)
+
+
+def snap_points(graph, coordinates, point_model=None, max_distance=None):
+    """Привязка координат к ближайшим узлам графа.
+    Аргументы:
+            graph           - граф маршрутизации (mainapp.graph.RoutingGraph) или None - ближайшие точки
+                              ищутся в БД по индексу PostGIS, без загрузки графа (поиск по тайлам)
+            coordinates     - список пар (lon, lat)
+            point_model     - Django-модель точки (нужна, если graph не задан)
+            max_distance    - максимальное расстояние привязки (в км, как path_in_km); дальше - None
+    Возвращает для каждой пары словарь {point, lon, lat, snap_km} (координаты - узла графа) или None"""
+    index = get_snap_index(graph) if graph is not None else None
+    result = []
+    for lon, lat in coordinates:
+        if index is not None:
+            node, _ = index.nearest(lon, lat)
+            nearest = None if node is None else (int(graph.ids[node]), float(graph.lon[node]), float(graph.lat[node]))
+        else:
+            nearest = _nearest_in_db(point_model, lon, lat)
+        if nearest is None:
+            result.append(None)
+            continue
+        point_id, node_lon, node_lat = nearest
+        snap_km = float(np.hypot(node_lon - lon, node_lat - lat) * 100)
+        if max_distance is not None and snap_km > max_distance:
+            result.append(None)
+            continue
+        result.append({'point': point_id, 'lon': node_lon, 'lat': node_lat, 'snap_km': round(snap_km, 4)})
+    return result
+
+
+def parse_coordinates(value):
+    """Пара (lon, lat) из строки "lon,lat"; ValueError при неверном формате"""
+    lon, lat = (float(part) for part in value.split(','))
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError(value)
+    return lon, lat
@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+
+from mainapp.graph import RoutingGraph
+
+# Формат файла: MAGIC, заголовок JSON (дополненный пробелами до HEADER_SIZE байт), затем массивы
+# в порядке SECTIONS, каждый выровнен по 8 байт. Заголовок: версия формата, размеры графа,
+# контрольная сумма графа, отметка источника данных и смещения массивов в файле.
+MAGIC = b'GEOPTSGR'
+FORMAT_VERSION = 3
+HEADER_SIZE = 4096
+SECTIONS = (
+    ('ids', '<i8', 'nodes'),
+    ('lon', '<f8', 'nodes'),
+    ('lat', '<f8', 'nodes'),
+    ('score', '<f8', 'nodes'),
+    ('offsets', '<i8', 'offsets'),
+    ('targets', '<i8', 'edges'),
+    ('edge_km', '<f8', 'edges'),
+    ('edge_score', '<f8', 'edges'),
+    ('line_ids', '<i8', 'lines'),
+    ('line_from', '<i8', 'lines'),
+    ('line_to', '<i8', 'lines'),
+)
+
+
+def source_stamp(line_model, point_model):
+    """Отметка состояния БД, по которой определяется, что снимок устарел:
+    количество и максимальные id точек и линий и последняя запись журнала изменений графа
+    (кроме временных переопределений линий, которые применяются к графу после загрузки, и адресов)"""
+    from django.db.models import Count, Max
+    from mainapp.changes import latest_change_id
+    from mainapp.models import GraphChange
+
+    points = point_model.objects.aggregate(count=Count('id'), max_id=Max('id'))
+    lines = line_model.objects.aggregate(count=Count('id'), max_id=Max('id'))
+    return f"points:{points['count']}:{points['max_id']}:lines:{lines['count']}:{lines['max_id']}" \
+           f":changes:{latest_change_id((GraphChange.OVERRIDE, GraphChange.ADDRESSES))}"
+
+
+def _lengths(graph):
+    return {'nodes': graph.node_count, 'offsets': graph.node_count + 1, 'edges': graph.edge_count,
+            'lines': len(graph.line_ids)}
+
+
+def write_snapshot(graph, path, stamp):
+    """Запись бинарного снимка графа (атомарно, через временный файл)"""
+    lengths = _lengths(graph)
+    sections, position = {}, len(MAGIC) + HEADER_SIZE
+    for name, dtype, length in SECTIONS:
+        sections[name] = position
+        position += lengths[length] * np.dtype(dtype).itemsize
+    header = json.dumps({'format_version': FORMAT_VERSION, 'nodes': lengths['nodes'], 'edges': lengths['edges'],
+                         'lines': lengths['lines'],
+                         'checksum': graph.checksum, 'stamp': stamp, 'sections': sections}).encode()
+    if len(header) > HEADER_SIZE:
+        raise ValueError('Snapshot header is too long')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(header.ljust(HEADER_SIZE))
+        for name, dtype, _ in SECTIONS:
+            outfile.write(np.ascontiguousarray(getattr(graph, name), dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Заголовок снимка или None, если файла нет или формат не поддерживается"""
+    try:
+        with open(path, 'rb') as infile:
+            if infile.read(len(MAGIC)) != MAGIC:
+                return None
+            header = json.loads(infile.read(HEADER_SIZE))
+    except (OSError, ValueError):
+        return None
+    return header if header.get('format_version') == FORMAT_VERSION else None
+
+
+def open_snapshot(path, stamp=None, mode='r'):
+    """Граф поверх снимка через numpy.memmap: данные не читаются целиком, а страницы файла
+    разделяются всеми процессами через страничный кэш ОС.
+    Возвращает None, если снимка нет, формат не совпадает или отметка источника отличается от stamp"""
+    header = read_header(path)
+    if header is None or (stamp is not None and header['stamp'] != stamp):
+        return None
+    lengths = {'nodes': header['nodes'], 'offsets': header['nodes'] + 1, 'edges': header['edges'],
+               'lines': header['lines']}
+    arrays = {name: np.memmap(path, dtype=dtype, mode=mode, offset=header['sections'][name],
+                              shape=(lengths[length],))
+              if lengths[length] else np.empty(0, dtype=dtype)
+              for name, dtype, length in SECTIONS}
+    graph = RoutingGraph(**arrays)
+    graph._checksum = header['checksum']
+    return graph
+
+
+def load_snapshot_graph(line_model, point_model):
+    """Граф из снимка settings.GRAPH_SNAPSHOT_PATH, если он соответствует текущему состоянию БД"""
+    from django.conf import settings
+
+    path = getattr(settings, 'GRAPH_SNAPSHOT_PATH', None)
+    if not path or read_header(path) is None:
+        return None
+    return open_snapshot(path, stamp=source_stamp(line_model, point_model))
@@ -0,0 +1,537 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import msgpack
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point as GeoPoint
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+
+from benchmarks.generate import generate_document, generate_graph
+from mainapp.algorithm import find_path
+from mainapp.async_routing import CoalescingExecutor, Overloaded
+from mainapp.ch import build_hierarchy, hierarchy_path, load_hierarchy
+from mainapp.geocoding import GeocodeCache, Geocoder
+from mainapp.graph import Override, RoutingGraph, get_graph, invalidate_graph
+from mainapp.ingest import iter_records, read_chunks
+from mainapp.landmarks import compute_landmark_tables, load_landmarks, save_landmarks, select_landmarks
+from mainapp import matrix
+from mainapp.matrix import route_matrix
+from mainapp.models import Point, Line
+from mainapp.reachability import reachable
+from mainapp.route_cache import get_route_cache
+from mainapp.tiles import GraphTileSource, TileRouter, build_overlay
+
+
+def create_grid(side=6, step=0.01):
+    """Решетка side x side точек со связями по горизонтали и вертикали; возвращает id -> (lon, lat, score)"""
+    points = {}
+    ids = []
+    for row in range(side):
+        for column in range(side):
+            point = Point.objects.create(geom=GeoPoint(39.7 + column * step, 47.2 + row * step),
+                                         score=(row * 7 + column * 3) % 10 + 1)
+            points[point.pk] = (point.geom.x, point.geom.y, point.score)
+            ids.append(point.pk)
+    for row in range(side):
+        for column in range(side):
+            index = row * side + column
+            if column + 1 < side:
+                Line.objects.create(from_point_id=ids[index], to_point_id=ids[index + 1])
+            if row + 1 < side:
+                Line.objects.create(from_point_id=ids[index], to_point_id=ids[index + side])
+    return points
+
+
+class ConcurrentRouteTests(TransactionTestCase):
+    """Параллельные запросы MinLength / MinScore не смешивают геометрию и свойства разных ответов"""
+
+    def setUp(self):
+        self.points = create_grid()
+        invalidate_graph()
+        get_route_cache().clear()
+
+    def fetch(self, request):
+        kind, point_from, point_to = request
+        try:
+            response = Client().get(f'/api/points/{point_from}/{kind}/{point_to}')
+            return request, response.status_code, json.loads(response.content)
+        finally:
+            connection.close()  # у каждого потока свое соединение с БД
+
+    def test_parallel_requests_keep_their_own_geometry(self):
+        ids = sorted(self.points)
+        requests = [(kind, ids[i], ids[-1 - i]) for i in range(len(ids) // 2)
+                    for kind in ('min_length', 'min_score')] * 4
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(self.fetch, requests))
+        for (kind, point_from, point_to), status, body in results:
+            self.assertEqual(status, 200)
+            features = body['answer']['features']
+            self.assertEqual(len(features), 1)
+            feature = features[0]
+            properties = feature['properties']
+            path = properties['path']
+            self.assertEqual((properties['start_point'], properties['end_point']), (point_from, point_to))
+            self.assertEqual((path[0], path[-1]), (point_from, point_to))
+            self.assertEqual(feature['geometry']['coordinates'],
+                             [[self.points[point_id][0], self.points[point_id][1]] for point_id in path])
+            if kind == 'min_length':
+                self.assertEqual(properties['name'], 'Shortest path')
+                self.assertIn('path_in_km', properties)
+                self.assertNotIn('score_points', properties)
+            else:
+                self.assertEqual(properties['name'], 'Cheapest path')
+                self.assertIn('path_in_score_points', properties)
+                self.assertEqual(properties['score_points'], [self.points[point_id][2] for point_id in path])
+
+
+class GraphEditTests(SimpleTestCase):
+    """Изменения графа из журнала: повторное применение и переопределения линий"""
+
+    def setUp(self):
+        self.graph = generate_graph('grid', 400, seed=3)
+
+    def test_replayed_line_change_is_not_duplicated(self):
+        graph = self.graph.edited()
+        line_id, from_id, to_id = int(graph.line_ids[0]), int(graph.line_from[0]), int(graph.line_to[0])
+        graph.set_line(line_id, from_id, to_id)  # изменение, уже вошедшее в загруженный граф
+        self.assertEqual(graph.edge_count, self.graph.edge_count)
+        graph.set_line(line_id, from_id, int(graph.ids[-1]))
+        graph.set_line(line_id, from_id, int(graph.ids[-1]))
+        self.assertEqual(graph.edge_count, self.graph.edge_count)
+        graph.remove_line(line_id)
+        graph.remove_line(line_id)
+        self.assertEqual(graph.edge_count, self.graph.edge_count - 2)
+
+    def test_checksum_matches_rebuild(self):
+        graph = self.graph.edited()
+        graph.set_line(int(graph.line_ids.max()) + 1, int(graph.ids[0]), int(graph.ids[-1]))
+        graph.set_line(int(graph.line_ids[0]), int(graph.line_from[0]), int(graph.ids[-2]))
+        order = np.random.default_rng(0).permutation(len(graph.line_ids))
+        rebuilt = RoutingGraph.from_edges(graph.ids, graph.lon, graph.lat, graph.score, graph.line_from[order],
+                                          graph.line_to[order], line_ids=graph.line_ids[order])
+        self.assertEqual(graph.checksum, rebuilt.checksum)
+
+    def test_override_does_not_lower_cost(self):
+        graph = self.graph.edited()
+        from_id, to_id = int(graph.line_from[0]), int(graph.line_to[0])
+        base = find_path(self.graph, from_id, to_id)['path_in_km']
+        graph.set_override(from_id, to_id, Override(0.0, 0.0, False, float('inf')))
+        self.assertEqual(find_path(graph, from_id, to_id)['path_in_km'], base)
+
+    def test_path_costs_match_matrix_and_reachable(self):
+        graph = self.graph.edited()
+        graph.set_override(int(graph.line_from[0]), int(graph.line_to[0]), Override(5.0, 500, False, float('inf')))
+        start, end = int(graph.ids[0]), int(graph.ids[-1])
+        for current in (self.graph, graph):
+            for eval_type, cost in (('by_distance', 'path_in_km'), ('by_score', 'path_in_score_points')):
+                with self.subTest(overrides=bool(current.overrides), eval_type=eval_type):
+                    result = find_path(current, start, end, eval_type)
+                    self.assertEqual(result[cost], round(current.path_measure(current.indices_of(result['path']),
+                                                                              eval_type), 2))
+                    self.assertEqual(result[cost], route_matrix(current, [start], [end], eval_type,
+                                                                workers=1)['matrix'][0][0])
+                    nodes, costs = reachable(current, current.index_of(start), eval_type, float('inf'))
+                    self.assertEqual(result[cost], round(float(costs[nodes.tolist().index(len(current.ids) - 1)]), 2))
+
+    def test_score_is_sum_of_point_scores(self):
+        graph = RoutingGraph.from_edges([1, 2, 3], [39.7, 39.71, 39.72], [47.2, 47.2, 47.2], [10, 20, 30],
+                                        [1, 2], [2, 3])
+        self.assertEqual(find_path(graph, 1, 3, 'by_score')['path_in_score_points'], 60)
+        self.assertEqual(route_matrix(graph, [1], [3], 'by_score', workers=1)['matrix'], [[60]])
+        nodes, costs = reachable(graph, 0, 'by_score', 60)
+        self.assertEqual(dict(zip(nodes.tolist(), costs.tolist())), {0: 10, 1: 30, 2: 60})
+
+
+class ContractionHierarchyTests(SimpleTestCase):
+    """Иерархии сжатия: те же стоимости, что у A*, и подхват файла, построенного после загрузки графа"""
+
+    def setUp(self):
+        with open(os.path.join(settings.BASE_DIR, 'json_data', 'json_data.json')) as infile:
+            document = json.load(infile)
+        points = sorted(document['points'], key=lambda point: point['obj_id'])
+        self.graph = RoutingGraph.from_edges(
+            [point['obj_id'] for point in points], [point['lon'] for point in points],
+            [point['lat'] for point in points], [point['score'] for point in points],
+            [line['from_obj'] for line in document['lines']], [line['to_obj'] for line in document['lines']])
+
+    def test_all_pairs_match_astar(self):
+        ids = self.graph.ids.tolist()
+        for eval_type, cost in (('by_distance', 'path_in_km'), ('by_score', 'path_in_score_points')):
+            hierarchy = build_hierarchy(self.graph, eval_type)
+            for start in ids:
+                for end in ids:
+                    with self.subTest(eval_type=eval_type, start=start, end=end):
+                        expected = find_path(self.graph, start, end, eval_type)
+                        result = find_path(self.graph, start, end, eval_type, hierarchy=hierarchy)
+                        self.assertEqual((result['path'][-1], result[cost]), (expected['path'][-1], expected[cost]))
+
+    def test_hierarchy_built_later_is_loaded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertIsNone(load_hierarchy(self.graph, 'by_distance', directory))
+        build_hierarchy(self.graph, 'by_distance').save(hierarchy_path(directory, 'by_distance'))
+        self.assertIsNone(load_hierarchy(self.graph, 'by_distance', directory))  # файл еще не проверяется заново
+        with mock.patch('mainapp.graph.PRECOMPUTE_RECHECK_INTERVAL', 0):
+            self.assertIsNotNone(load_hierarchy(self.graph, 'by_distance', directory))
+
+
+class TileRouterTests(SimpleTestCase):
+    """Поиск по тайлам при кэше меньше нужного поиску и с оценками по графу граничных точек"""
+
+    def setUp(self):
+        self.graph = generate_graph('road', 3000, seed=4)
+        self.graph.landmarks = {}
+
+    def assert_same_costs(self, graph, overlay):
+        router = TileRouter(GraphTileSource(graph, 0.05), budget=2, overlay=overlay)
+        router.sync()
+        router.overlay = overlay  # оценки tile_bounds верны и для графа с переопределениями
+        ids = graph.ids.tolist()
+        for eval_type, cost in (('by_distance', 'path_in_km'), ('by_score', 'path_in_score_points')):
+            for start, end in zip(ids[:10], ids[::-1][:10]):
+                with self.subTest(eval_type=eval_type, start=start, end=end):
+                    self.assertEqual(router.route(start, end, eval_type)[cost],
+                                     find_path(graph, start, end, eval_type)[cost])
+        return router
+
+    def test_small_budget_caps_tiles_held_by_search(self):
+        router = self.assert_same_costs(self.graph, None)
+        self.assertEqual(router.stats()['peak_held'], 2)
+        self.assertLessEqual(router.stats()['tiles'], 2)
+
+    def test_overlay_bounds_with_overrides(self):
+        overlay = build_overlay(GraphTileSource(self.graph, 0.05))
+        graph = self.graph.edited()
+        for index in range(0, len(graph.line_ids), 15):
+            graph.set_override(int(graph.line_from[index]), int(graph.line_to[index]),
+                               Override(50.0, 900, index % 2 == 0, float('inf')))
+        router = self.assert_same_costs(graph, overlay)
+        self.assertTrue(router.override_keys)
+
+
+class CoalescingExecutorTests(SimpleTestCase):
+    """Пул асинхронных маршрутов: одинаковые одновременные запросы считаются один раз,
+    сверх max_pending различных вычислений - Overloaded и ответ 503"""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.calls = []
+
+    def compute(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        return value * 2
+
+    def test_identical_keys_run_once(self):
+        executor = CoalescingExecutor(max_workers=2, max_pending=4)
+
+        async def scenario():
+            tasks = [asyncio.ensure_future(executor.run('key', self.compute, 21)) for _ in range(10)]
+            await asyncio.sleep(0.05)
+            self.release.set()
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(asyncio.run(scenario()), [42] * 10)
+        self.assertEqual((self.calls, executor.coalesced), ([21], 9))
+        self.assertEqual(executor.pending, 0)
+
+    def test_overloaded_when_pending_is_full(self):
+        executor = CoalescingExecutor(max_workers=2, max_pending=2)
+
+        async def scenario():
+            tasks = [asyncio.ensure_future(executor.run(key, self.compute, key)) for key in (1, 2)]
+            await asyncio.sleep(0.05)
+            with self.assertRaises(Overloaded):
+                await executor.run(3, self.compute, 3)
+            tasks.append(asyncio.ensure_future(executor.run(1, self.compute, 1)))  # уже в работе - объединяется
+            await asyncio.sleep(0.05)
+            self.release.set()
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(asyncio.run(scenario()), [2, 4, 2])
+        self.assertEqual((sorted(self.calls), executor.rejected, executor.coalesced), ([1, 2], 1, 1))
+
+    def test_overloaded_response(self):
+        with mock.patch('mainapp.views.get_route_executor', return_value=CoalescingExecutor(max_pending=0)):
+            response = Client().get('/api/async/points/1/min_length/2')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class MatrixPoolTests(SimpleTestCase):
+    """Пул матриц, замененный после изменения графа, дорабатывает уже начатые в нем матрицы"""
+
+    def test_replaced_pool_finishes_running_matrix(self):
+        graph = generate_graph('grid', 400, seed=3)
+        changed = graph.edited()
+        changed.set_override(int(graph.line_from[0]), int(graph.line_to[0]), Override(None, None, True, float('inf')))
+        ids = graph.ids.tolist()
+        with matrix._leased_pool(graph, 2) as pool:
+            route_matrix(changed, ids[:2], ids[-2:], workers=2)  # пул заменяется пулом нового графа
+            self.assertEqual(list(pool.map(abs, [-1, -2])), [1, 2])
+        with self.assertRaises(RuntimeError):
+            pool.submit(abs, -1)
+
+
+def write_document(document, **dump_options):
+    """Документ loaddata во временном файле; путь удаляется вызывающим"""
+    descriptor, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(descriptor, 'w') as outfile:
+        json.dump(document, outfile, **dump_options)
+    return path
+
+
+class IterRecordsTests(SimpleTestCase):
+    """Потоковый разбор большого документа кусками, границы которых попадают внутрь значений"""
+
+    def setUp(self):
+        self.document = generate_document('road', 50000, seed=1)
+        self.document['meta'] = {'source': 'generated', 'lines': len(self.document['lines'])}
+        self.path = write_document(self.document, indent=1)
+        self.addCleanup(os.remove, self.path)
+
+    def test_records_match_document(self):
+        expected = [('points', record) for record in self.document['points']] + \
+                   [('lines', record) for record in self.document['lines']]
+        for chunk_size in (61, 4096):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_records(read_chunks(self.path, chunk_size=chunk_size))), expected)
+
+    def test_truncated_document(self):
+        with open(self.path) as infile:
+            text = infile.read()
+        with self.assertRaises(ValueError):
+            list(iter_records([text[:len(text) // 2]]))
+
+
+class LoadDataTests(TestCase):
+    """Команда loaddata на сгенерированном документе: загрузка и повторная загрузка тех же id"""
+
+    def setUp(self):
+        self.document = generate_document('road', 5000, seed=2)
+        self.path = write_document(self.document)
+        self.addCleanup(os.remove, self.path)
+
+    def load(self, path):
+        call_command('loaddata', source=path, batch_size=1000, no_geocode=True, stdout=io.StringIO())
+
+    def test_geocoder_url(self):
+        server, url = start_geocoder_stub(self)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        document = generate_document('road', 200, seed=4)
+        path = write_document(document)
+        self.addCleanup(os.remove, path)
+        with self.settings(GEOCODER=dict(settings.GEOCODER, CACHE_PATH=os.path.join(directory, 'cache.sqlite3'))):
+            call_command('loaddata', source=path, batch_size=1000, geocoder_url=url, geocode_rate=1000,
+                         stdout=io.StringIO())
+        self.assertEqual(len(server.requests), len(document['points']))
+        for point in Point.objects.all():
+            self.assertEqual(point.address, f'{point.geom.x},{point.geom.y}')
+
+    def test_reload_updates_existing_rows(self):
+        self.load(self.path)
+        self.assertEqual(Point.objects.count(), len(self.document['points']))
+        self.assertEqual(Line.objects.count(), len(self.document['lines']))
+
+        changed = self.document['points'][0]
+        changed['score'] += 1
+        self.document['lines'][0]['to_obj'] = self.document['lines'][1]['to_obj']
+        path = write_document(self.document)
+        self.addCleanup(os.remove, path)
+        self.load(path)
+
+        self.assertEqual(Point.objects.count(), len(self.document['points']))
+        self.assertEqual(Line.objects.count(), len(self.document['lines']))
+        point = Point.objects.get(pk=changed['obj_id'])
+        self.assertEqual((point.geom.x, point.geom.y, point.score), (changed['lon'], changed['lat'], changed['score']))
+        self.assertEqual(Line.objects.get(pk=1).to_point_id, self.document['lines'][1]['to_obj'])
+
+
+class GraphOverridesTests(TestCase):
+    """Переопределения линий: изменять могут только операторы, удешевить линию нельзя"""
+
+    def setUp(self):
+        self.points = create_grid(side=2)
+        invalidate_graph()
+        self.line = sorted(self.points)[:2]  # соседние точки решетки на расстоянии 0.01 градуса (1 км)
+        self.operator = Client()
+        self.operator.force_login(User.objects.create_user('operator', is_staff=True))
+
+    def post(self, client, **values):
+        return client.post('/api/graph/overrides', dict(values, **{'from': self.line[0], 'to': self.line[1]}),
+                           content_type='application/json')
+
+    def test_anonymous_cannot_change(self):
+        self.assertEqual(self.post(Client(), closed=True).status_code, 403)
+        response = Client().delete(f'/api/graph/overrides?from={self.line[0]}&to={self.line[1]}')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Client().get('/api/graph/overrides').status_code, 200)
+
+    def test_lower_cost_is_rejected(self):
+        response = self.post(self.operator, km=0.5)
+        self.assertEqual(response.status_code, 400)
+        self.assertAlmostEqual(json.loads(response.content)['km'], 1.0)
+        response = self.post(self.operator, km=5.0)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)['km'], 5.0)
+
+
+class LandmarkReloadTests(TestCase):
+    """Ориентиры, построенные командой build_landmarks после загрузки графа, подхватываются без перезапуска"""
+
+    def setUp(self):
+        create_grid()
+        invalidate_graph()
+
+    def test_landmarks_built_later_are_loaded(self):
+        graph = get_graph(Line, Point)
+        self.assertEqual(load_landmarks(graph), {})
+        landmarks = select_landmarks(graph, 2)
+        save_landmarks(graph, landmarks, compute_landmark_tables(graph, landmarks))
+        self.assertEqual(load_landmarks(graph), {})  # до истечения интервала таблица заново не запрашивается
+        with mock.patch('mainapp.graph.PRECOMPUTE_RECHECK_INTERVAL', 0):
+            self.assertEqual(sorted(load_landmarks(graph)), ['by_distance', 'by_score'])
+
+
+class GeocoderStub(BaseHTTPRequestHandler):
+    """Заглушка Yandex Geocoder: адрес "lon,lat" из параметра geocode; отрицательная долгота - ответ 500.
+    Время каждого запроса добавляется в server.requests"""
+
+    def do_GET(self):
+        geocode = parse_qs(urlparse(self.path).query)['geocode'][0]
+        self.server.requests.append(time.monotonic())
+        if geocode.startswith('-'):
+            self.send_error(500)
+            return
+        member = {'GeoObject': {'metaDataProperty': {'GeocoderMetaData': {'text': geocode}}}}
+        body = json.dumps({'response': {'GeoObjectCollection': {'featureMember': [member]}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_geocoder_stub(test):
+    """Заглушка геокодера в отдельном потоке на свободном порту; возвращает сервер и URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GeocoderStub)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server, f'http://127.0.0.1:{server.server_port}/1.x/'
+
+
+class GeocoderTests(SimpleTestCase):
+    """Геокодер против локальной заглушки: кэш, ошибки и ограничение частоты"""
+
+    def setUp(self):
+        self.server, self.url = start_geocoder_stub(self)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache_path = os.path.join(directory, 'geocode_cache.sqlite3')
+
+    def geocoder(self, **options):
+        geocoder = Geocoder('key', url=self.url, cache=GeocodeCache(self.cache_path), **options)
+        self.addCleanup(geocoder.close)
+        return geocoder
+
+    def test_cache_hits(self):
+        coordinates = [(39.7, 47.2), (39.71, 47.21)]
+        geocoder = self.geocoder()
+        self.assertEqual(geocoder.reverse_many(coordinates), ['39.7,47.2', '39.71,47.21'])
+        self.assertEqual(geocoder.reverse_many(coordinates), ['39.7,47.2', '39.71,47.21'])
+        self.assertEqual((geocoder.requested, geocoder.cached, len(self.server.requests)), (2, 2, 2))
+        # кэш постоянный: новый геокодер с тем же файлом сервис не запрашивает
+        self.assertEqual(self.geocoder().reverse_many(coordinates), ['39.7,47.2', '39.71,47.21'])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_failures_are_counted_and_not_cached(self):
+        geocoder = self.geocoder()
+        self.assertEqual(geocoder.reverse_many([(-1.0, 47.2), (39.7, 47.2)]), [None, '39.7,47.2'])
+        self.assertEqual(geocoder.reverse(-1.0, 47.2), None)
+        self.assertEqual((geocoder.requested, geocoder.failed, geocoder.cached), (3, 2, 0))
+
+    def test_rate_limit(self):
+        geocoder = self.geocoder(concurrency=8, rate=10)
+        geocoder.reverse_many([(39.7 + i * 0.01, 47.2) for i in range(15)])
+        # 10 запросов - сразу (емкость ограничителя), остальные 5 - не быстрее 10 в секунду
+        self.assertEqual(len(self.server.requests), 15)
+        self.assertGreaterEqual(max(self.server.requests) - min(self.server.requests), 0.45)
+
+
+class PointsVersionTests(TestCase):
+    """ETag списка точек меняется при любой записи точек, в том числе только адреса"""
+
+    def setUp(self):
+        self.points = create_grid(side=2)
+
+    def etag(self):
+        response = Client().get('/api/points/')
+        b''.join(response.streaming_content)
+        return response['ETag']
+
+    def test_address_changes_etag(self):
+        etag = self.etag()
+        point = Point.objects.get(pk=min(self.points))
+        point.address = 'Rostov-on-Don'
+        point.save(update_fields=['address'])
+        changed = self.etag()
+        self.assertNotEqual(changed, etag)
+        Point.objects.filter(pk=point.pk).update(address='Rostov')
+        self.assertNotEqual(self.etag(), changed)
+
+    def test_points_keep_crs(self):
+        response = Client().get('/api/points/')
+        points = json.loads(b''.join(response.streaming_content))['points']
+        self.assertEqual(points['crs'], {"type": "name", "properties": {"name": "EPSG:4326"}})
+
+
+class RouteResponseTests(TestCase):
+    """Ответы маршрутов: неизвестные точки, заголовок Vary и формат msgpack"""
+
+    def setUp(self):
+        self.points = create_grid(side=2)
+        invalidate_graph()
+        get_route_cache().clear()
+
+    def test_unknown_point(self):
+        known, unknown = min(self.points), max(self.points) + 1000
+        for kind in ('min_length', 'min_score'):
+            with self.subTest(kind=kind):
+                response = Client().get(f'/api/points/{unknown}/{kind}/{known}')
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(json.loads(response.content), {"error": "unknown point id"})
+
+    def test_vary_accept(self):
+        response = Client().get(f'/api/points/{min(self.points)}/min_length/{max(self.points)}',
+                                HTTP_ACCEPT='application/vnd.geopoints.polyline+json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+
+    def test_msgpack_matches_json(self):
+        url = f'/api/points/{min(self.points)}/min_length/{max(self.points)}'
+        response = Client().get(url, {'format': 'msgpack'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(Client().get(url).content))
@@ -0,0 +1,680 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from heapq import heappush, heappop
+
+import numpy as np
+
+INF = float('inf')
+# номер поля стоимости в ребре тайла (сосед, км, баллы)
+WEIGHT_FIELDS = {'by_distance': 1, 'by_score': 2}
+
+
+def tile_key(lon, lat, size):
+    """Клетка сетки тайлов (столбец, строка), в которую попадает точка"""
+    return math.floor(lon / size), math.floor(lat / size)
+
+
+class Tile:
+    """Тайл сети: точки, попавшие в клетку сетки, и их ребра, в том числе к точкам соседних тайлов.
+    Атрибуты:
+            key             - клетка сетки (столбец, строка)
+            points          - id точки -> (lon, lat, score) для точек тайла и их соседей из других тайлов
+            edges           - id точки тайла -> список ребер (id соседа, км, баллы);
+                              закрытые переопределением ребра не включаются
+            expires_at      - время (unix) истечения ближайшего учтенного переопределения линии"""
+    __slots__ = ('key', 'points', 'edges', 'expires_at')
+
+    def __init__(self, key, points, edges, expires_at=INF):
+        self.key = key
+        self.points = points
+        self.edges = edges
+        self.expires_at = expires_at
+
+    def boundary(self):
+        """Граничные точки тайла - концы ребер, ведущих в другие тайлы"""
+        return [node for node, edges in self.edges.items() if any(edge[0] not in self.edges for edge in edges)]
+
+
+def build_tile(key, points, lines, overrides=None):
+    """Тайл из строк запросов.
+    Аргументы:
+            points          - (id, lon, lat, score) точек тайла
+            lines           - (from_id, from_lon, from_lat, from_score, to_id, to_lon, to_lat, to_score)
+                              линий, у которых хотя бы один конец в тайле
+            overrides       - line_key -> Override действующих переопределений этих линий"""
+    from mainapp.graph import line_key
+
+    overrides = overrides or {}
+    known = {point_id: (lon, lat, score or 0) for point_id, lon, lat, score in points}
+    edges = {point_id: [] for point_id in known}
+    expires_at = INF
+    for a, a_lon, a_lat, a_score, b, b_lon, b_lat, b_score in lines:
+        if a_lon is None or b_lon is None:
+            continue
+        a_score, b_score = a_score or 0, b_score or 0
+        km, score = math.hypot(a_lon - b_lon, a_lat - b_lat) * 100, a_score + b_score
+        override = overrides.get(line_key(a, b))
+        if override is not None:
+            expires_at = min(expires_at, override.expires_at)
+            if override.closed:
+                continue
+            km, score = override.weights(km, score)
+        known.setdefault(a, (a_lon, a_lat, a_score))
+        known.setdefault(b, (b_lon, b_lat, b_score))
+        if a in edges:
+            edges[a].append((b, km, score))
+        if b in edges:
+            edges[b].append((a, km, score))
+    return Tile(key, known, edges, expires_at)
+
+
+class GraphTileSource:
+    """Тайлы из уже загруженного графа (mainapp.graph.RoutingGraph): для бенчмарков и сверки
+    с поиском по графу целиком. Стоимости ребер - из графа, с его переопределениями"""
+
+    def __init__(self, graph, size):
+        self.graph = graph
+        self.size = size
+        located = ~(np.isnan(graph.lon) | np.isnan(graph.lat))
+        self._columns = np.where(located, np.floor(np.nan_to_num(graph.lon) / size), np.nan)
+        self._rows = np.where(located, np.floor(np.nan_to_num(graph.lat) / size), np.nan)
+
+    def stamp(self):
+        return self.graph.checksum
+
+    def state(self):
+        return self.graph.change_id, len(self.graph.overrides)
+
+    def override_keys(self):
+        """Тайлы концов линий с действующими переопределениями"""
+        keys = set()
+        for line in self.graph.overrides:
+            for point_id in line:
+                try:
+                    keys.add(tile_key(*self.point(point_id)[:2], self.size))
+                except KeyError:
+                    continue
+        return keys
+
+    def keys(self):
+        located = ~np.isnan(self._columns)
+        return sorted(set(zip(self._columns[located].astype(np.int64).tolist(),
+                              self._rows[located].astype(np.int64).tolist())))
+
+    def _point(self, node):
+        graph = self.graph
+        return float(graph.lon[node]), float(graph.lat[node]), float(graph.score[node])
+
+    def point(self, point_id):
+        point = self._point(self.graph.index_of(point_id))
+        if math.isnan(point[0]) or math.isnan(point[1]):
+            raise KeyError(point_id)
+        return point
+
+    def points(self, point_ids):
+        return {point_id: self._point(self.graph.index_of(point_id)) for point_id in point_ids}
+
+    def load(self, key):
+        graph = self.graph
+        nodes = np.flatnonzero((self._columns == key[0]) & (self._rows == key[1]))
+        points, edges = {}, {}
+        for node in nodes.tolist():
+            point_id = int(graph.ids[node])
+            points[point_id] = self._point(node)
+            lo, hi = int(graph.offsets[node]), int(graph.offsets[node + 1])
+            node_edges = edges[point_id] = []
+            for target, km, score in zip(graph.targets[lo:hi].tolist(), graph.edge_km[lo:hi].tolist(),
+                                         graph.edge_score[lo:hi].tolist()):
+                if not km < INF:
+                    continue  # закрытое ребро или точка без координат
+                neighbor = int(graph.ids[target])
+                if neighbor not in points:
+                    points[neighbor] = self._point(target)
+                node_edges.append((neighbor, km, score))
+        return Tile(key, points, edges)
+
+
+class DatabaseTileSource:
+    """Тайлы из БД: точки клетки (по индексу geom) и линии, у которых хотя бы один конец в клетке.
+    Аргументы:
+            line_model      - Django-модель линии
+            point_model     - Django-модель точки
+            size            - размер клетки в градусах
+            overrides       - учитывать действующие переопределения линий (GraphChange)"""
+
+    def __init__(self, line_model, point_model, size, overrides=True):
+        self.line_model = line_model
+        self.point_model = point_model
+        self.size = size
+        self.overrides = overrides
+
+    def stamp(self):
+        from mainapp.snapshot import source_stamp
+
+        return source_stamp(self.line_model, self.point_model)
+
+    def state(self):
+        """Последняя запись журнала изменений и число действующих переопределений линий"""
+        from datetime import datetime, timezone
+        from mainapp.changes import latest_change_id
+        from mainapp.models import GraphChange
+
+        active = GraphChange.objects.filter(kind=GraphChange.OVERRIDE, expires_at__gt=datetime.now(timezone.utc))
+        return latest_change_id(), active.count()
+
+    def override_keys(self):
+        """Тайлы концов линий с действующими переопределениями"""
+        from datetime import datetime, timezone
+        from mainapp.models import GraphChange
+
+        lines = GraphChange.objects.filter(kind=GraphChange.OVERRIDE, expires_at__gt=datetime.now(timezone.utc)) \
+            .values_list('from_point_id', 'to_point_id')
+        point_ids = {point_id for line in lines for point_id in line if point_id is not None}
+        return {tile_key(lon, lat, self.size) for lon, lat, _ in self.points(point_ids).values()}
+
+    @staticmethod
+    def _coordinates(field, prefix):
+        from django.db.models import FloatField, Func
+
+        return {f'{prefix}_lon': Func(field, function='ST_X', output_field=FloatField()),
+                f'{prefix}_lat': Func(field, function='ST_Y', output_field=FloatField())}
+
+    def _points(self, queryset):
+        return queryset.filter(geom__isnull=False).annotate(**self._coordinates('geom', 'geom')) \
+            .values_list('id', 'geom_lon', 'geom_lat', 'score')
+
+    def keys(self):
+        keys = set()
+        for _, lon, lat, _ in self._points(self.point_model.objects.all()).iterator():
+            keys.add(tile_key(lon, lat, self.size))
+        return sorted(keys)
+
+    def point(self, point_id):
+        for _, lon, lat, score in self._points(self.point_model.objects.filter(id=point_id)):
+            return lon, lat, score or 0
+        raise KeyError(point_id)
+
+    def points(self, point_ids):
+        return {point_id: (lon, lat, score or 0)
+                for point_id, lon, lat, score in self._points(self.point_model.objects.filter(id__in=point_ids))}
+
+    def _overrides(self, point_ids):
+        from datetime import datetime, timezone
+        from django.db.models import Q
+        from mainapp.changes import _timestamp
+        from mainapp.graph import Override
+        from mainapp.models import GraphChange
+
+        changes = GraphChange.objects.filter(Q(from_point_id__in=point_ids) | Q(to_point_id__in=point_ids),
+                                             kind=GraphChange.OVERRIDE, expires_at__gt=datetime.now(timezone.utc))
+        return {(change.from_point_id, change.to_point_id):
+                Override(change.km, change.score, change.closed, _timestamp(change.expires_at))
+                for change in changes.order_by('id')}
+
+    def load(self, key):
+        from django.contrib.gis.geos import Polygon
+        from django.db.models import Q
+
+        size = self.size
+        # клетка с небольшим запасом: принадлежность точки решает tile_key, а не граница многоугольника
+        margin = size * 1e-6
+        box = Polygon.from_bbox((key[0] * size - margin, key[1] * size - margin,
+                                 (key[0] + 1) * size + margin, (key[1] + 1) * size + margin))
+        box.srid = 4326
+        points = [row for row in self._points(self.point_model.objects.filter(geom__contained=box))
+                  if tile_key(row[1], row[2], size) == key]
+        ids = [row[0] for row in points]
+        lines = self.line_model.objects.filter(Q(from_point_id__in=ids) | Q(to_point_id__in=ids)) \
+            .annotate(**self._coordinates('from_point__geom', 'from'), **self._coordinates('to_point__geom', 'to')) \
+            .values_list('from_point_id', 'from_lon', 'from_lat', 'from_point__score',
+                         'to_point_id', 'to_lon', 'to_lat', 'to_point__score')
+        return build_tile(key, points, lines, self._overrides(ids) if self.overrides and ids else None)
+
+
+def _search(start, goal, neighbors, heuristic, search_stats):
+    """A* по словарям (граф загружается по частям, поэтому без массивов состояния mainapp.search).
+    Возвращает путь (список id) и его стоимость; если цель недостижима - путь до ближайшего
+    к ней (по эвристике) достигнутого узла"""
+    g, parent, estimates = {start: 0.0}, {start: None}, {start: heuristic(start)}
+    closed = set()
+    heap, seq = [(estimates[start], 0, start)], 0
+    best = start
+    while heap:
+        _, _, node = heappop(heap)
+        if node in closed:
+            search_stats['stale_skipped'] += 1
+            continue
+        closed.add(node)
+        search_stats['nodes_expanded'] += 1
+        if node == goal:
+            best = goal
+            break
+        cost = g[node]
+        for neighbor, weight in neighbors(node):
+            new_cost = cost + weight
+            if new_cost < g.get(neighbor, INF):
+                if neighbor not in estimates:
+                    estimates[neighbor] = heuristic(neighbor)
+                    if estimates[neighbor] < estimates[best]:
+                        best = neighbor
+                g[neighbor] = new_cost
+                parent[neighbor] = node
+                closed.discard(neighbor)
+                seq += 1
+                heappush(heap, (new_cost + estimates[neighbor], seq, neighbor))
+                search_stats['nodes_pushed'] += 1
+        search_stats['peak_open'] = max(search_stats['peak_open'], len(heap))
+    path = [best]
+    while parent[path[-1]] is not None:
+        path.append(parent[path[-1]])
+    return path[::-1], g[best]
+
+
+class TileOverlay:
+    """Граф граничных точек тайлов: ребра между тайлами и "сквозные" ребра между граничными
+    точками одного тайла со стоимостью кратчайшего пути внутри тайла (для обоих способов вычисления).
+    Поиск по всей сети заменяется поиском по тайлам старта и цели и графу граничных точек между ними,
+    стоимость пути при этом та же; сквозные ребра разворачиваются поиском внутри своего тайла.
+    Атрибуты:
+            size            - размер клетки сетки в градусах
+            stamp           - отметка состояния данных (source_stamp), для которых построен граф
+            ids             - id граничных точек по возрастанию (int64)
+            lon, lat, score - координаты и score граничных точек (float64)
+            adjacency       - способ вычисления -> (offsets, targets, weights) в CSR-представлении,
+                              targets - позиции в ids"""
+    # сколько наборов оценок (tile_bounds) для разных тайлов цели хранить
+    BOUNDS_CACHE = 64
+
+    def __init__(self, size, stamp, ids, lon, lat, score, adjacency):
+        self.size = size
+        self.stamp = stamp
+        self.ids = ids
+        self.lon = lon
+        self.lat = lat
+        self.score = score
+        self.adjacency = adjacency
+        # списки Python для быстрого обхода в запросах
+        self._index = {point_id: position for position, point_id in enumerate(ids.tolist())}
+        self._ids = ids.tolist()
+        self._points = list(zip(lon.tolist(), lat.tolist(), score.tolist()))
+        self._adjacency = {metric: tuple(array.tolist() for array in arrays) for metric, arrays in adjacency.items()}
+        self._keys = [tile_key(x, y, size) for x, y in zip(lon.tolist(), lat.tolist())]
+        self._bounds = OrderedDict()
+        self._bounds_lock = threading.Lock()
+
+    def __contains__(self, point_id):
+        return point_id in self._index
+
+    def neighbors(self, point_id, eval_type, known):
+        """Соседи граничной точки с весами ребер; координаты соседей добавляются в known"""
+        offsets, targets, weights = self._adjacency[eval_type]
+        position = self._index[point_id]
+        result = []
+        for slot in range(offsets[position], offsets[position + 1]):
+            target = targets[slot]
+            neighbor = self._ids[target]
+            if neighbor not in known:
+                known[neighbor] = self._points[target]
+            result.append((neighbor, weights[slot]))
+        return result
+
+    def tile_bounds(self, goal_key, eval_type):
+        """Нижние оценки стоимости пути до цели в тайле goal_key: тайл -> наименьшая по его граничным точкам
+        стоимость пути до граничных точек тайла цели. Путь из точки другого тайла выходит из него через
+        граничную точку, а стоимости по графу граничных точек равны стоимостям по всей сети; переопределения
+        линий стоимость только повышают, так что оценка остается нижней и при них. Тайлов, из которых тайл
+        цели недостижим, в результате нет"""
+        with self._bounds_lock:
+            bounds = self._bounds.get((goal_key, eval_type))
+            if bounds is not None:
+                self._bounds.move_to_end((goal_key, eval_type))
+                return bounds
+        offsets, targets, weights = self._adjacency[eval_type]
+        costs = {position: 0.0 for position, key in enumerate(self._keys) if key == goal_key}
+        heap = [(0.0, position) for position in costs]
+        done = set()
+        while heap:
+            cost, position = heappop(heap)
+            if position in done:
+                continue
+            done.add(position)
+            # ребра графа граничных точек есть в обе стороны с одинаковыми весами
+            for slot in range(offsets[position], offsets[position + 1]):
+                target = targets[slot]
+                if cost + weights[slot] < costs.get(target, INF):
+                    costs[target] = cost + weights[slot]
+                    heappush(heap, (costs[target], target))
+        bounds = {}
+        for position, cost in costs.items():
+            key = self._keys[position]
+            if cost < bounds.get(key, INF):
+                bounds[key] = cost
+        with self._bounds_lock:
+            self._bounds[(goal_key, eval_type)] = bounds
+            while len(self._bounds) > self.BOUNDS_CACHE:
+                self._bounds.popitem(last=False)
+        return bounds
+
+    def save(self, path):
+        """Сохранение графа в файл .npz"""
+        arrays = {f'{metric}_{name}': array for metric, csr in self.adjacency.items()
+                  for name, array in zip(('offsets', 'targets', 'weights'), csr)}
+        with open(path, 'wb') as outfile:
+            np.savez(outfile, size=self.size, stamp=self.stamp, ids=self.ids, lon=self.lon, lat=self.lat,
+                     score=self.score, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка графа, сохраненного методом save"""
+        with np.load(path) as data:
+            adjacency = {metric: tuple(data[f'{metric}_{name}'] for name in ('offsets', 'targets', 'weights'))
+                         for metric in WEIGHT_FIELDS}
+            return cls(float(data['size']), str(data['stamp']), data['ids'], data['lon'], data['lat'],
+                       data['score'], adjacency)
+
+
+def _inner_costs(tile, source, field):
+    """Стоимости кратчайших путей внутри тайла от точки source до всех достижимых точек тайла"""
+    costs = {source: 0.0}
+    done = set()
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heappop(heap)
+        if node in done:
+            continue
+        done.add(node)
+        for edge in tile.edges[node]:
+            neighbor = edge[0]
+            if neighbor in tile.edges and cost + edge[field] < costs.get(neighbor, INF):
+                costs[neighbor] = cost + edge[field]
+                heappush(heap, (costs[neighbor], neighbor))
+    return costs
+
+
+def build_overlay(source, stamp=None):
+    """Граф граничных точек по всем тайлам источника (тайлы загружаются по одному).
+    Аргументы:
+            source          - источник тайлов (DatabaseTileSource без переопределений или GraphTileSource)
+            stamp           - отметка состояния данных; по умолчанию source.stamp()"""
+    stamp = source.stamp() if stamp is None else stamp
+    points = {}
+    edges = {metric: [] for metric in WEIGHT_FIELDS}
+    for key in source.keys():
+        tile = source.load(key)
+        boundary = tile.boundary()
+        boundary_set = set(boundary)
+        for node in boundary:
+            points[node] = tile.points[node]
+            for metric, field in WEIGHT_FIELDS.items():
+                costs = _inner_costs(tile, node, field)
+                edges[metric].extend((node, other, costs[other]) for other in boundary_set
+                                     if other != node and other in costs)
+                edges[metric].extend((node, edge[0], edge[field]) for edge in tile.edges[node]
+                                     if edge[0] not in tile.edges)
+    ids = np.array(sorted(points), dtype=np.int64)
+    coordinates = np.array([points[point_id] for point_id in ids.tolist()], dtype=np.float64).reshape(-1, 3)
+    adjacency = {}
+    for metric, metric_edges in edges.items():
+        array = np.array([(a, b) for a, b, _ in metric_edges], dtype=np.int64).reshape(-1, 2)
+        weights = np.array([weight for _, _, weight in metric_edges], dtype=np.float64)
+        src, dst = np.searchsorted(ids, array[:, 0]), np.searchsorted(ids, array[:, 1])
+        order = np.argsort(src, kind='stable')
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(ids)), out=offsets[1:])
+        adjacency[metric] = (offsets, dst[order], weights[order])
+    return TileOverlay(float(source.size), stamp, ids, coordinates[:, 0], coordinates[:, 1], coordinates[:, 2],
+                       adjacency)
+
+
+class TileRouter:
+    """Поиск маршрутов по сети, загружаемой тайлами: в кэше не больше budget тайлов (LRU),
+    тайлы вдоль коридора между стартом и целью загружаются заранее, остальные - когда поиск
+    доходит до их точек. Для маршрутов между далекими тайлами (не ближе overlay_distance клеток)
+    используется граф граничных точек (TileOverlay), если он построен для текущих данных; переопределений
+    линий в нем нет, поэтому тайлы с переопределенными линиями, как и тайлы старта и цели, проходятся
+    по всем точкам. Для by_score граф граничных точек дает и эвристику (TileOverlay.tile_bounds).
+    Каждый поиск держит не больше budget тайлов (свой LRU поверх кэша): тайлы, вытесненные из кэша
+    другими поисками, у него остаются, а сверх budget давно не нужные ему тайлы отпускаются
+    и при необходимости загружаются заново.
+    Аргументы:
+            source          - источник тайлов (DatabaseTileSource или GraphTileSource)
+            budget          - максимальное число тайлов в памяти
+            overlay         - граф граничных точек (TileOverlay) или None
+            overlay_distance - минимальное расстояние между тайлами старта и цели (в клетках) для overlay
+            sync_interval   - как часто проверять журнал изменений (секунды)"""
+
+    def __init__(self, source, budget=64, overlay=None, overlay_distance=2, sync_interval=0.0):
+        self.source = source
+        self.size = source.size
+        self.budget = max(2, budget)
+        self.overlay_distance = overlay_distance
+        self.sync_interval = sync_interval
+        self._overlay = overlay
+        self.overlay = None
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.state = None
+        self.synced_at = -INF
+        self.override_keys = frozenset()
+        self.loads = 0
+        self.hits = 0
+        self.peak_held = 0
+
+    @property
+    def version(self):
+        """Версия данных для ключей кэша маршрутов"""
+        return f'tiles:{self.state[0]}:{self.state[1]}'
+
+    def sync(self):
+        """Сверка с журналом изменений: при новых записях тайлы сбрасываются, граф граничных
+        точек проверяется заново"""
+        now = time.time()
+        if self.state is not None and now - self.synced_at < self.sync_interval:
+            return
+        state = self.source.state()
+        with self._lock:
+            self.synced_at = now
+            if state == self.state:
+                return
+            changed = self.state is None or state[0] != self.state[0]
+            self.state = state
+            if changed:
+                self._tiles.clear()
+        self.override_keys = frozenset(self.source.override_keys()) if state[1] else frozenset()
+        if changed:
+            overlay = self._overlay
+            usable = overlay is not None and overlay.size == self.size and overlay.stamp == self.source.stamp()
+            self.overlay = overlay if usable else None
+
+    def tile(self, key):
+        """Тайл из кэша или из источника; вытесняются давно не использованные тайлы"""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None and tile.expires_at > time.time():
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+        tile = self.source.load(key)
+        with self._lock:
+            self.loads += 1
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.budget:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def corridor(self, start_key, goal_key):
+        """Клетки вдоль отрезка между клетками старта и цели"""
+        steps = max(abs(goal_key[0] - start_key[0]), abs(goal_key[1] - start_key[1]))
+        keys = []
+        for step in range(steps + 1):
+            t = step / steps if steps else 0.0
+            key = (round(start_key[0] + (goal_key[0] - start_key[0]) * t),
+                   round(start_key[1] + (goal_key[1] - start_key[1]) * t))
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def route(self, start_point, end_point, eval_type='by_distance'):
+        """Поиск пути между точками (результат - как у mainapp.algorithm.find_path).
+        KeyError, если точки нет или у нее нет координат"""
+        from mainapp.profiling import phase, count_search
+
+        if eval_type not in WEIGHT_FIELDS:
+            raise ValueError(f'Unknown eval_type {eval_type!r}')
+        self.sync()
+        field = WEIGHT_FIELDS[eval_type]
+        size = self.size
+        goal = self.source.point(end_point)
+        known = {start_point: self.source.point(start_point), end_point: goal}
+        start_key, goal_key = tile_key(*known[start_point][:2], size), tile_key(*goal[:2], size)
+        held = OrderedDict()  # тайлы этого поиска (не больше budget): вытеснение из кэша их не выгружает
+
+        def load(key):
+            tile = held.get(key)
+            if tile is None:
+                tile = held[key] = self.tile(key)
+                if len(held) > self.budget:
+                    held.popitem(last=False)
+            else:
+                held.move_to_end(key)
+            return tile
+
+        overlay = bounds_overlay = self.overlay
+        if overlay is None or \
+                max(abs(start_key[0] - goal_key[0]), abs(start_key[1] - goal_key[1])) < self.overlay_distance:
+            overlay = None
+            detailed = None
+            with phase('tiles'):
+                for key in self.corridor(start_key, goal_key)[:self.budget // 2]:
+                    load(key)
+        else:
+            detailed = {start_key, goal_key} | self.override_keys
+
+        def neighbors(node):
+            key = tile_key(*known[node][:2], size)
+            if overlay is not None and key not in detailed and node in overlay:
+                return overlay.neighbors(node, eval_type, known)
+            tile = load(key)
+            result = []
+            for edge in tile.edges.get(node, ()):
+                if edge[0] not in known:
+                    known[edge[0]] = tile.points[edge[0]]
+                result.append((edge[0], edge[field]))
+            return result
+
+        if eval_type == 'by_distance':
+            def heuristic(node):
+                return math.hypot(known[node][0] - goal[0], known[node][1] - goal[1]) * 100
+        else:
+            def heuristic(node):
+                return known[node][2] + goal[2] if node != end_point else 0.0
+
+        guided = heuristic
+        if eval_type == 'by_score' and bounds_overlay is not None:
+            bounds = bounds_overlay.tile_bounds(goal_key, eval_type)
+
+            def guided(node):
+                key = tile_key(*known[node][:2], size)
+                return heuristic(node) if key == goal_key else max(heuristic(node), bounds.get(key, INF))
+
+        search_stats = {'nodes_expanded': 0, 'nodes_pushed': 0, 'stale_skipped': 0, 'peak_open': 0}
+        with phase('search'):
+            path = None
+            if guided(start_point) < INF:
+                path, _ = _search(start_point, end_point, neighbors, guided, search_stats)
+            if path is not None and path[-1] == end_point:
+                if overlay is not None:
+                    path = self._unpack(path, known, detailed, field, load, search_stats)
+            elif path is None or overlay is not None or guided is not heuristic:
+                # цель недостижима: ближайшую к ней точку ищем по всем точкам и с той же эвристикой,
+                # что и поиск по графу целиком
+                overlay = None
+                path, _ = _search(start_point, end_point, neighbors, heuristic, search_stats)
+        count_search(search_stats)
+        with self._lock:
+            self.peak_held = max(self.peak_held, len(held))
+
+        # стоимость - как у find_path (RoutingGraph.path_measure): длина пути по координатам
+        # или сумма score его точек, без надбавок переопределений
+        points = np.array([known[node] for node in path], dtype=np.float64).reshape(-1, 3)
+        if eval_type == 'by_distance':
+            cost_key, cost = 'path_in_km', float((np.hypot(np.diff(points[:, 0]), np.diff(points[:, 1])) * 100).sum())
+        else:
+            cost_key, cost = 'path_in_score_points', float(points[:, 2].sum())
+        return {'start_point': start_point, 'end_point': end_point, 'path': path, cost_key: round(cost, 2),
+                'nodes_expanded': search_stats['nodes_expanded']}
+
+    def _unpack(self, path, known, detailed, field, load, search_stats):
+        """Замена сквозных ребер графа граничных точек путями внутри их тайлов"""
+        size = self.size
+        result = path[:1]
+        for a, b in zip(path, path[1:]):
+            key = tile_key(*known[a][:2], size)
+            if key in detailed or key != tile_key(*known[b][:2], size):
+                result.append(b)
+                continue
+            tile = load(key)
+            known.update((node, tile.points[node]) for node in tile.edges)
+
+            def inner(node):
+                return [(edge[0], edge[field]) for edge in tile.edges[node] if edge[0] in tile.edges]
+
+            inner_path, _ = _search(a, b, inner, lambda node: 0.0, search_stats)
+            result.extend(inner_path[1:])
+        return result
+
+    def path_graph(self, path, known=None):
+        """Граф (mainapp.graph.RoutingGraph) из одних точек пути - для стоимости пути и GeoJSON"""
+        from mainapp.graph import RoutingGraph
+
+        ids = sorted(set(path))
+        known = known or {}
+        missing = [point_id for point_id in ids if point_id not in known]
+        if missing:
+            known = {**known, **self.source.points(missing)}
+        points = [known[point_id] for point_id in ids]
+        return RoutingGraph.from_edges(ids, [point[0] for point in points], [point[1] for point in points],
+                                       [point[2] for point in points], [], [])
+
+    def stats(self):
+        """Счетчики кэша тайлов"""
+        with self._lock:
+            return {'tiles': len(self._tiles), 'budget': self.budget, 'loads': self.loads, 'hits': self.hits,
+                    'peak_held': self.peak_held, 'overlay': self.overlay is not None}
+
+
+def overlay_path(directory):
+    return os.path.join(directory, 'tile_overlay.npz')
+
+
+def uses_tiles(engine):
+    """Выбран ли поиск по тайлам (параметр engine или settings.ROUTING_ENGINE)"""
+    from mainapp.algorithm import routing_engine
+
+    return routing_engine(engine) == 'tiles'
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_tile_router(line_model, point_model):
+    """Поиск по тайлам для процесса, настроенный по settings.ROUTING_TILES"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                from django.conf import settings
+
+                options = settings.ROUTING_TILES
+                path = overlay_path(options['OVERLAY_DIR'])
+                overlay = TileOverlay.load(path) if os.path.exists(path) else None
+                _router = TileRouter(DatabaseTileSource(line_model, point_model, options['SIZE']),
+                                     budget=options['BUDGET'], overlay=overlay,
+                                     overlay_distance=options.get('OVERLAY_DISTANCE', 2),
+                                     sync_interval=getattr(settings, 'ROUTING_GRAPH_SYNC_INTERVAL', 1.0))
+    return _router
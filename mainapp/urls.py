@@ -1,10 +1,23 @@
 from django.urls import path
-from .views import PointsView, MinScore, MinLength
+from .views import PointsView, MinScore, MinLength, RouteCacheStats, RouteMatrix, AsyncMinLength, AsyncMinScore, \
+    Metrics, GraphOverrides, CoordinatesMinLength, CoordinatesMinScore, SnapPoints, \
+    Reachable, CombinedRoutes
 
 app_name = "points"
 
 urlpatterns = [
     path('points/', PointsView.as_view()),
     path('points/<int:from>/min_length/<int:to>', MinLength.as_view()),
-    path('points/<int:from>/min_score/<int:to>', MinScore.as_view())
+    path('points/<int:from>/min_score/<int:to>', MinScore.as_view()),
+    path('points/<int:from>/routes/<int:to>', CombinedRoutes.as_view()),
+    path('points/<int:id>/reachable', Reachable.as_view()),
+    path('coords/<str:from>/min_length/<str:to>', CoordinatesMinLength.as_view()),
+    path('coords/<str:from>/min_score/<str:to>', CoordinatesMinScore.as_view()),
+    path('snap', SnapPoints.as_view()),
+    path('async/points/<int:from>/min_length/<int:to>', AsyncMinLength.as_view()),
+    path('async/points/<int:from>/min_score/<int:to>', AsyncMinScore.as_view()),
+    path('routes/cache', RouteCacheStats.as_view()),
+    path('routes/matrix', RouteMatrix.as_view()),
+    path('metrics', Metrics.as_view()),
+    path('graph/overrides', GraphOverrides.as_view()),
 ]
\ No newline at end of file
@@ -1,57 +1,436 @@
-import json
+import asyncio
+import hashlib
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from mainapp.models import Point, Line
-from django.core.serializers import serialize
 
-from mainapp.algorithm import best_path_by
+from mainapp.async_routing import Overloaded, get_route_executor
+from mainapp.changes import points_version, record_override
+from mainapp.formats import negotiate, route_options, route_renderers, route_response
+from mainapp.geojson import route_feature, feature_collection, json_response, stream_points, point_features, \
+    polygon_feature
+from mainapp.graph import get_graph
+from mainapp.matrix import route_matrix
+from mainapp.pareto import compromise_paths
+from mainapp.permissions import IsOperatorOrReadOnly
+from mainapp.profiling import registry
+from mainapp.reachability import convex_hull, reachable
+from mainapp.route_cache import cached_best_path_by, get_route_cache
+from mainapp.snapping import parse_coordinates, snap_points
+from mainapp.tiles import get_tile_router, uses_tiles
 
-answer_blank = {"type": "FeatureCollection",
-                "features": [
-                    {"type": "Feature",
-                     "geometry": {
-                         "type": "LineString",
-                     },
-                     "properties": {
-                     }
-                     },
-                ]
-                }
+
+def route_answer(point_from, point_to, eval_type, engine, name, graph=None):
+    """Тело ответа маршрута: результат best_path_by (через кэш) в виде GeoJSON.
+    graph - граф, уже полученный в этом запросе (None - получить)"""
+    # граф берется один раз на запрос; при поиске по тайлам граф целиком не загружается -
+    # GeoJSON строится по точкам маршрута
+    if graph is None and not uses_tiles(engine):
+        graph = get_graph(Line, Point)
+    result = cached_best_path_by(point_from, point_to, Line, Point, eval_type=eval_type, engine=engine, graph=graph)
+    if graph is None:
+        graph = get_tile_router(Line, Point).path_graph(result['path'])
+    return {"answer": feature_collection(route_feature(graph, result, name))}
+
+
+# Ответы маршрутов: формат по ?format= или Accept (json, polyline, msgpack - см. mainapp.formats),
+# ?precision= - знаков после запятой в координатах, ?simplify= - допуск упрощения линии в км
+FORMAT_ERROR = {"error": "precision must be an integer 0..10, simplify - non-negative number (km)"}
+UNSUPPORTED_FORMAT = {"error": "unsupported format; available: json, polyline, msgpack"}
+UNKNOWN_POINT = {"error": "unknown point id"}
+# достижимые точки, маршруты одним запросом и матрица считаются по графу целиком - поиск по тайлам
+# (?engine=tiles или settings.ROUTING_ENGINE) для них не загружает граф, а отказывает
+TILES_UNSUPPORTED = {"error": "engine=tiles is not supported here: the full graph is required; use engine=astar or ch"}
 
 
 class MinLength(APIView):
+    renderer_classes = route_renderers()
 
     def get(self, request, **kwargs):
         point_from = self.kwargs['from']
         point_to = self.kwargs['to']
-        result_km = best_path_by(point_from, point_to, Line, Point)
-        print(result_km)
-        geojson_coords = answer_blank['features'][0]['geometry']['coordinates'] = []
-        for i in result_km['path']:
-            geojson_coords.append([Point.objects.get(id=i).geom[0], Point.objects.get(id=i).geom[1]])
-        answer_blank['features'][0]['properties']['name'] = 'Shortest path'
-
-        return Response({"answer": answer_blank})
+        try:
+            options = route_options(request.query_params)
+        except ValueError:
+            return json_response(FORMAT_ERROR, status=400)
+        try:
+            answer = route_answer(point_from, point_to, 'by_distance', request.query_params.get('engine'),
+                                  'Shortest path')
+        except KeyError:
+            return json_response(UNKNOWN_POINT, status=404)
+        return route_response(request.accepted_renderer, answer, options)
 
 
 class MinScore(APIView):
+    renderer_classes = route_renderers()
+
+    def get(self, request, **kwargs):
+        point_from = self.kwargs['from']
+        point_to = self.kwargs['to']
+        try:
+            options = route_options(request.query_params)
+        except ValueError:
+            return json_response(FORMAT_ERROR, status=400)
+        try:
+            answer = route_answer(point_from, point_to, 'by_score', request.query_params.get('engine'),
+                                  'Cheapest path')
+        except KeyError:
+            return json_response(UNKNOWN_POINT, status=404)
+        return route_response(request.accepted_renderer, answer, options)
+
+
+class Reachable(APIView):
+    """Точки, достижимые из точки в пределах бюджета: /api/points/<id>/reachable?max_km=5 или ?max_score=300.
+    Ответ - GeoJSON-точки со стоимостью пути (path_in_km / path_in_score_points);
+    ?hull=convex добавляет многоугольник выпуклой оболочки достижимых точек"""
+    budgets = {'max_km': ('by_distance', 'path_in_km'), 'max_score': ('by_score', 'path_in_score_points')}
+
+    def get(self, request, **kwargs):
+        params = request.query_params
+        given = [name for name in self.budgets if name in params]
+        try:
+            if len(given) != 1 or params.get('hull', 'convex') != 'convex':
+                raise ValueError(given)
+            budget = float(params[given[0]])
+            if not budget >= 0:
+                raise ValueError(budget)
+        except ValueError:
+            return json_response({"error": "exactly one of max_km or max_score (non-negative number) is required; "
+                                           "hull - convex"}, status=400)
+        if uses_tiles(params.get('engine')):
+            return json_response(TILES_UNSUPPORTED, status=400)
+        eval_type, cost_name = self.budgets[given[0]]
+        graph = get_graph(Line, Point)
+        try:
+            source = graph.index_of(self.kwargs['id'])
+        except KeyError:
+            return json_response(UNKNOWN_POINT, status=404)
+        nodes, costs = reachable(graph, source, eval_type, budget)
+        features = point_features(graph, nodes, costs, cost_name)
+        if 'hull' in params:
+            located = nodes[~np.isnan(graph.lon[nodes])]
+            features.append(polygon_feature(convex_hull(graph.lon[located], graph.lat[located]),
+                                            {"name": "Reachable area", given[0]: budget}))
+        return json_response({"start_point": self.kwargs['id'], given[0]: budget, "count": len(nodes),
+                              "answer": feature_collection(*features)})
+
+
+class CoordinatesRouteView(APIView):
+    """Маршрут между произвольными координатами: /api/coords/<lon,lat>/min_length/<lon,lat>.
+    Координаты привязываются к ближайшим точкам графа (snapped в ответе - точки и расстояния привязки);
+    ?max_snap=<км> - не привязывать дальше этого расстояния (ответ 404). При поиске по тайлам
+    (?engine=tiles) координаты привязываются запросом к БД, граф целиком не загружается"""
+    eval_type = None
+    name = None
+    renderer_classes = route_renderers()
 
     def get(self, request, **kwargs):
+        try:
+            coordinates = [parse_coordinates(self.kwargs['from']), parse_coordinates(self.kwargs['to'])]
+            max_snap = request.query_params.get('max_snap')
+            max_snap = float(max_snap) if max_snap is not None else None
+        except ValueError:
+            return json_response({"error": "coordinates must be lon,lat; max_snap - number"}, status=400)
+        try:
+            options = route_options(request.query_params)
+        except ValueError:
+            return json_response(FORMAT_ERROR, status=400)
+        engine = request.query_params.get('engine')
+        graph = None if uses_tiles(engine) else get_graph(Line, Point)
+        snapped = snap_points(graph, coordinates, Point, max_distance=max_snap)
+        if None in snapped:
+            return json_response({"error": "no point near the given coordinates", "snapped": snapped}, status=404)
+        try:
+            answer = route_answer(snapped[0]['point'], snapped[1]['point'], self.eval_type, engine, self.name, graph)
+        except KeyError:  # привязанную по БД точку успели удалить
+            return json_response(UNKNOWN_POINT, status=404)
+        answer['snapped'] = snapped
+        return route_response(request.accepted_renderer, answer, options)
+
+
+class CoordinatesMinLength(CoordinatesRouteView):
+    eval_type = 'by_distance'
+    name = 'Shortest path'
+
+
+class CoordinatesMinScore(CoordinatesRouteView):
+    eval_type = 'by_score'
+    name = 'Cheapest path'
+
+
+class SnapPoints(APIView):
+    """Пакетная привязка координат к точкам графа: POST {"coordinates": [[lon, lat], ...], "max_snap": км}.
+    Ответ: {"snapped": [{"point", "lon", "lat", "snap_km"} или null, ...]} в порядке запроса.
+    При поиске по тайлам (?engine=tiles) привязка идет запросами к БД, без загрузки графа"""
+
+    def post(self, request):
+        coordinates = request.data.get('coordinates')
+        max_snap = request.data.get('max_snap')
+        try:
+            if not isinstance(coordinates, list) or len(coordinates) > settings.SNAP_MAX_COORDINATES:
+                raise ValueError(coordinates)
+            coordinates = [parse_coordinates(f'{lon},{lat}') for lon, lat in coordinates]
+            max_snap = float(max_snap) if max_snap is not None else None
+        except (ValueError, TypeError):
+            return json_response({"error": "coordinates must be a list of [lon, lat] pairs "
+                                           f"(at most {settings.SNAP_MAX_COORDINATES}), max_snap - number"},
+                                 status=400)
+        graph = None if uses_tiles(request.query_params.get('engine')) else get_graph(Line, Point)
+        return json_response({"snapped": snap_points(graph, coordinates, Point, max_distance=max_snap)})
+
+
+class AsyncRouteView(View):
+    """Асинхронный вариант MinLength / MinScore: поиск выполняется в ограниченном пуле потоков,
+    одинаковые одновременные запросы объединяются, при переполнении очереди - 503"""
+    eval_type = None
+    name = None
+
+    async def get(self, request, **kwargs):
         point_from = self.kwargs['from']
         point_to = self.kwargs['to']
-        result_score = best_path_by(point_from, point_to, Line, Point, eval_type='by_score')
-        print(result_score)
-        geojson_coords = answer_blank['features'][0]['geometry']['score_points'] = []
-        for i in result_score['path']:
-            geojson_coords.append([Point.objects.get(id=i).score])
-        answer_blank['features'][0]['properties']['name'] = 'Cheapest path'
-        return Response({"answer": answer_blank})
+        engine = request.GET.get('engine')
+        key = (self.eval_type, point_from, point_to, engine)
+        renderer = negotiate(request)
+        if renderer is None:
+            return json_response(UNSUPPORTED_FORMAT, status=406)
+        try:
+            options = route_options(request.GET)
+        except ValueError:
+            return json_response(FORMAT_ERROR, status=400)
+        try:
+            answer = await get_route_executor().run(key, route_answer, point_from, point_to,
+                                                    self.eval_type, engine, self.name)
+        except Overloaded:
+            response = json_response({"error": "routing queue is full"}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except KeyError:
+            return json_response(UNKNOWN_POINT, status=404)
+        return route_response(renderer, answer, options)
+
+
+class AsyncMinLength(AsyncRouteView):
+    eval_type = 'by_distance'
+    name = 'Shortest path'
+
+
+class AsyncMinScore(AsyncRouteView):
+    eval_type = 'by_score'
+    name = 'Cheapest path'
+
+
+def metric_route(graph, point_from, point_to, eval_type, engine):
+    """Маршрут (через кэш) по уже полученному графу с длиной в км и стоимостью в баллах"""
+    result = cached_best_path_by(point_from, point_to, Line, Point, eval_type=eval_type, engine=engine, graph=graph)
+    nodes = graph.indices_of(result['path'])
+    return dict(result, path_in_km=round(graph.path_km(nodes), 2),
+                path_in_score_points=round(graph.path_score(nodes), 2))
+
+
+class CombinedRoutes(View):
+    """Кратчайший и самый дешевый маршруты одним запросом: /api/points/<from>/routes/<to>.
+    Граф берется один раз на запрос: по нему в пуле маршрутизации параллельно идут оба поиска
+    и строятся компромиссные маршруты. У каждого маршрута есть и длина (path_in_km), и стоимость
+    (path_in_score_points). ?pareto=N (до 5) добавляет компромиссные маршруты по смешанным весам (mainapp.pareto)"""
+
+    async def get(self, request, **kwargs):
+        point_from = self.kwargs['from']
+        point_to = self.kwargs['to']
+        engine = request.GET.get('engine')
+        try:
+            pareto = int(request.GET.get('pareto', 0))
+            if not 0 <= pareto <= 5:
+                raise ValueError(pareto)
+        except ValueError:
+            return json_response({"error": "pareto must be 0..5"}, status=400)
+        if uses_tiles(engine):
+            return json_response(TILES_UNSUPPORTED, status=400)
+        renderer = negotiate(request)
+        if renderer is None:
+            return json_response(UNSUPPORTED_FORMAT, status=406)
+        try:
+            options = route_options(request.GET)
+        except ValueError:
+            return json_response(FORMAT_ERROR, status=400)
+        executor = get_route_executor()
+        try:
+            graph = await executor.run(('get_graph',), get_graph, Line, Point)
+            shortest, cheapest = await asyncio.gather(*(
+                executor.run(('metric_route', graph.checksum, point_from, point_to, eval_type, engine), metric_route,
+                             graph, point_from, point_to, eval_type, engine)
+                for eval_type in ('by_distance', 'by_score')))
+            features = [route_feature(graph, shortest, 'Shortest path'),
+                        route_feature(graph, cheapest, 'Cheapest path')]
+            if pareto:
+                routes = await executor.run(
+                    ('compromise_paths', graph.checksum, point_from, point_to, pareto), compromise_paths,
+                    graph, graph.index_of(point_from), graph.index_of(point_to), pareto,
+                    [graph.indices_of(shortest['path']).tolist(), graph.indices_of(cheapest['path']).tolist()])
+                for route in routes:
+                    route = dict(route, start_point=point_from, end_point=point_to,
+                                 path=graph.ids[route['path']].tolist())
+                    feature = route_feature(graph, route, 'Compromise path')
+                    feature['properties']['weight'] = route['weight']
+                    features.append(feature)
+        except Overloaded:
+            response = json_response({"error": "routing queue is full"}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except KeyError:
+            return json_response(UNKNOWN_POINT, status=404)
+        return route_response(renderer, {"answer": feature_collection(*features)}, options)
+
+
+class RouteMatrix(APIView):
+    metrics = {'min_length': 'by_distance', 'min_score': 'by_score'}
+
+    def post(self, request):
+        sources = request.data.get('sources')
+        targets = request.data.get('targets')
+        metric = request.data.get('metric', 'min_length')
+        if not isinstance(sources, list) or not isinstance(targets, list) or metric not in self.metrics:
+            return json_response({"error": "sources and targets must be lists of point ids, "
+                                           "metric - min_length or min_score"}, status=400)
+        if len(sources) * len(targets) > settings.ROUTING_MATRIX_MAX_CELLS:
+            return json_response({"error": f"matrix is too large: at most "
+                                           f"{settings.ROUTING_MATRIX_MAX_CELLS} sources x targets"},
+                                 status=400)
+        if uses_tiles(request.data.get('engine')):
+            return json_response(TILES_UNSUPPORTED, status=400)
+        try:
+            result = route_matrix(get_graph(Line, Point), sources, targets, self.metrics[metric],
+                                  with_paths=bool(request.data.get('paths', False)),
+                                  workers=settings.ROUTING_MATRIX_WORKERS)
+        except (KeyError, ValueError, TypeError):
+            return json_response({"error": "unknown point id"}, status=400)
+        return json_response(dict(result, sources=sources, targets=targets, metric=metric))
+
+
+class GraphOverrides(APIView):
+    """Временные переопределения линий: GET - действующие, POST - задать
+    {"from": 1, "to": 2, "closed": true} или {"from": 1, "to": 2, "km": 5.0, "score": 40} на "ttl" секунд,
+    DELETE ?from=1&to=2 - снять. Изменения видны маршрутам всех воркеров через ROUTING_GRAPH_SYNC_INTERVAL.
+    Задавать и снимать переопределения могут только операторы (is_staff). km и score ниже обычной
+    стоимости линии не применяются (см. Override.weights), поэтому такие значения - ответ 400"""
+    permission_classes = [IsOperatorOrReadOnly]
+
+    def get(self, request):
+        graph = get_graph(Line, Point)
+        return json_response({"overrides": [
+            {"from": from_id, "to": to_id, "km": override.km, "score": override.score, "closed": override.closed,
+             "expires_at": override.expires_at}
+            for (from_id, to_id), override in sorted(graph.overrides.items())]})
+
+    def post(self, request):
+        data = request.data
+        try:
+            from_id, to_id = int(data['from']), int(data['to'])
+            ttl = float(data.get('ttl', settings.ROUTING_OVERRIDE_TTL))
+            km = float(data['km']) if data.get('km') is not None else None
+            score = float(data['score']) if data.get('score') is not None else None
+        except (KeyError, ValueError, TypeError):
+            return json_response({"error": "from and to must be point ids; ttl, km and score - numbers"},
+                                 status=400)
+        closed = bool(data.get('closed', False))
+        if ttl <= 0 or (km is not None and km < 0) or (score is not None and score < 0) or \
+                not (closed or km is not None or score is not None):
+            return json_response({"error": "ttl must be positive; set closed, km or score (non-negative)"},
+                                 status=400)
+        if not closed and (km is not None or score is not None):
+            try:
+                base_km, base_score = get_graph(Line, Point).line_cost(from_id, to_id)
+            except KeyError:
+                return json_response(UNKNOWN_POINT, status=404)
+            if (km is not None and km < base_km) or (score is not None and score < base_score):
+                return json_response({"error": "km and score can only raise the line cost",
+                                      "km": base_km, "score": base_score}, status=400)
+        change = record_override(from_id, to_id, ttl, km=km, score=score, closed=closed)
+        return json_response({"from": change.from_point_id, "to": change.to_point_id, "km": km, "score": score,
+                              "closed": closed, "expires_at": change.expires_at.timestamp()}, status=201)
+
+    def delete(self, request):
+        try:
+            from_id, to_id = int(request.query_params['from']), int(request.query_params['to'])
+        except (KeyError, ValueError):
+            return json_response({"error": "from and to must be point ids"}, status=400)
+        record_override(from_id, to_id, 0)
+        return HttpResponse(status=204)
 
 
 class PointsView(APIView):
+    """Точки в GeoJSON, передаются потоком. Параметры:
+            bbox            - min_lon,min_lat,max_lon,max_lat (фильтр по пространственному индексу geom)
+            limit, cursor   - размер страницы и id последней точки предыдущей страницы (next_cursor ответа)
+            fields          - свойства точек через запятую: score, address, pk (по умолчанию score,pk)
+    ETag зависит от версии данных точек и параметров; при совпадении с If-None-Match - ответ 304"""
+    point_fields = ('score', 'address', 'pk')
+    default_fields = ('score', 'pk')
+
+    def parse(self, params):
+        bbox = params.get('bbox')
+        if bbox is not None:
+            bbox = tuple(float(value) for value in bbox.split(','))
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError(bbox)
+        limit = params.get('limit')
+        if limit is not None:
+            limit = int(limit)
+            if not 0 < limit <= settings.POINTS_MAX_LIMIT:
+                raise ValueError(limit)
+        cursor = int(params.get('cursor', 0))
+        fields = tuple(params['fields'].split(',')) if params.get('fields') else self.default_fields
+        if not set(fields) <= set(self.point_fields):
+            raise ValueError(fields)
+        return bbox, limit, cursor, fields
+
+    def get(self, request):
+        from django.contrib.gis.geos import Polygon
+        from django.db.models import FloatField, Func
+        from django.utils.http import parse_etags, quote_etag
+
+        try:
+            bbox, limit, cursor, fields = self.parse(request.query_params)
+        except ValueError:
+            return json_response({"error": "bbox - min_lon,min_lat,max_lon,max_lat; "
+                                           f"limit - 1..{settings.POINTS_MAX_LIMIT}; cursor - point id; "
+                                           f"fields - some of {','.join(self.point_fields)}"}, status=400)
+        etag = quote_etag(f'points-{points_version()}-' + hashlib.blake2b(
+            repr((bbox, limit, cursor, fields)).encode(), digest_size=8).hexdigest())
+        if {etag, '*'} & set(parse_etags(request.headers.get('If-None-Match', ''))):
+            response = HttpResponse(status=304)
+            response['ETag'] = etag
+            return response
+
+        points = Point.objects.filter(id__gt=cursor).order_by('id')
+        if bbox is not None:
+            points = points.filter(geom__contained=Polygon.from_bbox(bbox))
+        # координаты читаются функциями PostGIS, без создания GEOS-объекта на каждую точку
+        points = points.annotate(lon=Func('geom', function='ST_X', output_field=FloatField()),
+                                 lat=Func('geom', function='ST_Y', output_field=FloatField()))
+        columns = [name for name in fields if name != 'pk']
+        rows = points.values_list('id', 'lon', 'lat', *columns)
+        if limit is not None:
+            rows = rows[:limit]
+        response = StreamingHttpResponse(stream_points(rows.iterator(chunk_size=2000), fields, limit),
+                                         content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class RouteCacheStats(APIView):
+
+    def get(self, request):
+        return Response({"route_cache": get_route_cache().stats()})
+
+
+class Metrics(View):
+    """Агрегированные метрики профилирования в текстовом формате Prometheus"""
 
     def get(self, request):
-        geojson_answer = json.loads(serialize('geojson', Point.objects.all(),
-                                              geometry_field='geom',
-                                              fields=('score', 'pk')))
-        return Response({"points": geojson_answer})
+        gauges = {f'route_cache_{name}': value for name, value in get_route_cache().stats().items()
+                  if isinstance(value, (int, float))}
+        return HttpResponse(registry.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')